@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark the most dissimilar pair search: exact vs approximate.
+
+Generates clustered synthetic embeddings, then times the exact blockwise
+search and the approximate anchor search at several anchor counts. For sizes
+the exact search covers, reports how far the approximate pair's similarity is
+from the true minimum and the share of all pairs that are more dissimilar.
+
+With ``--density``, embeddings are sparse CSR rows with that share of
+non-zeros, like TF-IDF rows of short texts.
+
+Usage:
+    python benchmarks/bench_dissimilar.py --entities 2000 10000 50000
+    python benchmarks/bench_dissimilar.py --entities 100000 --exact-max 0 --anchors 4 16 64
+    python benchmarks/bench_dissimilar.py --entities 20000 --density 0.05
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compere.modules.similarity import (
+    EXACT_BLOCK_ELEMENTS,
+    approximate_most_dissimilar_pair,
+    most_dissimilar_pair,
+)
+
+
+def clustered_embeddings(n, dimensions, clusters, seed=0):
+    """Unit vectors scattered around random cluster centers."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions))
+    points = centers[rng.integers(clusters, size=n)] + 0.5 * rng.normal(size=(n, dimensions))
+    return normalize(points).astype(np.float32)
+
+
+def sparse_embeddings(n, dimensions, density, seed=0):
+    """Unit CSR rows with about ``density`` of their weights non-zero."""
+    matrix = sparse.random(n, dimensions, density=density, format="csr", random_state=seed, dtype=np.float32)
+    return normalize(matrix)
+
+
+def share_more_dissimilar(embeddings, similarity):
+    """Share of distinct pairs with a lower similarity than ``similarity``."""
+    n = embeddings.shape[0]
+    block = max(1, EXACT_BLOCK_ELEMENTS // n)
+    lower = 0
+    for start in range(0, n, block):
+        similarities = embeddings[start : start + block] @ embeddings.T
+        if sparse.issparse(similarities):
+            similarities = similarities.toarray()
+        lower += int((similarities < similarity).sum())
+    return lower / (n * (n - 1))
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int, nargs="+", default=[2000, 10000, 50000])
+    parser.add_argument("--dimensions", type=int, default=100)
+    parser.add_argument("--clusters", type=int, default=50)
+    parser.add_argument("--anchors", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--density", type=float, help="Share of non-zero weights in sparse embeddings")
+    parser.add_argument("--exact-max", type=int, default=20000, help="Largest size to run the exact search on")
+    args = parser.parse_args()
+
+    for n in args.entities:
+        if args.density:
+            embeddings = sparse_embeddings(n, args.dimensions, args.density)
+            print(f"{n} entities, {args.dimensions} dimensions, {embeddings.nnz} non-zeros")
+        else:
+            embeddings = clustered_embeddings(n, args.dimensions, args.clusters)
+            print(f"{n} entities, {args.dimensions} dimensions")
+
+        exact = None
+        if n <= args.exact_max:
+            seconds, (_, _, exact) = timed(most_dissimilar_pair, embeddings)
+            print(f"  exact          {seconds * 1000:10.1f} ms  similarity {exact:.4f}")
+
+        for anchors in args.anchors:
+            seconds, (_, _, similarity) = timed(approximate_most_dissimilar_pair, embeddings, anchors)
+            line = f"  {anchors:3d} anchors    {seconds * 1000:10.1f} ms  similarity {similarity:.4f}"
+            if exact is not None:
+                line += (
+                    f"  (+{similarity - exact:.4f}, {share_more_dissimilar(embeddings, similarity):.2e} of pairs lower)"
+                )
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,102 @@ import click
 import uvicorn
 
 
-@click.command()
+@click.group(invoke_without_command=True)
 @click.option("--host", default="127.0.0.1", help="Host to bind the server to")
 @click.option("--port", default=8090, help="Port to bind the server to")
 @click.option("--reload", is_flag=True, help="Enable auto-reload on code changes")
-def main(host, port, reload):
+@click.pass_context
+def main(ctx, host, port, reload):
     """Compere CLI to run the web service."""
-    uvicorn.run("compere.main:app", host=host, port=port, reload=reload)
+    if ctx.invoked_subcommand is None:
+        uvicorn.run("compere.main:app", host=host, port=port, reload=reload)
+
+
+def check_rating_store(force: bool) -> None:
+    """Refuse to rewrite ratings under servers that keep unflushed changes in their rating store."""
+    from .modules.config import get_rating_store_config
+
+    if get_rating_store_config()[0] and not force:
+        raise click.ClickException(
+            "RATING_STORE_ENABLED is set: running servers would add their unflushed rating changes on top of "
+            "the replayed ratings. Stop them, then pass --force."
+        )
+
+
+@main.command()
+@click.option("--k-factor", type=float, default=None, help="Elo K-factor to replay with (default: ELO_K_FACTOR)")
+@click.option(
+    "--initial-rating", type=float, default=None, help="Starting rating for all entities (default: ELO_INITIAL_RATING)"
+)
+@click.option("--chunk-size", default=50_000, help="Number of comparisons to read per chunk")
+@click.option("--force", is_flag=True, help="Replay although the rating store is enabled, with servers stopped")
+def replay(k_factor, initial_rating, chunk_size, force):
+    """Rebuild all entity ratings by replaying the comparison history with Elo."""
+    from .modules.config import get_rating_engine
+    from .modules.database import SessionLocal, init_db
+    from .modules.replay import replay_elo_ratings
+
+    if get_rating_engine() != "elo":
+        raise click.ClickException(
+            f"RATING_ENGINE is {get_rating_engine()}: replay rebuilds Elo ratings and would overwrite them. "
+            "Glicko-2 ratings are updated by closing rating periods."
+        )
+    check_rating_store(force)
+
+    init_db()
+    db = SessionLocal()
+    try:
+        summary = replay_elo_ratings(db, k_factor=k_factor, initial_rating=initial_rating, chunk_size=chunk_size)
+    finally:
+        db.close()
+
+    click.echo(
+        f"Replayed {summary['comparisons']} comparisons over {summary['entities']} entities "
+        f"({summary['skipped']} skipped)"
+    )
+
+
+@main.command(name="import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option(
+    "--format",
+    "file_format",
+    type=click.Choice(["ndjson", "csv"]),
+    default=None,
+    help="File format (default: from the file extension, ndjson otherwise)",
+)
+@click.option("--chunk-size", default=10_000, help="Number of comparisons to insert per transaction")
+@click.option("--no-recompute", is_flag=True, help="Skip the rating recompute after importing")
+@click.option("--force", is_flag=True, help="Recompute although the rating store is enabled, with servers stopped")
+def import_(path, file_format, chunk_size, no_recompute, force):
+    """Import historical comparisons from an NDJSON or CSV file ('-' for stdin)."""
+    from .modules.database import SessionLocal, init_db
+    from .modules.importer import import_comparison_file
+
+    if not no_recompute:
+        check_rating_store(force)
+
+    if file_format is None:
+        file_format = "csv" if path.lower().endswith(".csv") else "ndjson"
+
+    def progress(imported, skipped):
+        click.echo(f"Imported {imported} comparisons ({skipped} skipped)", err=True)
+
+    init_db()
+    db = SessionLocal()
+    try:
+        with click.open_file(path, "rb") as file:
+            summary = import_comparison_file(
+                db, file, file_format, chunk_size=chunk_size, recompute=not no_recompute, progress=progress
+            )
+    finally:
+        db.close()
+
+    for error in summary["errors"]:
+        click.echo(error, err=True)
+    click.echo(f"Imported {summary['imported']} comparisons ({summary['skipped']} skipped)")
+    if summary["ratings_recomputed"]:
+        click.echo("Ratings recomputed from the full comparison history")
 
 
 if __name__ == "__main__":
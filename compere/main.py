@@ -6,23 +6,31 @@ from dotenv import load_dotenv
 from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .modules.auth import router as AuthRouter
+from .modules.autocomplete import load_autocomplete_index, start_autocomplete_refresh, stop_autocomplete_refresh
 from .modules.comparison import router as ComparisonRouter
-from .modules.config import get_config, get_cors_origins
-from .modules.database import Base, engine, get_db
+from .modules.config import get_config, get_cors_origins, get_rating_store_config, get_vote_queue_config
+from .modules.database import SessionLocal, get_async_db, init_db
+from .modules.embeddings import load_embedding_cache
 from .modules.entity import router as EntityRouter
+from .modules.export import router as ExportRouter
 from .modules.mab import router as MABRouter
 from .modules.middleware import create_logging_middleware, create_rate_limit_middleware
 from .modules.models import (  # noqa: F401 - Import models to register them with SQLAlchemy
     Comparison,
     Entity,
     MABState,
+    PendingVote,
+    RatingPeriod,
     User,
 )
 from .modules.rating import router as RatingRouter
+from .modules.rating_store import start_rating_store, stop_rating_store
 from .modules.similarity import router as SimilarityRouter
+from .modules.vote_queue import router as VoteQueueRouter
+from .modules.vote_queue import start_vote_worker, stop_vote_worker
 
 load_dotenv()
 
@@ -68,15 +76,18 @@ if logging_middleware.enabled:
     logger.info("Request logging enabled")
 
 # Create database tables
-Base.metadata.create_all(bind=engine)
+init_db()
 
 # Include routers
 app.include_router(AuthRouter, prefix="/auth", tags=["authentication"])
 app.include_router(EntityRouter)
+# Before ComparisonRouter, so /comparisons/queue is not taken for a comparison ID
+app.include_router(VoteQueueRouter)
 app.include_router(ComparisonRouter)
 app.include_router(RatingRouter)
 app.include_router(SimilarityRouter)
 app.include_router(MABRouter)
+app.include_router(ExportRouter)
 
 
 # Health check endpoints
@@ -91,11 +102,11 @@ async def health_check() -> dict:
 
 
 @app.get("/health/ready", tags=["health"])
-async def readiness_check(db: Session = Depends(get_db)) -> dict:
+async def readiness_check(db: AsyncSession = Depends(get_async_db)) -> dict:
     """Readiness check - verifies database connectivity."""
     try:
         # Simple query to verify DB connection
-        db.execute(text("SELECT 1"))
+        await db.execute(text("SELECT 1"))
         return {
             "status": "ready",
             "database": "connected",
@@ -119,14 +130,26 @@ async def startup_event():
 
     # Create database tables
     try:
-        Base.metadata.create_all(bind=engine)
+        init_db()
         logger.info("Database tables created successfully")
     except Exception as e:
         logger.error(f"Failed to create database tables: {e}")
         raise
 
+    if get_rating_store_config()[0]:
+        start_rating_store()
+    with SessionLocal() as db:
+        load_autocomplete_index(db)
+    start_autocomplete_refresh()
+    load_embedding_cache()
+    if get_vote_queue_config()[0]:
+        start_vote_worker()
+
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Application shutdown event"""
     logger.info("Shutting down Compere application")
+    stop_vote_worker()
+    stop_autocomplete_refresh()
+    stop_rating_store()
@@ -6,13 +6,16 @@ import logging
 from datetime import UTC, datetime, timedelta
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from .config import get_access_token_expire_minutes, get_secret_key, is_auth_enabled
-from .database import get_db
+from .database import get_async_db, get_db
 from .models import Token, TokenData, User, UserCreate, UserInDB, UserOut
 
 logger = logging.getLogger(__name__)
@@ -76,6 +79,24 @@ def authenticate_user(db: Session, username: str, password: str) -> UserInDB | N
     return user
 
 
+async def get_user_async(db: AsyncSession, username: str) -> UserInDB | None:
+    """Get user from database by username without blocking the event loop."""
+    user = (await db.execute(select(User).where(User.username == username))).scalars().first()
+    if user:
+        return UserInDB.model_validate(user)
+    return None
+
+
+async def authenticate_user_async(db: AsyncSession, username: str, password: str) -> UserInDB | None:
+    """Authenticate a user; the password hash is checked in a worker thread."""
+    user = await get_user_async(db, username)
+    if not user:
+        return None
+    if not await run_in_threadpool(verify_password, password, user.hashed_password):
+        return None
+    return user
+
+
 def create_user(db: Session, user_create: UserCreate, is_superuser: bool = False) -> User:
     """Create a new user in the database."""
     hashed_password = get_password_hash(user_create.password)
@@ -173,10 +194,10 @@ def required_auth() -> UserInDB | None:
 async def login_for_access_token(
     username: str,
     password: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ) -> dict:
     """Login endpoint to get access token."""
-    user = authenticate_user(db, username, password)
+    user = await authenticate_user_async(db, username, password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
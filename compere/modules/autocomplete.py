@@ -0,0 +1,318 @@
+"""
+In-memory typeahead over entity names.
+
+Each process keeps a sorted list of name keys, one for every word a name
+starts with, so ``bot`` and ``blue bot`` both find "Blue Bottle Coffee". A
+lookup bisects to the range of keys starting with the prefix and returns the
+highest-rated entities in it, without touching the database.
+
+The index is built at startup and the entity endpoints update it as they
+create, rename and delete entities. Their keys go to a small sorted list of
+recent keys next to the main one, and the keys of renamed and deleted
+entities are skipped until a refresh merges both lists. Ratings change with
+every vote, so the index keeps a copy of them that a background thread
+reloads every ``AUTOCOMPLETE_REFRESH_INTERVAL`` seconds, from the rating store
+when it is enabled and the database otherwise. A reload that finds entities
+added or deleted elsewhere, e.g. by an import or another process, rebuilds the
+index. Lookups never wait for a reload.
+"""
+
+import bisect
+import logging
+import re
+import threading
+import unicodedata
+from collections.abc import Callable
+from itertools import compress
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .config import get_autocomplete_refresh_interval
+from .database import SessionLocal
+from .models import Entity
+from .rating_store import get_rating_store
+
+logger = logging.getLogger(__name__)
+
+# Words of a name that get their own key; later words only match from an earlier one
+MAX_KEYS_PER_NAME = 8
+
+_WORD = re.compile(r"\w+")
+
+# Sorts after every character a key can continue with
+_KEY_END = "\U0010ffff"
+
+
+def normalize(text: str) -> str:
+    """Lower-case, accent-free words of ``text`` separated by single spaces."""
+    if not text.isascii():
+        decomposed = unicodedata.normalize("NFKD", text)
+        text = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(_WORD.findall(text.casefold()))
+
+
+def name_keys(name: str) -> list[str]:
+    """Keys of a name: the normalized name from each of its first words on."""
+    words = normalize(name).split(" ")
+    return [" ".join(words[start:]) for start in range(min(len(words), MAX_KEYS_PER_NAME)) if words[start]]
+
+
+def top_rated(ids: np.ndarray, ratings: np.ndarray, limit: int) -> np.ndarray:
+    """The ``limit`` highest-rated distinct IDs, by rating then ID, both descending.
+
+    An entity appears once per matching key, so candidates are widened until
+    enough distinct ones are found.
+    """
+    take = limit
+    while True:
+        if take < len(ids):
+            # Keep the top ``take`` ratings and their ties
+            threshold = np.partition(ratings, len(ratings) - take)[len(ratings) - take]
+            top = ratings >= threshold
+            candidates, candidate_ratings = ids[top], ratings[top]
+        else:
+            candidates, candidate_ratings = ids, ratings
+        candidates, first = np.unique(candidates, return_index=True)
+        candidate_ratings = candidate_ratings[first]
+        if len(candidates) >= limit or take >= len(ids):
+            break
+        take *= 2
+    return candidates[np.lexsort((-candidates, -candidate_ratings))[:limit]]
+
+
+class AutocompleteIndex:
+    """Sorted name keys of all entities, with a copy of their ratings.
+
+    ``_keys`` and ``_key_ids`` are parallel and sorted by key, and are
+    replaced rather than modified. Keys added since they were built are in the
+    parallel ``_new_keys`` and ``_new_key_ids``, and ``_stale_ids`` holds the
+    entities whose keys in ``_keys`` no longer apply. Ratings are indexed by
+    entity ID.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys: list[str] = []
+        self._key_ids = np.zeros(0, dtype=np.int64)
+        self._new_keys: list[str] = []
+        self._new_key_ids: list[int] = []
+        self._stale_ids: set[int] = set()
+        # Counts key changes, so a merge computed outside the lock can tell it is outdated
+        self._changes = 0
+        self._names: dict[int, str] = {}
+        self._ratings = np.zeros(0)
+        self._present = np.zeros(0, dtype=bool)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _grow(self, entity_id: int) -> None:
+        if entity_id >= len(self._ratings):
+            capacity = max(1024, 2 * (entity_id + 1))
+            self._ratings = np.concatenate([self._ratings, np.zeros(capacity - len(self._ratings))])
+            self._present = np.concatenate([self._present, np.zeros(capacity - len(self._present), dtype=bool)])
+
+    def build(self, rows) -> None:
+        """Replace the index with ``(id, name, rating)`` rows."""
+        names: dict[int, str] = {}
+        ratings: dict[int, float] = {}
+        keys: list[str] = []
+        key_ids: list[int] = []
+        for entity_id, name, rating in rows:
+            names[entity_id] = name
+            ratings[entity_id] = rating
+            for key in name_keys(name):
+                keys.append(key)
+                key_ids.append(entity_id)
+        # Sorting positions by key is much faster than sorting (key, id) tuples
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+
+        ids = np.fromiter(ratings.keys(), dtype=np.int64, count=len(ratings))
+        size = max(1024, 2 * (int(ids.max()) + 1)) if len(ids) else 1024
+        rating_array = np.zeros(size)
+        rating_array[ids] = np.fromiter(ratings.values(), dtype=np.float64, count=len(ratings))
+        present = np.zeros(size, dtype=bool)
+        present[ids] = True
+
+        with self._lock:
+            self._keys = [keys[position] for position in order]
+            self._key_ids = np.array(key_ids, dtype=np.int64)[np.array(order, dtype=np.int64)]
+            self._new_keys, self._new_key_ids, self._stale_ids = [], [], set()
+            self._changes += 1
+            self._names = names
+            self._ratings = rating_array
+            self._present = present
+
+    def load(self, db: Session) -> None:
+        """Build the index from the database."""
+        self.build(db.execute(select(Entity.id, Entity.name, Entity.rating)))
+        self._apply_store_ratings()
+        logger.info(f"Built the autocomplete index over {len(self)} entities")
+
+    def _insert(self, entity_id: int, name: str) -> None:
+        for key in name_keys(name):
+            position = bisect.bisect_left(self._new_keys, key)
+            self._new_keys.insert(position, key)
+            self._new_key_ids.insert(position, entity_id)
+        self._changes += 1
+
+    def _delete(self, entity_id: int) -> None:
+        # The entity's keys are either recent ones or in the main list
+        for key in name_keys(self._names.pop(entity_id)):
+            position = bisect.bisect_left(self._new_keys, key)
+            while position < len(self._new_keys) and self._new_keys[position] == key:
+                if self._new_key_ids[position] == entity_id:
+                    del self._new_keys[position], self._new_key_ids[position]
+                    break
+                position += 1
+        self._stale_ids.add(entity_id)
+        self._changes += 1
+
+    def add(self, entity_id: int, name: str, rating: float) -> None:
+        """Add a new entity, or update the name and rating of an indexed one."""
+        with self._lock:
+            if entity_id in self._names:
+                self._delete(entity_id)
+            self._insert(entity_id, name)
+            self._names[entity_id] = name
+            self._grow(entity_id)
+            self._ratings[entity_id] = rating
+            self._present[entity_id] = True
+
+    def remove(self, entity_id: int) -> None:
+        with self._lock:
+            if entity_id in self._names:
+                self._delete(entity_id)
+                self._present[entity_id] = False
+
+    def _apply_store_ratings(self) -> None:
+        # The store has votes that are not flushed to the database yet
+        store = get_rating_store()
+        if store is None:
+            return
+        ids, ratings = store.rating_arrays()
+        with self._lock:
+            known = ids < len(self._present)
+            ids, ratings = ids[known], ratings[known]
+            indexed = self._present[ids]
+            self._ratings[ids[indexed]] = ratings[indexed]
+
+    def merge(self) -> None:
+        """Merge the recent keys into the main list and drop stale ones.
+
+        The merge runs outside the lock and is discarded if the keys changed
+        meanwhile; the next one picks up the changes.
+        """
+        with self._lock:
+            if not self._new_keys and not self._stale_ids:
+                return
+            changes = self._changes
+            keys, key_ids = self._keys, self._key_ids
+            new_keys, new_key_ids = list(self._new_keys), list(self._new_key_ids)
+            stale = np.fromiter(self._stale_ids, dtype=np.int64, count=len(self._stale_ids))
+        keep = ~np.isin(key_ids, stale)
+        merged = list(compress(keys, keep.tolist())) + new_keys
+        # Both parts are sorted, which the sort finds and merges in linear time
+        order = np.array(sorted(range(len(merged)), key=merged.__getitem__), dtype=np.int64)
+        merged_ids = np.concatenate([key_ids[keep], np.array(new_key_ids, dtype=np.int64)])[order]
+        merged = [merged[position] for position in order]
+        with self._lock:
+            if self._changes == changes:
+                self._keys, self._key_ids = merged, merged_ids
+                self._new_keys, self._new_key_ids, self._stale_ids = [], [], set()
+
+    def refresh(self, db: Session) -> None:
+        """Reload ratings, and rebuild if entities were added or deleted elsewhere."""
+        rows = db.execute(select(Entity.id, Entity.rating)).all()
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        ratings = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+        with self._lock:
+            unchanged = len(ids) == len(self._names) and (
+                not len(ids) or (ids.max() < len(self._present) and self._present[ids].all())
+            )
+            if unchanged:
+                self._ratings[ids] = ratings
+        if unchanged:
+            self._apply_store_ratings()
+            self.merge()
+        else:
+            self.load(db)
+
+    def run(self, interval: float, session_factory: Callable[[], Session]) -> None:
+        while not self._stop.wait(interval):
+            try:
+                with session_factory() as db:
+                    self.refresh(db)
+            except Exception:
+                logger.exception("Autocomplete refresh failed, retrying at the next interval")
+
+    def start(self, interval: float, session_factory: Callable[[], Session] = SessionLocal) -> None:
+        """Refresh the index every ``interval`` seconds in a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self.run, args=(interval, session_factory), name="autocomplete-refresher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def complete(self, prefix: str, limit: int) -> list[dict]:
+        """Highest-rated entities with a name key starting with ``prefix``."""
+        key = normalize(prefix)
+        if not key:
+            return []
+        with self._lock:
+            start = bisect.bisect_left(self._keys, key)
+            end = bisect.bisect_left(self._keys, key + _KEY_END, start)
+            ids = self._key_ids[start:end]
+            if self._stale_ids:
+                ids = ids[~np.isin(ids, list(self._stale_ids))]
+            start = bisect.bisect_left(self._new_keys, key)
+            end = bisect.bisect_left(self._new_keys, key + _KEY_END, start)
+            if start < end:
+                ids = np.concatenate([ids, np.array(self._new_key_ids[start:end], dtype=np.int64)])
+            best = top_rated(ids, self._ratings[ids], limit).tolist()
+            return [
+                {"id": entity_id, "name": self._names[entity_id], "rating": float(self._ratings[entity_id])}
+                for entity_id in best
+            ]
+
+
+_index: AutocompleteIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_autocomplete_index() -> AutocompleteIndex | None:
+    """Get the process-wide autocomplete index, or None if it has not been built."""
+    return _index
+
+
+def load_autocomplete_index(db: Session) -> AutocompleteIndex:
+    """Build the process-wide autocomplete index if it has not been built yet."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            index = AutocompleteIndex()
+            index.load(db)
+            _index = index
+    return _index
+
+
+def start_autocomplete_refresh() -> None:
+    """Refresh the process-wide index in the background, unless the refresh interval is 0."""
+    interval = get_autocomplete_refresh_interval()
+    if _index is not None and interval > 0:
+        _index.start(interval)
+
+
+def stop_autocomplete_refresh() -> None:
+    if _index is not None:
+        _index.stop()
@@ -0,0 +1,219 @@
+"""
+Bootstrap confidence intervals for Bradley-Terry ratings and ranks.
+
+Each bootstrap round draws as many votes as were cast, with replacement, and
+re-fits the ratings. Votes are resampled in aggregated form: drawing ``N``
+votes from the distinct ``(entity1, entity2, winner)`` cells is a single
+multinomial draw over the cells, so a round costs the same for a million
+votes as for the number of distinct pairs. Rounds are spread over worker
+processes and each fit starts from the full-data solution.
+"""
+
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+from scipy.stats import rankdata
+from sqlalchemy.orm import Session
+
+from .bradley_terry import ELO_SCALE, comparison_state, fit_pairs, fit_strengths, load_comparison_cells, win_matrix
+from .config import get_bootstrap_config, get_elo_initial_rating
+from .models import Entity, EntityOut
+from .replay import load_entity_index
+
+logger = logging.getLogger(__name__)
+
+# Last computed intervals, keyed on the comparison count and the request parameters
+_interval_cache: dict[str, object] = {}
+# Bootstraps in progress, keyed like the cache; concurrent requests for the same key wait for its result
+_in_flight: dict[tuple, Future] = {}
+# Guards the cache and the bootstraps in progress, not the computation
+_compute_lock = threading.Lock()
+
+Cells = tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+def cell_pairs(cells: Cells, n: int) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Map each cell to its unordered entity pair.
+
+    Returns:
+        Tuple of ``(pair_i, pair_j, cell_pair, cell_wins)``: the distinct pairs
+        with ``pair_i < pair_j``, the pair index of each cell, and the share of
+        each of the cell's votes that is a win for ``pair_i``. Self-comparisons
+        carry no information, as in :func:`win_matrix`, and map to the index
+        one past the last pair.
+    """
+    idx1, idx2, score1, _ = cells
+    low = np.minimum(idx1, idx2).astype(np.int64)
+    high = np.maximum(idx1, idx2).astype(np.int64)
+    keys = np.where(low == high, n * n, low * n + high)
+    keys, cell_pair = np.unique(keys, return_inverse=True)
+    keys = keys[keys < n * n]
+    cell_wins = np.where(idx1 == low, score1, 1.0 - score1)
+    return keys // n, keys % n, cell_pair, cell_wins
+
+
+def bootstrap_fits(
+    cells: Cells, n: int, initial: np.ndarray, rounds: int, seed: np.random.SeedSequence
+) -> tuple[np.ndarray, np.ndarray]:
+    """Run ``rounds`` bootstrap fits.
+
+    Runs in a worker process, so it only takes and returns plain arrays.
+
+    Returns:
+        Tuple of ``(log_strengths, ranks)``, each of shape ``(rounds, n)``
+    """
+    counts = cells[3]
+    pair_i, pair_j, cell_pair, cell_wins = cell_pairs(cells, n)
+    size = len(pair_i) + 1
+
+    rng = np.random.default_rng(seed)
+    total = int(counts.sum())
+    probabilities = counts / counts.sum()
+    thetas = np.empty((rounds, n))
+    ranks = np.empty((rounds, n), dtype=np.int32)
+    for round_ in range(rounds):
+        sample = rng.multinomial(total, probabilities).astype(np.float64)
+        games = np.bincount(cell_pair, sample, size)[:-1]
+        wins = np.bincount(cell_pair, sample * cell_wins, size)[:-1]
+        theta, _ = fit_pairs(n, pair_i, pair_j, wins, games, initial=initial)
+        thetas[round_] = theta
+        ranks[round_] = rankdata(-theta, method="min")
+    return thetas, ranks
+
+
+def bootstrap_intervals(
+    cells: Cells,
+    n: int,
+    rounds: int,
+    confidence: float = 0.95,
+    workers: int = 1,
+    seed: int | None = None,
+) -> dict[str, np.ndarray]:
+    """Compute point estimates and bootstrap intervals of ratings and ranks.
+
+    Args:
+        cells: Aggregated comparisons from :func:`load_comparison_cells`
+        n: Number of entities
+        rounds: Number of bootstrap rounds
+        confidence: Coverage of the intervals, e.g. 0.95
+        workers: Number of worker processes
+        seed: Seed for reproducible resampling
+
+    Returns:
+        Arrays ``theta``, ``rank``, ``theta_lower``, ``theta_upper``,
+        ``rank_lower`` and ``rank_upper``, indexed like the entities
+    """
+    theta, _ = fit_strengths(win_matrix(n, *cells))
+    rank = rankdata(-theta, method="min").astype(np.int32)
+    if len(cells[0]) == 0 or rounds == 0:
+        return {
+            "theta": theta,
+            "rank": rank,
+            "theta_lower": theta,
+            "theta_upper": theta,
+            "rank_lower": rank,
+            "rank_upper": rank,
+        }
+
+    tasks = min(workers, rounds)
+    seeds = np.random.SeedSequence(seed).spawn(tasks)
+    split = [len(part) for part in np.array_split(np.arange(rounds), tasks)]
+    if tasks == 1:
+        results = [bootstrap_fits(cells, n, theta, rounds, seeds[0])]
+    else:
+        # Spawn rather than fork: the server process has threads whose locks a fork would copy
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=tasks, mp_context=context) as pool:
+            futures = [
+                pool.submit(bootstrap_fits, cells, n, theta, size, s) for size, s in zip(split, seeds, strict=True)
+            ]
+            results = [future.result() for future in futures]
+
+    thetas = np.concatenate([thetas for thetas, _ in results])
+    ranks = np.concatenate([ranks for _, ranks in results])
+    alpha = (1.0 - confidence) / 2.0
+    return {
+        "theta": theta,
+        "rank": rank,
+        "theta_lower": np.quantile(thetas, alpha, axis=0),
+        "theta_upper": np.quantile(thetas, 1.0 - alpha, axis=0),
+        "rank_lower": np.quantile(ranks, alpha, axis=0, method="lower").astype(np.int32),
+        "rank_upper": np.quantile(ranks, 1.0 - alpha, axis=0, method="higher").astype(np.int32),
+    }
+
+
+def compute_rating_intervals(db: Session, state: tuple, rounds: int, confidence: float, seed: int | None) -> dict:
+    """Bootstrap the ratings of the comparisons described by ``state``; see :func:`get_rating_intervals`."""
+    workers = get_bootstrap_config()[1]
+    entity_ids = load_entity_index(db)
+    cells = load_comparison_cells(db, entity_ids)
+    logger.info(f"Bootstrapping {rounds} rounds over {len(cells[0])} comparison cells with {workers} workers")
+    bounds = bootstrap_intervals(cells, len(entity_ids), rounds, confidence, workers, seed)
+
+    initial_rating = get_elo_initial_rating()
+    ratings = {name: initial_rating + ELO_SCALE * bounds[name] for name in ("theta", "theta_lower", "theta_upper")}
+    entities = {entity.id: entity for entity in db.query(Entity)}
+    intervals = [
+        {
+            "entity": EntityOut.model_validate(entities[entity_id]).model_copy(
+                update={"rating": float(ratings["theta"][i])}
+            ),
+            "rating_lower": float(ratings["theta_lower"][i]),
+            "rating_upper": float(ratings["theta_upper"][i]),
+            "rank": int(bounds["rank"][i]),
+            "rank_lower": int(bounds["rank_lower"][i]),
+            "rank_upper": int(bounds["rank_upper"][i]),
+        }
+        for i, entity_id in enumerate(entity_ids.tolist())
+        if entity_id in entities
+    ]
+    intervals.sort(key=lambda interval: interval["rank"])
+    return {"comparisons": state[0], "rounds": rounds, "confidence": confidence, "intervals": intervals}
+
+
+def get_rating_intervals(
+    db: Session, rounds: int | None = None, confidence: float = 0.95, seed: int | None = None
+) -> dict:
+    """Get Bradley-Terry ratings with bootstrap intervals, cached until comparisons or entities change.
+
+    Concurrent requests for the same comparisons and parameters share one
+    computation.
+
+    Returns:
+        Summary with ``comparisons``, ``rounds``, ``confidence`` and
+        ``intervals``, one per entity sorted by rating; ratings are on the Elo
+        scale
+    """
+    if rounds is None:
+        rounds = get_bootstrap_config()[0]
+    state = comparison_state(db)
+    key = (state, rounds, confidence, seed)
+
+    with _compute_lock:
+        if _interval_cache.get("key") == key:
+            return _interval_cache["result"]
+        future = _in_flight.get(key)
+        if future is None:
+            future = _in_flight[key] = Future()
+            owner = True
+        else:
+            owner = False
+    if not owner:
+        return future.result()
+
+    try:
+        result = compute_rating_intervals(db, state, rounds, confidence, seed)
+    except BaseException as e:
+        with _compute_lock:
+            del _in_flight[key]
+        future.set_exception(e)
+        raise
+    with _compute_lock:
+        del _in_flight[key]
+        _interval_cache["key"] = key
+        _interval_cache["result"] = result
+    future.set_result(result)
+    return result
@@ -0,0 +1,57 @@
+"""
+Bounded in-memory caches
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a fixed time.
+
+    Once ``maxsize`` entries are stored, the least recently used one is
+    evicted. Expired entries are dropped when they are looked up or when they
+    reach the LRU end of the cache.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a live entry and mark it as recently used."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= self.clock():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store an entry, evicting expired and least recently used entries as needed."""
+        with self._lock:
+            now = self.clock()
+            self._data[key] = (now + self.ttl, value)
+            self._data.move_to_end(key)
+            while self._data:
+                oldest_key, (expires_at, _) = next(iter(self._data.items()))
+                if len(self._data) <= self.maxsize and expires_at > now:
+                    break
+                del self._data[oldest_key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -2,35 +2,138 @@
 Comparison management and creation.
 """
 
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import Session
+import tempfile
+from collections.abc import Callable
+from datetime import UTC, datetime
 
-from .database import get_db
-from .errors import handle_database_error, handle_not_found, handle_validation_error
+from fastapi import APIRouter, Depends, Header, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from sqlalchemy import func, insert, select, tuple_, union_all
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.orm.exc import StaleDataError
+
+from .cache import TTLCache
+from .config import get_elo_k_factor, get_idempotency_config, get_rating_engine, get_vote_queue_config
+from .database import get_async_db, get_db
+from .errors import handle_conflict, handle_database_error, handle_not_found, handle_validation_error
+from .importer import ImportFormat, import_comparison_file
+from .leaderboard import bump_ratings_version
 from .models import (
     Comparison,
+    ComparisonBatchResult,
     ComparisonCreate,
+    ComparisonImportResult,
     ComparisonOut,
     Entity,
     NextComparisonResponse,
+    PendingVote,
+    QueuedVoteOut,
+)
+from .rating import (
+    MAX_RATING_UPDATE_RETRIES,
+    apply_elo_results,
+    compare_and_set_ratings,
+    record_comparison_result_async,
+    retry_backoff,
 )
-from .rating import update_elo_ratings
-from .similarity import get_dissimilar_entities
+from .rating_store import get_rating_store
+from .similarity import select_dissimilar_entities
 
 router = APIRouter()
 
+# Maximum number of comparisons accepted by one batch request
+MAX_BATCH_SIZE = 10_000
+# Uploads larger than this are spooled to a temporary file instead of memory
+IMPORT_SPOOL_SIZE = 8 * 1024 * 1024
+# Longest accepted Idempotency-Key header
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+# Recently created comparisons by Idempotency-Key; the database column is the source of truth
+_idempotency_cache: TTLCache | None = None
+
+
+def get_idempotency_cache() -> TTLCache:
+    """Get the process-wide Idempotency-Key cache, creating it on first use."""
+    global _idempotency_cache
+    if _idempotency_cache is None:
+        maxsize, ttl = get_idempotency_config()
+        _idempotency_cache = TTLCache(maxsize, ttl)
+    return _idempotency_cache
+
+
+async def find_idempotent_comparison(db: AsyncSession, idempotency_key: str) -> ComparisonOut | None:
+    """Look up the comparison created with an Idempotency-Key, cache first."""
+    cache = get_idempotency_cache()
+    stored = cache.get(idempotency_key)
+    if stored is not None:
+        return stored
+
+    query = select(Comparison).where(Comparison.idempotency_key == idempotency_key)
+    existing = (await db.execute(query)).scalars().first()
+    if existing is None:
+        return None
+    stored = ComparisonOut.model_validate(existing)
+    cache.set(idempotency_key, stored)
+    return stored
+
 
-@router.post("/comparisons/", response_model=ComparisonOut)
+def replay_idempotent_comparison(comparison: ComparisonCreate, stored: ComparisonOut) -> ComparisonOut:
+    """Return the result of the original request, if the retry asks for the same comparison."""
+    original = (stored.entity1_id, stored.entity2_id, stored.selected_entity_id)
+    if original != (comparison.entity1_id, comparison.entity2_id, comparison.selected_entity_id):
+        handle_conflict("Idempotency-Key was already used for a different comparison")
+    return stored
+
+
+async def enqueue_comparison(
+    db: AsyncSession, comparison: ComparisonCreate, idempotency_key: str | None
+) -> JSONResponse:
+    """Store a vote in the queue and acknowledge it with 202 Accepted."""
+    vote = PendingVote(**comparison.model_dump(), idempotency_key=idempotency_key, created_at=datetime.now(UTC))
+    db.add(vote)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # A retry of a vote that is still queued
+        await db.rollback()
+        query = select(PendingVote).where(PendingVote.idempotency_key == idempotency_key)
+        vote = (await db.execute(query)).scalars().first() if idempotency_key else None
+        if vote is None:
+            raise
+        original = (vote.entity1_id, vote.entity2_id, vote.selected_entity_id)
+        if original != (comparison.entity1_id, comparison.entity2_id, comparison.selected_entity_id):
+            handle_conflict("Idempotency-Key was already used for a different comparison")
+    return JSONResponse(status_code=202, content=QueuedVoteOut(queue_id=vote.id).model_dump())
+
+
+@router.post("/comparisons/", response_model=ComparisonOut, responses={202: {"model": QueuedVoteOut}})
 async def create_comparison(
     comparison: ComparisonCreate,
-    db: Session = Depends(get_db),
-) -> Comparison:
-    """Create a new comparison and update ratings."""
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key", max_length=MAX_IDEMPOTENCY_KEY_LENGTH),
+) -> ComparisonOut:
+    """Create a new comparison and update ratings.
+
+    A client may send an ``Idempotency-Key`` header to make retries safe: a
+    repeated request with the same key returns the original comparison
+    without recording a second vote.
+
+    With the vote queue enabled, the vote is validated and queued, and the
+    response is ``202 Accepted`` with its queue ID; ratings are updated by
+    the queue worker shortly after.
+    """
     try:
+        if idempotency_key:
+            stored = await find_idempotent_comparison(db, idempotency_key)
+            if stored is not None:
+                return replay_idempotent_comparison(comparison, stored)
+
         # Check if entities exist
-        entity1 = db.query(Entity).filter(Entity.id == comparison.entity1_id).first()
-        entity2 = db.query(Entity).filter(Entity.id == comparison.entity2_id).first()
+        entity1 = await db.get(Entity, comparison.entity1_id)
+        entity2 = await db.get(Entity, comparison.entity2_id)
 
         if not entity1:
             handle_not_found("Entity", comparison.entity1_id)
@@ -41,38 +144,279 @@ async def create_comparison(
         if comparison.selected_entity_id not in [comparison.entity1_id, comparison.entity2_id]:
             handle_validation_error("Selected entity must be one of the compared entities")
 
-        # Create comparison
-        db_comparison = Comparison(**comparison.model_dump())
-        db.add(db_comparison)
-        db.commit()
-        db.refresh(db_comparison)
+        if get_vote_queue_config()[0]:
+            return await enqueue_comparison(db, comparison, idempotency_key)
+
+        # Insert the comparison in the rating update's transaction, so a conflict rolls back both
+        added: list[Comparison] = []
 
-        # Update Elo ratings
-        update_elo_ratings(db, entity1, entity2, comparison.selected_entity_id)
+        def add_comparison(session: Session) -> None:
+            # A new row on every attempt: a rolled-back insert keeps its stale primary key
+            db_comparison = Comparison(**comparison.model_dump(), idempotency_key=idempotency_key)
+            session.add(db_comparison)
+            session.flush()
+            added.append(db_comparison)
 
-        return db_comparison
+        try:
+            await record_comparison_result_async(
+                db, entity1, entity2, comparison.selected_entity_id, before_commit=add_comparison
+            )
+        except IntegrityError:
+            # A concurrent request with the same key committed first
+            await db.rollback()
+            stored = await find_idempotent_comparison(db, idempotency_key) if idempotency_key else None
+            if stored is None:
+                raise
+            return replay_idempotent_comparison(comparison, stored)
+
+        db_comparison = added[-1]
+        await db.refresh(db_comparison)
+        created = ComparisonOut.model_validate(db_comparison)
+        if idempotency_key:
+            # Only now: a retry after a failed write must record the vote, not replay it
+            get_idempotency_cache().set(idempotency_key, created)
+        return created
+    except StaleDataError:
+        await db.rollback()
+        handle_conflict("Ratings are being updated concurrently, please retry")
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         handle_database_error(e, "create comparison")
 
 
+def validate_comparison(comparison: ComparisonCreate, entities: dict[int, Entity]) -> str | None:
+    """Check a comparison against the loaded entities, returning an error message if invalid."""
+    for entity_id in (comparison.entity1_id, comparison.entity2_id):
+        if entity_id not in entities:
+            return f"Entity with id {entity_id} not found"
+    if comparison.selected_entity_id not in [comparison.entity1_id, comparison.entity2_id]:
+        return "Selected entity must be one of the compared entities"
+    return None
+
+
+def insert_comparisons(db: Session, rows: list[dict], returning: bool) -> list[Comparison]:
+    """Insert comparison rows in bulk, returning them in input order if ``returning``.
+
+    Rows are inserted without the unit of work's per-object bookkeeping. On
+    SQLite, rows of one multi-row INSERT get ascending IDs, so they are read
+    back in a single statement and put in input order by ID; elsewhere the
+    driver keeps the input order.
+    """
+    if not rows:
+        return []
+    if not returning:
+        db.execute(insert(Comparison), rows)
+        return []
+    if db.get_bind().dialect.name == "sqlite":
+        return sorted(db.scalars(insert(Comparison).returning(Comparison), rows).all(), key=lambda c: c.id)
+    return db.scalars(insert(Comparison).returning(Comparison, sort_by_parameter_order=True), rows).all()
+
+
+def record_comparisons(
+    db: Session,
+    comparisons: list[ComparisonCreate],
+    row_values: list[dict] | None = None,
+    before_commit: Callable[[Session, list[ComparisonCreate]], None] | None = None,
+    return_comparisons: bool = True,
+) -> list[dict]:
+    """Record many comparisons in one transaction with one rating pass.
+
+    All referenced entities are loaded with a single ``IN`` query. Valid
+    comparisons are inserted together, Elo updates are applied in order in
+    memory, and every touched rating is written once with a version check.
+    If another writer changed one of the entities in the meantime, the whole
+    batch is rolled back and retried.
+
+    Args:
+        db: Database session
+        comparisons: Comparisons to record, in the order they were made
+        row_values: Extra column values per comparison, e.g. ``created_at``
+        before_commit: Called with the session and the valid comparisons just
+            before each commit attempt, to make more changes in the same transaction
+        return_comparisons: Include each created comparison in its result;
+            without them, rows are inserted without reading anything back
+
+    Returns:
+        One result per input comparison, in input order, with either the
+        created comparison (if ``return_comparisons``) or an error message
+
+    Raises:
+        StaleDataError: If the batch still conflicts after MAX_RATING_UPDATE_RETRIES attempts
+    """
+    entity_ids = {c.entity1_id for c in comparisons} | {c.entity2_id for c in comparisons}
+    store = get_rating_store() if get_rating_engine() == "elo" else None
+    use_elo = get_rating_engine() == "elo" and store is None
+    k_factor = get_elo_k_factor()
+
+    for attempt in range(MAX_RATING_UPDATE_RETRIES):
+        entities = {e.id: e for e in db.query(Entity).filter(Entity.id.in_(entity_ids))}
+
+        results: list[dict] = []
+        created_results: list[dict] = []
+        valid: list[ComparisonCreate] = []
+        rows: list[dict] = []
+        created_at = datetime.now(UTC)
+        for index, comparison in enumerate(comparisons):
+            error = validate_comparison(comparison, entities)
+            if error:
+                results.append({"index": index, "status": "error", "error": error})
+                continue
+            result = {"index": index, "status": "created"}
+            results.append(result)
+            created_results.append(result)
+            valid.append(comparison)
+            rows.append(
+                {
+                    "entity1_id": comparison.entity1_id,
+                    "entity2_id": comparison.entity2_id,
+                    "selected_entity_id": comparison.selected_entity_id,
+                    "created_at": created_at,
+                    **(row_values[index] if row_values else {}),
+                }
+            )
+
+        created = insert_comparisons(db, rows, return_comparisons)
+        results_of = [(c.entity1_id, c.entity2_id, c.selected_entity_id) for c in valid]
+
+        new_ratings: dict[Entity, float] = {}
+        if use_elo and valid:
+            ratings = {entity_id: entity.rating for entity_id, entity in entities.items()}
+            apply_elo_results(ratings, results_of, k_factor)
+            new_ratings = {entities[entity_id]: rating for entity_id, rating in ratings.items()}
+
+        if compare_and_set_ratings(db, new_ratings):
+            if before_commit:
+                before_commit(db, valid)
+            if return_comparisons:
+                # Serialize before committing, which would expire the new rows
+                for result, db_comparison in zip(created_results, created, strict=True):
+                    result["comparison"] = ComparisonOut.model_validate(db_comparison)
+            db.commit()
+            if store is not None:
+                store.record_many(entities, results_of)
+            bump_ratings_version()
+            return results
+
+        db.rollback()
+        retry_backoff(attempt)
+
+    raise StaleDataError("Batch rating update kept conflicting")
+
+
+@router.post("/comparisons/batch", response_model=ComparisonBatchResult)
+def create_comparisons_batch(
+    comparisons: list[ComparisonCreate],
+    db: Session = Depends(get_db),
+) -> dict:
+    """Create many comparisons in one transaction and update ratings once."""
+    if len(comparisons) > MAX_BATCH_SIZE:
+        handle_validation_error(f"Cannot submit more than {MAX_BATCH_SIZE} comparisons per batch")
+    try:
+        results = record_comparisons(db, comparisons)
+    except StaleDataError:
+        db.rollback()
+        handle_conflict("Ratings are being updated concurrently, please retry")
+    except SQLAlchemyError as e:
+        db.rollback()
+        handle_database_error(e, "create comparison batch")
+
+    created = sum(1 for result in results if result["status"] == "created")
+    return {"created": created, "failed": len(results) - created, "results": results}
+
+
+@router.post("/comparisons/import", response_model=ComparisonImportResult)
+async def import_comparisons_upload(
+    request: Request,
+    format: ImportFormat = Query("ndjson", description="Format of the request body: ndjson or csv"),
+    db: Session = Depends(get_db),
+) -> dict:
+    """Import comparisons from an NDJSON or CSV request body.
+
+    The body is streamed to a spooled temporary file and then imported in
+    chunks, with a single rating recompute at the end. File and database
+    work runs in the thread pool, as it blocks once the upload spills to disk.
+    """
+    upload = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_SIZE)
+    try:
+        async for chunk in request.stream():
+            await run_in_threadpool(upload.write, chunk)
+        return await run_in_threadpool(import_upload, db, upload, format)
+    finally:
+        await run_in_threadpool(upload.close)
+
+
+def import_upload(db: Session, upload: tempfile.SpooledTemporaryFile, format: ImportFormat) -> dict:
+    """Import a spooled upload from its start, rolling back on database errors."""
+    upload.seek(0)
+    try:
+        return import_comparison_file(db, upload, format)
+    except SQLAlchemyError as e:
+        db.rollback()
+        handle_database_error(e, "import comparisons")
+
+
+def parse_cursor(cursor: str) -> tuple[datetime, int]:
+    """Parse a ``<created_at>,<id>`` pagination cursor."""
+    try:
+        created_at, comparison_id = cursor.rsplit(",", 1)
+        return datetime.fromisoformat(created_at), int(comparison_id)
+    except ValueError:
+        handle_validation_error(f"Invalid cursor: {cursor!r}, expected <created_at>,<id>")
+
+
+def format_cursor(comparison: Comparison) -> str:
+    """Build the cursor that continues after ``comparison``."""
+    return f"{comparison.created_at.isoformat()},{comparison.id}"
+
+
+def newest_first(stmt, limit: int):
+    return stmt.order_by(Comparison.created_at.desc(), Comparison.id.desc()).limit(limit)
+
+
 @router.get("/comparisons/", response_model=list[ComparisonOut])
 def list_comparisons(
+    response: Response,
     skip: int = Query(0, ge=0, description="Number of comparisons to skip"),
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of comparisons to return"),
     entity_id: int | None = Query(None, description="Filter by entity ID"),
+    after: str | None = Query(None, description="Cursor from X-Next-Cursor: return comparisons after it"),
     db: Session = Depends(get_db),
 ) -> list[Comparison]:
-    """Get list of comparisons with optional filtering and pagination."""
+    """Get list of comparisons, newest first, with optional filtering and pagination.
+
+    Pass the ``X-Next-Cursor`` header of a page as ``after`` to get the next
+    one. Unlike ``skip``, a cursor seeks straight to its position in the
+    ``(created_at, id)`` index, so every page costs the same.
+    """
     try:
-        query = db.query(Comparison)
+        conditions = []
+        if after:
+            created_at, comparison_id = parse_cursor(after)
+            # Compare against the stored timestamp of the cursor row, so the cursor is exact
+            # however the database formats timestamps; fall back to the cursor if it was deleted
+            stored = select(Comparison.created_at).where(Comparison.id == comparison_id).scalar_subquery()
+            position = tuple_(func.coalesce(stored, created_at), comparison_id)
+            conditions.append(tuple_(Comparison.created_at, Comparison.id) < position)
 
         if entity_id:
-            query = query.filter(
-                (Comparison.entity1_id == entity_id) | (Comparison.entity2_id == entity_id)
+            # One branch per column, so each can walk its own (entity, created_at, id) index
+            branches = [
+                select(Comparison).where(Comparison.entity1_id == entity_id, *conditions),
+                select(Comparison).where(
+                    Comparison.entity2_id == entity_id, Comparison.entity1_id != entity_id, *conditions
+                ),
+            ]
+            page = aliased(
+                Comparison,
+                union_all(*(select(newest_first(b, skip + limit).subquery()) for b in branches)).subquery(),
             )
+            stmt = select(page).order_by(page.created_at.desc(), page.id.desc()).offset(skip).limit(limit)
+        else:
+            stmt = newest_first(select(Comparison).where(*conditions), limit).offset(skip)
 
-        comparisons = query.order_by(Comparison.created_at.desc()).offset(skip).limit(limit).all()
+        comparisons = db.execute(stmt).scalars().all()
+        if len(comparisons) == limit:
+            response.headers["X-Next-Cursor"] = format_cursor(comparisons[-1])
         return comparisons
     except SQLAlchemyError as e:
         handle_database_error(e, "list comparisons")
@@ -81,10 +425,13 @@ def list_comparisons(
 # NOTE: This route MUST be defined BEFORE /comparisons/{comparison_id}
 # otherwise "next" gets interpreted as a comparison_id parameter
 @router.get("/comparisons/next", response_model=NextComparisonResponse)
-async def get_next_comparison(db: Session = Depends(get_db)) -> dict:
+async def get_next_comparison(db: AsyncSession = Depends(get_async_db)) -> dict:
     """Get next pair of entities for comparison using similarity."""
     try:
-        entities = get_dissimilar_entities(db)
+        all_entities = (await db.execute(select(Entity))).scalars().all()
+        # Release the connection, then keep the CPU-bound embedding off the event loop
+        await db.close()
+        entities = await run_in_threadpool(select_dissimilar_entities, all_entities)
         if len(entities) < 2:
             handle_validation_error("Not enough entities for comparison (need at least 2)")
         return {"entity1": entities[0], "entity2": entities[1]}
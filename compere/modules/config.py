@@ -11,6 +11,9 @@ from typing import Any
 # Module-level cached config
 _config: dict[str, Any] | None = None
 
+# Async driver used for each supported database, for the async engine
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg", "mysql": "aiomysql"}
+
 
 def validate_environment() -> dict[str, Any]:
     """Validate environment variables and dependencies"""
@@ -25,6 +28,9 @@ def validate_environment() -> dict[str, Any]:
     # Validate database URL format
     if not database_url.startswith(("sqlite://", "postgresql://", "mysql://")):
         errors.append(f"Invalid DATABASE_URL format: {database_url}")
+    else:
+        scheme, rest = database_url.split("://", 1)
+        config["async_database_url"] = f"{scheme}+{ASYNC_DRIVERS[scheme]}://{rest}"
 
     # ELO K-factor validation
     try:
@@ -59,7 +65,9 @@ def validate_environment() -> dict[str, Any]:
     try:
         from importlib.util import find_spec
 
-        required_deps = ["fastapi", "sqlalchemy", "numpy", "sklearn"]
+        required_deps = ["fastapi", "sqlalchemy", "greenlet", "numpy", "scipy", "sklearn"]
+        if "async_database_url" in config:
+            required_deps.append(ASYNC_DRIVERS[database_url.split("://", 1)[0]])
         missing = [dep for dep in required_deps if find_spec(dep) is None]
         if missing:
             errors.append(f"Missing required dependencies: {', '.join(missing)}")
@@ -75,9 +83,65 @@ def validate_environment() -> dict[str, Any]:
     config["rate_limit_requests"] = int(os.getenv("RATE_LIMIT_REQUESTS", "100"))
     config["rate_limit_window"] = int(os.getenv("RATE_LIMIT_WINDOW", "60"))
 
+    # Idempotency-Key deduplication of comparison submissions
+    config["idempotency_cache_size"] = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+    config["idempotency_ttl"] = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+
+    # Durable vote queue: acknowledge comparisons with 202 and apply them in batches
+    config["vote_queue_enabled"] = os.getenv("VOTE_QUEUE_ENABLED", "false").lower() == "true"
+    config["vote_queue_batch_size"] = int(os.getenv("VOTE_QUEUE_BATCH_SIZE", "500"))
+    config["vote_queue_poll_interval"] = float(os.getenv("VOTE_QUEUE_POLL_INTERVAL", "0.05"))
+    if config["vote_queue_batch_size"] < 1:
+        errors.append(f"VOTE_QUEUE_BATCH_SIZE must be at least 1, got: {config['vote_queue_batch_size']}")
+
     # Elo rating configuration
     config["elo_initial_rating"] = float(os.getenv("ELO_INITIAL_RATING", "1500.0"))
 
+    # Rating engine: per-vote Elo updates or batched Glicko-2 rating periods
+    rating_engine = os.getenv("RATING_ENGINE", "elo").lower()
+    config["rating_engine"] = rating_engine
+    if rating_engine not in ["elo", "glicko2"]:
+        errors.append(f"RATING_ENGINE must be 'elo' or 'glicko2', got: {rating_engine}")
+
+    # In-memory Elo ratings, written back to the database in the background
+    config["rating_store_enabled"] = os.getenv("RATING_STORE_ENABLED", "false").lower() == "true"
+    config["rating_store_flush_interval"] = float(os.getenv("RATING_STORE_FLUSH_INTERVAL", "1.0"))
+    config["rating_store_flush_every"] = int(os.getenv("RATING_STORE_FLUSH_EVERY", "1000"))
+    if config["rating_store_enabled"] and rating_engine != "elo":
+        errors.append("RATING_STORE_ENABLED requires RATING_ENGINE=elo")
+
+    # Comparisons between rating history checkpoints
+    config["rating_checkpoint_interval"] = int(os.getenv("RATING_CHECKPOINT_INTERVAL", "10000"))
+    if config["rating_checkpoint_interval"] < 1:
+        errors.append(f"RATING_CHECKPOINT_INTERVAL must be at least 1, got: {config['rating_checkpoint_interval']}")
+
+    # Bootstrap confidence intervals for GET /ratings/intervals
+    config["bootstrap_rounds"] = int(os.getenv("BOOTSTRAP_ROUNDS", "1000"))
+    config["bootstrap_workers"] = int(os.getenv("BOOTSTRAP_WORKERS", "0")) or os.cpu_count() or 1
+
+    # Entity search: substring LIKE scans, or opt in to word-prefix matching on a full-text index
+    entity_search_backend = os.getenv("ENTITY_SEARCH_BACKEND", "like").lower()
+    config["entity_search_backend"] = entity_search_backend
+    if entity_search_backend not in ["auto", "like"]:
+        errors.append(f"ENTITY_SEARCH_BACKEND must be 'auto' or 'like', got: {entity_search_backend}")
+
+    # Seconds a serialized leaderboard is served before it is rebuilt, to pick up other processes' writes
+    config["leaderboard_cache_ttl"] = float(os.getenv("LEADERBOARD_CACHE_TTL", "1.0"))
+    if config["leaderboard_cache_ttl"] < 0:
+        errors.append(f"LEADERBOARD_CACHE_TTL must not be negative, got: {config['leaderboard_cache_ttl']}")
+
+    # Seconds between reloads of the ratings behind entity autocomplete
+    config["autocomplete_refresh_interval"] = float(os.getenv("AUTOCOMPLETE_REFRESH_INTERVAL", "5.0"))
+    if config["autocomplete_refresh_interval"] < 0:
+        errors.append(
+            f"AUTOCOMPLETE_REFRESH_INTERVAL must not be negative, got: {config['autocomplete_refresh_interval']}"
+        )
+
+    # Glicko-2 configuration
+    config["glicko_initial_deviation"] = float(os.getenv("GLICKO_INITIAL_DEVIATION", "350.0"))
+    config["glicko_initial_volatility"] = float(os.getenv("GLICKO_INITIAL_VOLATILITY", "0.06"))
+    config["glicko_tau"] = float(os.getenv("GLICKO_TAU", "0.5"))
+
     # UCB/MAB configuration
     config["ucb_exploration_constant"] = float(os.getenv("UCB_EXPLORATION_CONSTANT", "1.414"))  # sqrt(2)
     config["ucb_unexplored_weight"] = float(os.getenv("UCB_UNEXPLORED_WEIGHT", "1000.0"))
@@ -93,6 +157,37 @@ def validate_environment() -> dict[str, Any]:
     # Recent comparison exclusion
     config["recent_comparison_limit"] = int(os.getenv("RECENT_COMPARISON_LIMIT", "5"))
 
+    # Most dissimilar pair search: exact up to this many entities, approximate from this many anchors above
+    config["dissimilar_exact_max_entities"] = int(os.getenv("DISSIMILAR_EXACT_MAX_ENTITIES", "2000"))
+    config["dissimilar_search_anchors"] = int(os.getenv("DISSIMILAR_SEARCH_ANCHORS", "16"))
+    if config["dissimilar_exact_max_entities"] < 0:
+        errors.append(
+            f"DISSIMILAR_EXACT_MAX_ENTITIES must not be negative, got: {config['dissimilar_exact_max_entities']}"
+        )
+    if config["dissimilar_search_anchors"] < 1:
+        errors.append(f"DISSIMILAR_SEARCH_ANCHORS must be at least 1, got: {config['dissimilar_search_anchors']}")
+
+    # Entity embeddings: a fitted TF-IDF vocabulary, or feature hashing that never needs refitting
+    embedding_backend = os.getenv("EMBEDDING_BACKEND", "tfidf").lower()
+    config["embedding_backend"] = embedding_backend
+    if embedding_backend not in ["tfidf", "hashing"]:
+        errors.append(f"EMBEDDING_BACKEND must be 'tfidf' or 'hashing', got: {embedding_backend}")
+    config["embedding_hash_features"] = int(os.getenv("EMBEDDING_HASH_FEATURES", "4096"))
+    if config["embedding_hash_features"] < 1:
+        errors.append(f"EMBEDDING_HASH_FEATURES must be at least 1, got: {config['embedding_hash_features']}")
+    config["embedding_hash_idf"] = os.getenv("EMBEDDING_HASH_IDF", "true").lower() == "true"
+    config["embedding_workers"] = int(os.getenv("EMBEDDING_WORKERS", "0")) or os.cpu_count() or 1
+
+    # Memory-mapped embedding snapshot shared by a host's processes: next to a SQLite database file by default
+    embedding_snapshot_dir = os.getenv("EMBEDDING_SNAPSHOT_DIR", "auto")
+    if embedding_snapshot_dir.lower() == "auto":
+        database_path = database_url.removeprefix("sqlite:///").split("?", 1)[0]
+        in_file = database_url.startswith("sqlite:///") and database_path and ":memory:" not in database_path
+        embedding_snapshot_dir = f"{database_path}.embeddings" if in_file else None
+    elif embedding_snapshot_dir.lower() == "off":
+        embedding_snapshot_dir = None
+    config["embedding_snapshot_dir"] = embedding_snapshot_dir
+
     # Authentication configuration
     config["auth_enabled"] = os.getenv("AUTH_ENABLED", "false").lower() == "true"
     config["secret_key"] = os.getenv("SECRET_KEY")
@@ -174,6 +269,11 @@ def get_database_url() -> str:
     return get_config()["database_url"]
 
 
+def get_async_database_url() -> str:
+    """Get the database URL with the async driver for the configured database."""
+    return get_config()["async_database_url"]
+
+
 def get_elo_k_factor() -> float:
     """Get Elo K-factor from configuration."""
     return get_config()["elo_k_factor"]
@@ -184,6 +284,66 @@ def get_elo_initial_rating() -> float:
     return get_config()["elo_initial_rating"]
 
 
+def get_rating_engine() -> str:
+    """Get the rating engine ("elo" or "glicko2")."""
+    return get_config().get("rating_engine", "elo")
+
+
+def get_rating_checkpoint_interval() -> int:
+    """Get the number of comparisons between rating history checkpoints."""
+    return get_config().get("rating_checkpoint_interval", 10000)
+
+
+def get_entity_search_backend() -> str:
+    """Get the entity search backend: 'like' (substring scans) or 'auto' (full-text index when available)."""
+    return get_config().get("entity_search_backend", "like")
+
+
+def get_leaderboard_cache_ttl() -> float:
+    """Get the number of seconds a cached leaderboard response stays valid (0 disables caching)."""
+    return get_config().get("leaderboard_cache_ttl", 1.0)
+
+
+def get_autocomplete_refresh_interval() -> float:
+    """Get the number of seconds between background reloads of the autocomplete ratings (0 disables them)."""
+    return get_config().get("autocomplete_refresh_interval", 5.0)
+
+
+def get_embedding_config() -> dict[str, Any]:
+    """Get entity embedding configuration values."""
+    config = get_config()
+    return {
+        "backend": config.get("embedding_backend", "tfidf"),
+        "hash_features": config.get("embedding_hash_features", 4096),
+        "hash_idf": config.get("embedding_hash_idf", True),
+        "workers": config.get("embedding_workers", 1),
+    }
+
+
+def get_embedding_snapshot_dir() -> str | None:
+    """Get the directory of the shared embedding snapshot, or None if snapshots are off."""
+    return get_config().get("embedding_snapshot_dir")
+
+
+def get_bootstrap_config() -> tuple[int, int]:
+    """Get bootstrap configuration (default rounds, worker processes)."""
+    config = get_config()
+    return (
+        config.get("bootstrap_rounds", 1000),
+        config.get("bootstrap_workers", 1),
+    )
+
+
+def get_glicko_config() -> dict[str, float]:
+    """Get Glicko-2 configuration values."""
+    config = get_config()
+    return {
+        "initial_deviation": config.get("glicko_initial_deviation", 350.0),
+        "initial_volatility": config.get("glicko_initial_volatility", 0.06),
+        "tau": config.get("glicko_tau", 0.5),
+    }
+
+
 def get_secret_key() -> str | None:
     """Get JWT secret key from configuration."""
     return get_config().get("secret_key")
@@ -219,6 +379,35 @@ def get_rate_limit_config() -> tuple[bool, int, int]:
     )
 
 
+def get_idempotency_config() -> tuple[int, int]:
+    """Get idempotency key cache configuration (max entries, TTL in seconds)."""
+    config = get_config()
+    return (
+        config.get("idempotency_cache_size", 10000),
+        config.get("idempotency_ttl", 86400),
+    )
+
+
+def get_vote_queue_config() -> tuple[bool, int, float]:
+    """Get vote queue configuration (enabled, batch size, poll interval in seconds)."""
+    config = get_config()
+    return (
+        config.get("vote_queue_enabled", False),
+        config.get("vote_queue_batch_size", 500),
+        config.get("vote_queue_poll_interval", 0.05),
+    )
+
+
+def get_rating_store_config() -> tuple[bool, float, int]:
+    """Get in-memory rating store configuration (enabled, flush interval in seconds, flush every N updates)."""
+    config = get_config()
+    return (
+        config.get("rating_store_enabled", False),
+        config.get("rating_store_flush_interval", 1.0),
+        config.get("rating_store_flush_every", 1000),
+    )
+
+
 def is_log_requests_enabled() -> bool:
     """Check if request logging is enabled."""
     return get_config().get("log_requests", True)
@@ -245,6 +434,12 @@ def get_pairing_config() -> dict[str, float | int]:
     }
 
 
+def get_dissimilar_search_config() -> tuple[int, int]:
+    """Get most dissimilar pair search configuration (largest exact search, approximate search anchors)."""
+    config = get_config()
+    return config.get("dissimilar_exact_max_entities", 2000), config.get("dissimilar_search_anchors", 16)
+
+
 def get_access_token_expire_minutes() -> int:
     """Get access token expiration time in minutes."""
     return get_config().get("access_token_expire_minutes", 30)
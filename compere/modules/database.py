@@ -1,8 +1,14 @@
-from sqlalchemy import create_engine
+import logging
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-from .config import get_database_url
+from .config import get_async_database_url, get_database_url
+
+logger = logging.getLogger(__name__)
 
 # Database setup - get URL from centralized config
 SQLALCHEMY_DATABASE_URL = get_database_url()
@@ -16,9 +22,62 @@ if SQLALCHEMY_DATABASE_URL.startswith("sqlite:///"):
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine on the same database, for endpoints that run on the event loop.
+# Uses aiosqlite for SQLite and asyncpg for PostgreSQL. SQLite allows a single
+# writer at a time, so its requests queue for one pooled connection instead of
+# contending for the file lock, whose busy handler sleeps for up to 100 ms.
+async_engine_args = {}
+if SQLALCHEMY_DATABASE_URL.startswith("sqlite:///") and ":memory:" not in SQLALCHEMY_DATABASE_URL:
+    async_engine_args = {"pool_size": 1, "max_overflow": 0}
+async_engine = create_async_engine(get_async_database_url(), **async_engine_args)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
+def run_migrations(bind: Engine) -> None:
+    """Apply additive schema changes to tables that already exist.
+
+    ``create_all`` only creates missing tables. This adds columns and indexes
+    that were introduced after a table was first created, so existing
+    databases pick up new model fields without a manual migration. New
+    columns must be nullable or declare a ``server_default``.
+    """
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(bind.dialect)}"
+                if column.server_default is not None:
+                    default = column.server_default.arg
+                    if isinstance(default, str):
+                        default = f"'{default}'"
+                    ddl += f" DEFAULT {default}"
+                logger.info(f"Adding column {table.name}.{column.name}")
+                conn.execute(text(ddl))
+
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+def init_db(bind: Engine = engine) -> None:
+    """Create missing tables and bring existing ones up to date."""
+    # Imported here: the search module depends on the models, which depend on this module
+    from .search import create_search_index
+
+    Base.metadata.create_all(bind=bind)
+    run_migrations(bind)
+    create_search_index(bind)
+
+
 # Dependency
 def get_db():
     db = SessionLocal()
@@ -26,3 +85,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,34 @@
+"""
+Elo rating arithmetic.
+"""
+
+
+def expected_score(rating_a: float, rating_b: float) -> float:
+    """Calculate expected score for entity A against entity B."""
+    return 1 / (1 + 10 ** ((rating_b - rating_a) / 400))
+
+
+def comparison_score(entity1_id: int, entity2_id: int, winner_id: int) -> float:
+    """Score of the first entity: 1 for a win, 0 for a loss, 0.5 otherwise."""
+    if winner_id == entity1_id:
+        return 1
+    if winner_id == entity2_id:
+        return 0
+    return 0.5
+
+
+def elo_delta(rating_a: float, rating_b: float, score_a: float, k_factor: float) -> float:
+    """Rating change of entity A; Elo is zero-sum, so entity B changes by the negative."""
+    return k_factor * (score_a - expected_score(rating_a, rating_b))
+
+
+def apply_elo_results(ratings: dict[int, float], results: list[tuple[int, int, int]], k_factor: float) -> None:
+    """Apply ``(entity1_id, entity2_id, winner_id)`` results to ``ratings`` in order, in place."""
+    for entity1_id, entity2_id, winner_id in results:
+        if entity1_id == entity2_id:
+            continue
+        delta = elo_delta(
+            ratings[entity1_id], ratings[entity2_id], comparison_score(entity1_id, entity2_id, winner_id), k_factor
+        )
+        ratings[entity1_id] += delta
+        ratings[entity2_id] -= delta
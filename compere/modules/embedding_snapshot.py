@@ -0,0 +1,113 @@
+"""
+Memory-mapped snapshots of the embedding cache, shared by the processes of a host.
+
+A snapshot is a directory with one ``.npy`` file per array of the cache's
+buffers, and a ``manifest.json`` that names the current generation. Processes
+open the arrays with ``numpy.load(mmap_mode="c")``, so they read them from
+the shared page cache instead of each holding a copy, and only pages a
+process writes to, e.g. for entities changed after the snapshot was written,
+become private to it. Arrays are padded with zeros to leave room for such
+changes; the padding takes no disk space on file systems with sparse files.
+
+A new generation is written to its own directory before the manifest is
+atomically replaced, so readers see the old snapshot or the new one, never
+a partial one. The previous generation is then deleted; processes that still
+map it keep reading it until they map the new one.
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from typing import NamedTuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+
+# Generations not named by the manifest are left by concurrent writers; delete them once this old
+ORPHAN_AGE = 600.0
+
+
+class Snapshot(NamedTuple):
+    generation: str
+    manifest: dict
+    arrays: dict[str, np.ndarray]
+
+
+def manifest_mtime(directory: str) -> int | None:
+    """Modification time of the manifest in nanoseconds, or None if there is no snapshot."""
+    try:
+        return os.stat(os.path.join(directory, MANIFEST)).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _read_manifest(directory: str) -> dict | None:
+    try:
+        with open(os.path.join(directory, MANIFEST)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def read_snapshot(directory: str, names: tuple[str, ...], manifest: dict | None = None) -> Snapshot | None:
+    """Map the arrays of a generation copy-on-write, or return None if it is gone.
+
+    Maps the current generation unless given the ``manifest`` of another.
+    """
+    if manifest is None:
+        manifest = _read_manifest(directory)
+        if manifest is None:
+            return None
+    generation = manifest.get("generation")
+    try:
+        arrays = {name: np.load(os.path.join(directory, generation, f"{name}.npy"), mmap_mode="c") for name in names}
+    except (OSError, ValueError, TypeError):
+        # Replaced and deleted by a writer since the manifest was read, or damaged
+        return None
+    return Snapshot(generation, manifest, arrays)
+
+
+def write_snapshot(directory: str, manifest: dict, arrays: dict[str, tuple[np.ndarray, int]]) -> str:
+    """Write ``arrays`` as a new generation and make it the current one.
+
+    Args:
+        directory: Snapshot directory, created if missing
+        manifest: JSON-serializable fields stored next to the generation
+        arrays: Name to ``(array, capacity)``; each file is zero-padded to ``capacity`` items
+
+    Returns:
+        The new generation
+    """
+    os.makedirs(directory, exist_ok=True)
+    previous = (_read_manifest(directory) or {}).get("generation")
+    generation = uuid.uuid4().hex
+    path = os.path.join(directory, generation)
+    os.mkdir(path)
+    for name, (array, capacity) in arrays.items():
+        # Memory-mapped files are extended with a seek, which leaves the padding as a hole
+        mapped = np.lib.format.open_memmap(
+            os.path.join(path, f"{name}.npy"), mode="w+", dtype=array.dtype, shape=(max(capacity, len(array), 1),)
+        )
+        mapped[: len(array)] = array
+        mapped.flush()
+        del mapped
+
+    temporary = os.path.join(directory, f"{MANIFEST}.{generation}")
+    with open(temporary, "w") as file:
+        json.dump({**manifest, "generation": generation}, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, os.path.join(directory, MANIFEST))
+
+    now = time.time()
+    for entry in os.scandir(directory):
+        if entry.is_dir() and entry.name != generation:
+            if entry.name == previous or now - entry.stat().st_mtime > ORPHAN_AGE:
+                shutil.rmtree(entry.path, ignore_errors=True)
+    return generation
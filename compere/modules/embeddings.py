@@ -0,0 +1,613 @@
+"""
+Persistent TF-IDF embeddings of entity names and descriptions.
+
+Two backends compute them, chosen with ``EMBEDDING_BACKEND``:
+
+- ``tfidf``: a vocabulary of the ``MAX_FEATURES`` most frequent terms,
+  fitted on the entities and refitted as they grow
+- ``hashing``: term counts hashed into a fixed number of columns. It has no
+  vocabulary to fit, so an entity's stored row never depends on others.
+  IDF weights, if enabled, come from document frequencies the cache keeps
+  as running counts, and are applied when rows are read
+
+The TF-IDF vocabulary is fitted once and stored in ``embedding_models``.
+Each entity's embedding is stored in ``entity_embeddings`` with a hash of
+the text it was computed from, and each process keeps all of them resident.
+Pairing requests read them as one CSR matrix, and new texts are transformed
+with the stored vocabulary, without refitting. Embeddings stay sparse
+throughout: storage, memory and gathering rows scale with the number of
+non-zero weights, not entities times vocabulary terms.
+
+The entity endpoints embed entities as they are created and when their name
+or description changes. Loading the cache at startup re-embeds entities whose
+text no longer matches its hash, e.g. after edits by other processes, and
+requests embed entities that have no embedding yet. Once the number of
+entities has grown to ``REFIT_GROWTH`` times the number the vocabulary was
+fitted on, the vocabulary is refitted and every entity re-embedded, so terms
+of newer entities make it into the vocabulary. Large batches of texts, e.g.
+when the cache is first loaded, are transformed in chunks across
+``EMBEDDING_WORKERS`` processes.
+
+With a snapshot directory (see :mod:`.embedding_snapshot`), the processes of
+a host share one memory-mapped copy of the cache. A process that loads the
+cache from the database, or refits the vocabulary, writes a new snapshot;
+others start by mapping it, and check for changed texts in the background
+instead of before serving requests. A process that finds a snapshot for a
+newer vocabulary than its own switches to it on its next request.
+"""
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import threading
+from collections.abc import Callable, Sequence
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+from sqlalchemy import delete, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from .config import get_embedding_config, get_embedding_snapshot_dir
+from .database import SessionLocal, engine
+from .embedding_snapshot import manifest_mtime, read_snapshot, write_snapshot
+from .models import EmbeddingModel, Entity, EntityEmbedding
+
+logger = logging.getLogger(__name__)
+
+# Vocabulary size, i.e. embedding dimensions
+MAX_FEATURES = 100
+NGRAM_RANGE = (1, 2)
+# Refit once there are this many times more entities than the vocabulary was fitted on
+REFIT_GROWTH = 2.0
+
+# Entity IDs per DELETE statement when replacing stored embeddings
+STORE_CHUNK_SIZE = 10_000
+
+# Fewer texts are transformed in this process; starting worker processes takes longer
+PARALLEL_MIN_TEXTS = 50_000
+
+# Initial row and non-zero capacity of the resident buffer; both double when outgrown
+INITIAL_CAPACITY = 1024
+
+# Arrays of a snapshot; row arrays are indexed by cache row, the others are the non-zero buffer
+SNAPSHOT_ARRAYS = ("ids", "digests", "starts", "lengths", "columns", "values")
+
+
+def entity_text(entity: Entity) -> str:
+    """Extract text representation from entity for embedding."""
+    parts = [entity.name]
+    if entity.description:
+        parts.append(entity.description)
+    return " ".join(parts)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+class TfidfModel:
+    """A fitted TF-IDF vocabulary that transforms texts without refitting."""
+
+    # The vocabulary only covers the entities it was fitted on
+    refits = True
+
+    def __init__(self, model_id: int, vocabulary: dict[str, int], idf: np.ndarray):
+        self.id = model_id
+        self.idf = idf
+        # Tells a snapshot of this vocabulary from one of a different database with the same model ID
+        self.fingerprint = hashlib.blake2b(
+            json.dumps(vocabulary, sort_keys=True, default=int).encode() + idf.tobytes(), digest_size=16
+        ).hexdigest()
+        # Same analysis as TfidfVectorizer; raw counts times IDF, L2-normalized, equal its transform
+        self._counter = (
+            CountVectorizer(vocabulary=vocabulary, stop_words="english", ngram_range=NGRAM_RANGE)
+            if vocabulary
+            else None
+        )
+
+    @property
+    def dimensions(self) -> int:
+        return len(self.idf)
+
+    def transform(self, texts: list[str]) -> sparse.csr_matrix:
+        """L2-normalized float32 TF-IDF rows of ``texts``."""
+        if self._counter is None:
+            return sparse.csr_matrix((len(texts), 0), dtype=np.float32)
+        counts = self._counter.transform(texts).multiply(self.idf)
+        return normalize(counts.tocsr()).astype(np.float32)
+
+    def weigh(self, rows: sparse.csr_matrix, document_counts: np.ndarray, documents: int) -> sparse.csr_matrix:
+        """Rows as read from the cache; they are weighted and normalized when transformed."""
+        return rows
+
+
+class HashingModel:
+    """Hashed term counts, which need no vocabulary and so never a refit.
+
+    Stored rows are raw counts; :meth:`weigh` applies IDF weights from the
+    cache's running document frequencies, and normalizes.
+    """
+
+    refits = False
+
+    def __init__(self, model_id: int, features: int, idf: bool):
+        self.id = model_id
+        self.features = features
+        self.use_idf = idf
+        self.fingerprint = hashlib.blake2b(f"hashing:{features}:{idf}".encode(), digest_size=16).hexdigest()
+        # Same analysis as the TF-IDF vocabulary
+        self._vectorizer = HashingVectorizer(
+            n_features=features,
+            stop_words="english",
+            ngram_range=NGRAM_RANGE,
+            alternate_sign=False,
+            norm=None,
+            dtype=np.float32,
+        )
+
+    @property
+    def dimensions(self) -> int:
+        return self.features
+
+    def transform(self, texts: list[str]) -> sparse.csr_matrix:
+        """Float32 hashed term counts of ``texts``."""
+        return self._vectorizer.transform(texts).tocsr()
+
+    def weigh(self, rows: sparse.csr_matrix, document_counts: np.ndarray, documents: int) -> sparse.csr_matrix:
+        """L2-normalized rows, times smoothed IDF weights of ``documents`` rows if enabled."""
+        if self.use_idf:
+            # As TfidfVectorizer(smooth_idf=True) computes them
+            idf = np.log((1 + documents) / (1 + document_counts)) + 1
+            rows = rows.multiply(idf.astype(np.float32)).tocsr()
+        return normalize(rows).astype(np.float32)
+
+
+def transform_texts(model: TfidfModel | HashingModel, texts: list[str], workers: int) -> sparse.csr_matrix:
+    """Transform ``texts``, in chunks across ``workers`` processes if there are at least ``PARALLEL_MIN_TEXTS``."""
+    if workers <= 1 or len(texts) < PARALLEL_MIN_TEXTS:
+        return model.transform(texts)
+    bounds = np.linspace(0, len(texts), workers + 1).astype(int)
+    chunks = [texts[start:end] for start, end in zip(bounds[:-1], bounds[1:], strict=True)]
+    # Spawn rather than fork: the server process has threads whose locks a fork would copy
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        return sparse.vstack(list(pool.map(model.transform, chunks)), format="csr")
+
+
+def fit_model(db: Session, texts: list[str]) -> TfidfModel:
+    """Fit and store a vocabulary for ``texts``."""
+    vectorizer = TfidfVectorizer(max_features=MAX_FEATURES, stop_words="english", ngram_range=NGRAM_RANGE)
+    try:
+        vectorizer.fit(texts)
+        vocabulary = {term: int(column) for term, column in vectorizer.vocabulary_.items()}
+        idf = vectorizer.idf_.astype(np.float64)
+    except ValueError:
+        # No usable terms, e.g. no entities or only stop words
+        vocabulary, idf = {}, np.zeros(0)
+    row = EmbeddingModel(backend="tfidf", vocabulary=vocabulary, idf=idf.tobytes(), entity_count=len(texts))
+    db.add(row)
+    db.flush()
+    return TfidfModel(row.id, vocabulary, idf)
+
+
+def create_model(db: Session, texts: list[str]) -> TfidfModel | HashingModel:
+    """Store a model of the configured backend, fitted on ``texts`` if it has a vocabulary."""
+    config = get_embedding_config()
+    if config["backend"] != "hashing":
+        return fit_model(db, texts)
+    parameters = {"features": config["hash_features"], "idf": config["hash_idf"]}
+    row = EmbeddingModel(backend="hashing", parameters=parameters, vocabulary={}, idf=b"", entity_count=len(texts))
+    db.add(row)
+    db.flush()
+    return HashingModel(row.id, **parameters)
+
+
+def is_configured(model: TfidfModel | HashingModel) -> bool:
+    """Whether ``model`` is of the configured backend and settings."""
+    config = get_embedding_config()
+    if config["backend"] == "hashing":
+        return isinstance(model, HashingModel) and (model.features, model.use_idf) == (
+            config["hash_features"],
+            config["hash_idf"],
+        )
+    return isinstance(model, TfidfModel)
+
+
+def load_model(db: Session) -> tuple[TfidfModel | HashingModel, int] | None:
+    """The newest stored model, and the number of entities it was created with."""
+    row = db.execute(select(EmbeddingModel).order_by(EmbeddingModel.id.desc()).limit(1)).scalar_one_or_none()
+    if row is None:
+        return None
+    if row.backend == "hashing":
+        return HashingModel(row.id, **row.parameters), row.entity_count
+    return TfidfModel(row.id, row.vocabulary, np.frombuffer(row.idf, dtype=np.float64)), row.entity_count
+
+
+class EmbeddingCache:
+    """All entity embeddings of the current vocabulary, resident in one sparse buffer.
+
+    Rows ``[0, size)`` belong to the entities in ``_ids``, with the hashes of
+    their texts in ``_digests``; deleted entities are swapped with the last
+    row. The non-zeros of each row are a slice of ``_columns`` and
+    ``_values``; a changed row is appended and its old slice left unused
+    until the buffer is compacted. After a snapshot is mapped, all of these
+    arrays are copy-on-write views of its files. ``_document_counts`` holds
+    the number of rows with a non-zero in each column.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal, snapshot_dir: str | None = None):
+        self.session_factory = session_factory
+        self.snapshot_dir = snapshot_dir
+        self._lock = threading.Lock()
+        self.model: TfidfModel | HashingModel | None = None
+        self._fitted_count = 0
+        self._snapshot_mtime: int | None = None
+        # IDs embedded or removed while a refresh reads the database, which it must not overwrite
+        self._touched: set[int] | None = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self._size = 0
+        self._ids = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self._digests = np.zeros(INITIAL_CAPACITY, dtype="S32")
+        self._starts = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self._lengths = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self._columns = np.zeros(INITIAL_CAPACITY, dtype=np.int32)
+        self._values = np.zeros(INITIAL_CAPACITY, dtype=np.float32)
+        self._used = 0
+        self._rows: dict[int, int] = {}
+        self._document_counts = np.zeros(self.model.dimensions if self.model else 0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _append(self, columns: np.ndarray, values: np.ndarray) -> int:
+        """Append a row's non-zeros to the buffer and return their start."""
+        end = self._used + len(columns)
+        if end > len(self._columns):
+            live = int(self._lengths[: self._size].sum())
+            if live + len(columns) <= len(self._columns) // 2:
+                self._compact()
+                end = self._used + len(columns)
+            else:
+                capacity = max(2 * len(self._columns), end)
+                self._columns = np.concatenate([self._columns, np.zeros(capacity - len(self._columns), np.int32)])
+                self._values = np.concatenate([self._values, np.zeros(capacity - len(self._values), np.float32)])
+        start = self._used
+        self._columns[start:end] = columns
+        self._values[start:end] = values
+        self._used = end
+        return start
+
+    def _compact(self) -> None:
+        """Drop the slices of replaced and removed rows."""
+        matrix = self._gather(np.arange(self._size))
+        self._columns[: matrix.nnz] = matrix.indices
+        self._values[: matrix.nnz] = matrix.data
+        self._starts[: self._size] = matrix.indptr[:-1]
+        self._used = matrix.nnz
+
+    def _set_row(self, entity_id: int, digest: str, columns: np.ndarray, values: np.ndarray) -> None:
+        row = self._rows.get(entity_id)
+        if row is None:
+            row = self._size
+            if row == len(self._ids):
+                self._ids, self._digests, self._starts, self._lengths = (
+                    np.concatenate([array, np.zeros_like(array)])
+                    for array in (self._ids, self._digests, self._starts, self._lengths)
+                )
+            self._ids[row] = entity_id
+            self._lengths[row] = 0
+            self._rows[entity_id] = row
+            self._size += 1
+        # Columns of a row are distinct, so counts can be updated with plain fancy indexing
+        start = self._starts[row]
+        self._document_counts[self._columns[start : start + self._lengths[row]]] -= 1
+        self._document_counts[columns] += 1
+        # Appended before the row points at it, so a compaction keeps the row's old slice
+        start = self._append(columns, values)
+        self._starts[row] = start
+        self._lengths[row] = len(columns)
+        self._digests[row] = digest
+        if self._touched is not None:
+            self._touched.add(entity_id)
+
+    def _gather(self, positions: np.ndarray) -> sparse.csr_matrix:
+        """CSR matrix of the rows at ``positions``, in that order."""
+        lengths = self._lengths[positions]
+        indptr = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        # Buffer offset of every non-zero: its row's start plus its position within the row
+        offsets = np.repeat(self._starts[positions] - indptr[:-1], lengths) + np.arange(indptr[-1])
+        return sparse.csr_matrix(
+            (self._values[offsets], self._columns[offsets], indptr), shape=(len(positions), self.model.dimensions)
+        )
+
+    def load(self) -> bool:
+        """Load the stored vocabulary and the embeddings of all entities.
+
+        Maps the snapshot if there is one for the stored vocabulary, and
+        returns True; :meth:`refresh` then picks up changes made since it
+        was written. Otherwise reads the embeddings from the database,
+        embeds entities whose text changed, writes a snapshot and returns
+        False. Fits a vocabulary if there is none.
+        """
+        with self._lock, self.session_factory() as db:
+            stored = load_model(db)
+            if stored is None or not is_configured(stored[0]):
+                texts = [entity_text(entity) for entity in db.execute(select(Entity.name, Entity.description))]
+                stored = create_model(db, texts), len(texts)
+                # Embeddings of another backend are never read again
+                db.execute(delete(EntityEmbedding).where(EntityEmbedding.model_id != stored[0].id))
+                db.commit()
+                logger.info(
+                    f"Created a {type(stored[0]).__name__} of {stored[0].dimensions} dimensions on {len(texts)} entities"
+                )
+            self.model, self._fitted_count = stored
+            if self._map_snapshot():
+                logger.info(f"Mapped the embedding snapshot of {self._size} entities")
+                return True
+
+            self._reset()
+            rows = db.execute(
+                select(
+                    EntityEmbedding.entity_id,
+                    EntityEmbedding.text_hash,
+                    EntityEmbedding.indices,
+                    EntityEmbedding.vector,
+                ).where(EntityEmbedding.model_id == self.model.id)
+            )
+            for entity_id, digest, indices, vector in rows:
+                values = np.frombuffer(vector, dtype=np.float32)
+                if indices is None:
+                    # Stored as a dense vector before embeddings were kept sparse
+                    columns = np.flatnonzero(values).astype(np.int32)
+                    values = values[columns]
+                else:
+                    columns = np.frombuffer(indices, dtype=np.int32)
+                self._set_row(entity_id, digest, columns, values)
+            self._embed_changed(db.execute(select(Entity.id, Entity.name, Entity.description)).all())
+            self._save_snapshot()
+            return False
+
+    def refresh(self) -> None:
+        """Embed entities whose text changed and drop deleted ones, e.g. since the snapshot was written.
+
+        Texts are read and hashed without holding the cache, so requests are
+        served meanwhile.
+        """
+        with self._lock:
+            self._touched = set()
+        try:
+            with self.session_factory() as db:
+                entities = db.execute(select(Entity.id, Entity.name, Entity.description)).all()
+            digests = [text_hash(entity_text(entity)) for entity in entities]
+        finally:
+            with self._lock:
+                touched, self._touched = self._touched, None
+        with self._lock:
+            # Entities embedded or removed since the texts were read are newer than them
+            current = [
+                (entity, digest) for entity, digest in zip(entities, digests, strict=True) if entity.id not in touched
+            ]
+            changed = self._embed_changed([entity for entity, _ in current], [digest for _, digest in current])
+            live = {entity.id for entity in entities} | touched
+            deleted = [entity_id for entity_id in self._rows if entity_id not in live]
+            for entity_id in deleted:
+                self._remove(entity_id)
+            if changed or deleted:
+                logger.info(f"Refreshed {changed} changed and {len(deleted)} deleted entity embeddings")
+                self._save_snapshot()
+
+    def _embed_changed(self, entities, digests: list[str] | None = None) -> int:
+        """Embed and store entities whose text hash differs from their row's; returns how many."""
+        if digests is None:
+            digests = [text_hash(entity_text(entity)) for entity in entities]
+        rows = self._rows
+        positions = np.fromiter((rows.get(entity.id, -1) for entity in entities), dtype=np.int64, count=len(entities))
+        stale = (positions < 0) | (self._digests[positions] != np.array(digests, dtype="S32"))
+        changed = [
+            (entity, digest) for entity, digest, is_stale in zip(entities, digests, stale, strict=True) if is_stale
+        ]
+        if not changed:
+            return 0
+        matrix = transform_texts(
+            self.model, [entity_text(entity) for entity, _ in changed], get_embedding_config()["workers"]
+        )
+        matrix.sort_indices()
+        rows = [
+            (entity.id, digest, matrix.indices[start:end], matrix.data[start:end])
+            for (entity, digest), start, end in zip(changed, matrix.indptr[:-1], matrix.indptr[1:], strict=True)
+        ]
+        self._store(rows)
+        for row in rows:
+            self._set_row(*row)
+        return len(rows)
+
+    def _store(self, rows: list[tuple[int, str, np.ndarray, np.ndarray]]) -> None:
+        entity_ids = [row[0] for row in rows]
+        with self.session_factory() as db:
+            for start in range(0, len(rows), STORE_CHUNK_SIZE):
+                chunk = entity_ids[start : start + STORE_CHUNK_SIZE]
+                db.execute(delete(EntityEmbedding).where(EntityEmbedding.entity_id.in_(chunk)))
+            db.execute(
+                insert(EntityEmbedding),
+                [
+                    {
+                        "entity_id": entity_id,
+                        "model_id": self.model.id,
+                        "text_hash": digest,
+                        "indices": columns.astype(np.int32).tobytes(),
+                        "vector": values.tobytes(),
+                    }
+                    for entity_id, digest, columns, values in rows
+                ],
+            )
+            db.commit()
+
+    def _save_snapshot(self) -> None:
+        """Write the cache as a new snapshot, and map it to share its pages."""
+        if self.snapshot_dir is None:
+            return
+        size = self._size
+        matrix = self._gather(np.arange(size))
+        # Room to double, so changes after mapping only copy the pages they write
+        rows, nonzeros = max(2 * size, INITIAL_CAPACITY), max(2 * matrix.nnz, INITIAL_CAPACITY)
+        manifest = {
+            "model_id": self.model.id,
+            "fingerprint": self.model.fingerprint,
+            "rows": size,
+            "nonzeros": matrix.nnz,
+        }
+        try:
+            generation = write_snapshot(
+                self.snapshot_dir,
+                manifest,
+                {
+                    "ids": (self._ids[:size], rows),
+                    "digests": (self._digests[:size], rows),
+                    "starts": (matrix.indptr[:-1], rows),
+                    "lengths": (np.diff(matrix.indptr), rows),
+                    "columns": (matrix.indices, nonzeros),
+                    "values": (matrix.data, nonzeros),
+                },
+            )
+        except OSError as e:
+            logger.warning(f"Could not write the embedding snapshot to {self.snapshot_dir}: {e}")
+            return
+        # Not whichever is current by now: another process may have written one without these rows
+        self._map_snapshot({**manifest, "generation": generation})
+
+    def _map_snapshot(self, manifest: dict | None = None) -> bool:
+        """Replace the buffers with the current snapshot's, or those of ``manifest``, if of the current vocabulary."""
+        if self.snapshot_dir is None:
+            return False
+        self._snapshot_mtime = manifest_mtime(self.snapshot_dir)
+        snapshot = read_snapshot(self.snapshot_dir, SNAPSHOT_ARRAYS, manifest)
+        written = snapshot.manifest if snapshot is not None else {}
+        if (written.get("model_id"), written.get("fingerprint")) != (self.model.id, self.model.fingerprint):
+            return False
+        arrays = snapshot.arrays
+        self._size = snapshot.manifest["rows"]
+        self._used = snapshot.manifest["nonzeros"]
+        self._ids, self._digests = arrays["ids"], arrays["digests"]
+        self._starts, self._lengths = arrays["starts"], arrays["lengths"]
+        self._columns, self._values = arrays["columns"], arrays["values"]
+        self._rows = dict(zip(self._ids[: self._size].tolist(), range(self._size), strict=True))
+        self._document_counts = np.bincount(
+            self._gather(np.arange(self._size)).indices, minlength=self.model.dimensions
+        ).astype(np.int64)
+        return True
+
+    def _follow_snapshot(self) -> None:
+        """Switch to a snapshot another process wrote after refitting the vocabulary."""
+        if self.snapshot_dir is None or manifest_mtime(self.snapshot_dir) == self._snapshot_mtime:
+            return
+        with self.session_factory() as db:
+            stored = load_model(db)
+        if stored is None or stored[0].id <= self.model.id:
+            self._snapshot_mtime = manifest_mtime(self.snapshot_dir)
+            return
+        previous = self.model, self._fitted_count
+        self.model, self._fitted_count = stored
+        if self._map_snapshot():
+            logger.info(f"Switched to the embedding snapshot of vocabulary {self.model.id}")
+        else:
+            self.model, self._fitted_count = previous
+
+    def _refit(self, entities: Sequence[Entity]) -> None:
+        texts = [entity_text(entity) for entity in entities]
+        with self.session_factory() as db:
+            model = fit_model(db, texts)
+            # Embeddings of older vocabularies are never read again; processes still using one
+            # store theirs under it, and those are re-embedded once this vocabulary is loaded
+            db.execute(delete(EntityEmbedding).where(EntityEmbedding.model_id != model.id))
+            db.commit()
+        logger.info(f"Refitted the embedding vocabulary with {model.dimensions} terms on {len(texts)} entities")
+        self.model, self._fitted_count = model, len(texts)
+        self._reset()
+
+    def embed(self, entities: Sequence[Entity]) -> sparse.csr_matrix:
+        """Embeddings of ``entities`` as CSR rows, one each.
+
+        Only entities without an embedding are transformed; text changes are
+        picked up by :meth:`update`, :meth:`load` and :meth:`refresh`. Pass all
+        entities: the vocabulary is refitted when they have outgrown it.
+        """
+        with self._lock:
+            self._follow_snapshot()
+            refit = self.model.refits and len(entities) >= REFIT_GROWTH * max(self._fitted_count, 1)
+            if refit:
+                self._refit(entities)
+            rows = self._rows
+            missing = [entity for entity in entities if entity.id not in rows]
+            if missing:
+                self._embed_changed(missing)
+            if refit:
+                self._save_snapshot()
+                rows = self._rows
+            positions = np.fromiter((rows[entity.id] for entity in entities), dtype=np.int64, count=len(entities))
+            return self.model.weigh(self._gather(positions), self._document_counts, self._size)
+
+    def update(self, entity: Entity) -> None:
+        """Embed a created or changed entity if its text changed."""
+        with self._lock:
+            self._embed_changed([entity])
+
+    def _remove(self, entity_id: int) -> None:
+        row = self._rows.pop(entity_id)
+        start = self._starts[row]
+        self._document_counts[self._columns[start : start + self._lengths[row]]] -= 1
+        last = self._size - 1
+        if row != last:
+            for array in (self._ids, self._digests, self._starts, self._lengths):
+                array[row] = array[last]
+            self._rows[int(self._ids[row])] = row
+        self._size = last
+
+    def remove(self, entity_id: int) -> None:
+        """Drop a deleted entity's row; its stored embedding is deleted with the entity."""
+        with self._lock:
+            if self._touched is not None:
+                self._touched.add(entity_id)
+            if entity_id in self._rows:
+                self._remove(entity_id)
+
+
+def delete_embedding(db: Session, entity_id: int) -> None:
+    """Delete an entity's stored embedding; SQLite does not enforce the cascade by default."""
+    db.execute(delete(EntityEmbedding).where(EntityEmbedding.entity_id == entity_id))
+
+
+# One cache per database: entities of different databases share IDs
+_caches: dict[Engine, EmbeddingCache] = {}
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache(bind: Engine = engine) -> EmbeddingCache | None:
+    """Get the process-wide embedding cache of a database, or None if it has not been loaded."""
+    return _caches.get(bind)
+
+
+def load_embedding_cache(bind: Engine = engine) -> EmbeddingCache:
+    """Load the process-wide embedding cache of a database if it has not been loaded yet.
+
+    Only the application database's cache is shared through the snapshot
+    directory; caches of other databases, e.g. a library user's, are private.
+    """
+    with _cache_lock:
+        cache = _caches.get(bind)
+        if cache is None:
+            if bind is engine:
+                cache = EmbeddingCache(snapshot_dir=get_embedding_snapshot_dir())
+            else:
+                cache = EmbeddingCache(sessionmaker(autocommit=False, autoflush=False, bind=bind))
+            if cache.load():
+                threading.Thread(target=cache.refresh, name="embedding-refresh", daemon=True).start()
+            _caches[bind] = cache
+    return cache
@@ -1,23 +1,64 @@
-from fastapi import APIRouter, Depends, Query
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Query, Response
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
-from .config import get_elo_initial_rating
+from .autocomplete import get_autocomplete_index, load_autocomplete_index
+from .config import get_elo_initial_rating, get_glicko_config
 from .database import get_db
-from .errors import handle_database_error, handle_not_found
-from .models import Entity, EntityCreate, EntityOut, EntityUpdate, MessageResponse
+from .embeddings import delete_embedding, get_embedding_cache
+from .errors import handle_database_error, handle_not_found, handle_validation_error
+from .history import discard_checkpoints, first_comparison_at
+from .leaderboard import bump_ratings_version
+from .models import (
+    Entity,
+    EntityCreate,
+    EntityLookup,
+    EntityLookupOut,
+    EntityOut,
+    EntityRankOut,
+    EntitySuggestion,
+    EntityUpdate,
+    MessageResponse,
+)
+from .ranking import (
+    format_rating_cursor,
+    get_rank_summary,
+    get_rating_and_rank,
+    leaderboard_page_query,
+    parse_rating_cursor,
+)
+from .rating_store import get_rating_store
+from .search import search_by_relevance, search_condition
 
 router = APIRouter()
 
+# Maximum number of IDs accepted by one lookup request; SQLite allows 32,766 bound parameters
+MAX_LOOKUP_SIZE = 10_000
+
 
 @router.post("/entities/", response_model=EntityOut)
 def create_entity(entity: EntityCreate, db: Session = Depends(get_db)):
     """Create a new entity"""
     try:
-        db_entity = Entity(**entity.model_dump(), rating=get_elo_initial_rating())
+        glicko = get_glicko_config()
+        db_entity = Entity(
+            **entity.model_dump(),
+            rating=get_elo_initial_rating(),
+            rating_deviation=glicko["initial_deviation"],
+            volatility=glicko["initial_volatility"],
+        )
         db.add(db_entity)
         db.commit()
+        bump_ratings_version()
         db.refresh(db_entity)
+        index = get_autocomplete_index()
+        if index is not None:
+            index.add(db_entity.id, db_entity.name, db_entity.rating)
+        embeddings = get_embedding_cache(db.get_bind())
+        if embeddings is not None:
+            embeddings.update(db_entity)
         return db_entity
     except SQLAlchemyError as e:
         db.rollback()
@@ -26,25 +67,75 @@ def create_entity(entity: EntityCreate, db: Session = Depends(get_db)):
 
 @router.get("/entities/", response_model=list[EntityOut])
 def list_entities(
+    response: Response,
     skip: int = Query(0, ge=0, description="Number of entities to skip"),
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of entities to return"),
     search: str | None = Query(None, description="Search in entity names and descriptions"),
+    order: Literal["rating", "relevance"] = Query("rating", description="Sort by rating, or by search relevance"),
+    after: str | None = Query(None, description="Cursor from X-Next-Cursor: return entities after it"),
     db: Session = Depends(get_db),
 ):
-    """Get list of entities with optional search and pagination"""
+    """Get list of entities with optional search and pagination
+
+    Entities are ordered by rating, or with ``order=relevance`` by how well
+    they match ``search``. Pass the ``X-Next-Cursor`` header of a page as
+    ``after`` to get the next one; unlike ``skip``, a cursor seeks straight to
+    its position in the ``(rating, id)`` index.
+    """
+    if order == "relevance" and (not search or after):
+        handle_validation_error("order=relevance requires search and cannot be combined with after")
     try:
-        query = db.query(Entity)
-
-        if search:
-            search_term = f"%{search}%"
-            query = query.filter((Entity.name.ilike(search_term)) | (Entity.description.ilike(search_term)))
-
-        entities = query.order_by(Entity.rating.desc()).offset(skip).limit(limit).all()
+        if order == "relevance":
+            return search_by_relevance(db, search).offset(skip).limit(limit).all()
+
+        criteria = [search_condition(db, search)] if search else []
+        cursor = parse_rating_cursor(after) if after else None
+        entities = leaderboard_page_query(db, limit, cursor, *criteria).offset(skip).all()
+        if len(entities) == limit:
+            response.headers["X-Next-Cursor"] = format_rating_cursor(entities[-1])
         return entities
     except SQLAlchemyError as e:
         handle_database_error(e, "list entities")
 
 
+@router.post("/entities/lookup", response_model=EntityLookupOut)
+def lookup_entities(lookup: EntityLookup, db: Session = Depends(get_db)):
+    """Get many entities by ID with a single query
+
+    Entities are returned in the order of their first occurrence in ``ids``;
+    IDs without an entity are listed in ``missing``.
+    """
+    if len(lookup.ids) > MAX_LOOKUP_SIZE:
+        handle_validation_error(f"Cannot look up more than {MAX_LOOKUP_SIZE} entities per request")
+    try:
+        ids = list(dict.fromkeys(lookup.ids))
+        found = {entity.id: entity for entity in db.query(Entity).filter(Entity.id.in_(ids))} if ids else {}
+        return {
+            "entities": [found[entity_id] for entity_id in ids if entity_id in found],
+            "missing": [entity_id for entity_id in ids if entity_id not in found],
+        }
+    except SQLAlchemyError as e:
+        handle_database_error(e, "look up entities")
+
+
+@router.get("/entities/autocomplete", response_model=list[EntitySuggestion])
+def autocomplete_entities(
+    prefix: str = Query(..., min_length=1, max_length=200, description="Start of a word in the entity name"),
+    limit: int = Query(10, ge=1, le=100, description="Maximum number of suggestions to return"),
+    db: Session = Depends(get_db),
+):
+    """Suggest entities whose name has a word starting with ``prefix``, highest rated first
+
+    Served from an in-memory index of names; the ratings it ranks by are
+    reloaded every ``AUTOCOMPLETE_REFRESH_INTERVAL`` seconds.
+    """
+    try:
+        index = get_autocomplete_index() or load_autocomplete_index(db)
+        return index.complete(prefix, limit)
+    except SQLAlchemyError as e:
+        handle_database_error(e, "autocomplete entities")
+
+
 @router.get("/entities/{entity_id}", response_model=EntityOut)
 def get_entity(entity_id: int, db: Session = Depends(get_db)):
     """Get a single entity by ID"""
@@ -52,11 +143,24 @@ def get_entity(entity_id: int, db: Session = Depends(get_db)):
         db_entity = db.query(Entity).filter(Entity.id == entity_id).first()
         if db_entity is None:
             handle_not_found("Entity", entity_id)
-        return db_entity
+        rating, rank = get_rating_and_rank(db, db_entity)
+        return EntityOut.model_validate(db_entity).model_copy(update={"rating": rating, "rank": rank})
     except SQLAlchemyError as e:
         handle_database_error(e, "get entity")
 
 
+@router.get("/entities/{entity_id}/rank", response_model=EntityRankOut)
+def get_entity_rank(entity_id: int, db: Session = Depends(get_db)):
+    """Get an entity's leaderboard rank and percentile without loading the leaderboard"""
+    try:
+        db_entity = db.query(Entity).filter(Entity.id == entity_id).first()
+        if db_entity is None:
+            handle_not_found("Entity", entity_id)
+        return get_rank_summary(db, db_entity)
+    except SQLAlchemyError as e:
+        handle_database_error(e, "get entity rank")
+
+
 @router.put("/entities/{entity_id}", response_model=EntityOut)
 def update_entity(entity_id: int, entity_update: EntityUpdate, db: Session = Depends(get_db)):
     """Update an existing entity"""
@@ -70,7 +174,14 @@ def update_entity(entity_id: int, entity_update: EntityUpdate, db: Session = Dep
             setattr(db_entity, field, value)
 
         db.commit()
+        bump_ratings_version()
         db.refresh(db_entity)
+        index = get_autocomplete_index()
+        if index is not None and "name" in update_data:
+            index.add(db_entity.id, db_entity.name, db_entity.rating)
+        embeddings = get_embedding_cache(db.get_bind())
+        if embeddings is not None and update_data.keys() & {"name", "description"}:
+            embeddings.update(db_entity)
         return db_entity
     except SQLAlchemyError as e:
         db.rollback()
@@ -85,8 +196,24 @@ def delete_entity(entity_id: int, db: Session = Depends(get_db)):
         if db_entity is None:
             handle_not_found("Entity", entity_id)
 
+        # Rating history checkpoints after this entity's first comparison include
+        # comparisons that replays now skip
+        first_compared_at = first_comparison_at(db, entity_id)
+        delete_embedding(db, entity_id)
         db.delete(db_entity)
+        if first_compared_at is not None:
+            discard_checkpoints(db, since=first_compared_at)
         db.commit()
+        store = get_rating_store()
+        if store is not None:
+            store.remove(entity_id)
+        index = get_autocomplete_index()
+        if index is not None:
+            index.remove(entity_id)
+        embeddings = get_embedding_cache(db.get_bind())
+        if embeddings is not None:
+            embeddings.remove(entity_id)
+        bump_ratings_version()
         return {"message": "Entity deleted successfully"}
     except SQLAlchemyError as e:
         db.rollback()
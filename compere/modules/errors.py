@@ -63,6 +63,18 @@ def handle_validation_error(message: str) -> None:
     raise HTTPException(status_code=400, detail=message)
 
 
+def handle_conflict(message: str) -> None:
+    """Handle conflicts with concurrent modifications.
+
+    Args:
+        message: Description of the conflict
+
+    Raises:
+        HTTPException: Always raises with 409 status code
+    """
+    raise HTTPException(status_code=409, detail=message)
+
+
 def handle_insufficient_data(message: str) -> None:
     """Handle errors when there's insufficient data for an operation.
 
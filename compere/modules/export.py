@@ -0,0 +1,148 @@
+"""
+Streaming export of comparisons as preference data (chosen/rejected pairs).
+"""
+
+import csv
+import io
+import json
+import zlib
+from collections.abc import Iterator
+from datetime import datetime
+from typing import Literal
+
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import case, select
+from sqlalchemy.orm import aliased
+
+from .database import SessionLocal
+from .history import as_utc
+from .models import Comparison, Entity
+
+router = APIRouter()
+
+# Rows fetched from the database cursor per batch
+EXPORT_BATCH_SIZE = 5_000
+
+EXPORT_FIELDS = [
+    "comparison_id",
+    "created_at",
+    "chosen_id",
+    "chosen_name",
+    "chosen_description",
+    "rejected_id",
+    "rejected_name",
+    "rejected_description",
+]
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def preference_query(since: datetime | None = None, since_id: int | None = None):
+    """Select comparisons as chosen/rejected pairs with the text of both entities.
+
+    Self-comparisons carry no preference and are left out.
+    """
+    chosen = aliased(Entity)
+    rejected = aliased(Entity)
+    rejected_id = case(
+        (Comparison.selected_entity_id == Comparison.entity1_id, Comparison.entity2_id),
+        else_=Comparison.entity1_id,
+    )
+    stmt = (
+        select(
+            Comparison.id,
+            Comparison.created_at,
+            chosen.id,
+            chosen.name,
+            chosen.description,
+            rejected.id,
+            rejected.name,
+            rejected.description,
+        )
+        .join(chosen, chosen.id == Comparison.selected_entity_id)
+        .join(rejected, rejected.id == rejected_id)
+        .where(Comparison.entity1_id != Comparison.entity2_id)
+        .order_by(Comparison.id)
+    )
+    if since is not None:
+        stmt = stmt.where(Comparison.created_at >= as_utc(since))
+    if since_id is not None:
+        stmt = stmt.where(Comparison.id > since_id)
+    return stmt
+
+
+def iter_preference_rows(
+    since: datetime | None = None, since_id: int | None = None, batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator[list[dict]]:
+    """Yield batches of export rows from a server-side cursor.
+
+    Uses its own session, since the response is streamed after the request
+    handler has returned.
+    """
+    stmt = preference_query(since, since_id).execution_options(yield_per=batch_size)
+    with SessionLocal() as db:
+        for partition in db.execute(stmt).partitions():
+            rows = []
+            for row in partition:
+                record = dict(zip(EXPORT_FIELDS, row, strict=True))
+                if record["created_at"] is not None:
+                    record["created_at"] = record["created_at"].isoformat()
+                rows.append(record)
+            yield rows
+
+
+def encode_ndjson(batches: Iterator[list[dict]]) -> Iterator[str]:
+    for rows in batches:
+        yield "".join(json.dumps(row) + "\n" for row in rows)
+
+
+def encode_csv(batches: Iterator[list[dict]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def gzip_chunks(chunks: Iterator[str]) -> Iterator[bytes]:
+    """Compress text chunks into a single gzip stream."""
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode())
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+@router.get("/export/comparisons")
+def export_comparisons(
+    format: Literal["ndjson", "csv"] = Query("ndjson", description="Output format: ndjson or csv"),
+    gzip: bool = Query(False, description="Compress the output with gzip"),
+    since: datetime | None = Query(None, description="Only comparisons created at or after this time"),
+    since_id: int | None = Query(None, description="Only comparisons with an ID greater than this"),
+) -> StreamingResponse:
+    """Export comparisons as chosen/rejected preference pairs for reward-model training.
+
+    Rows are streamed in comparison ID order from a server-side cursor, so
+    memory use stays constant regardless of the number of comparisons. For
+    incremental exports, pass the last exported ``comparison_id`` as
+    ``since_id``.
+    """
+    encoder = encode_csv if format == "csv" else encode_ndjson
+    body = encoder(iter_preference_rows(since, since_id))
+    filename = f"comparisons.{format}"
+    media_type = MEDIA_TYPES[format]
+    if gzip:
+        body = gzip_chunks(body)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,216 @@
+"""
+Glicko-2 ratings with batched rating-period updates.
+
+Unlike Elo, Glicko-2 tracks how certain each rating is (the rating deviation)
+and how erratic an entity's results are (the volatility). Comparisons are
+collected into rating periods and all entities are updated together when a
+period is closed.
+
+Reference: Glickman, "Example of the Glicko-2 system" (2013).
+"""
+
+import logging
+
+import numpy as np
+from scipy.special import expit
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import Session
+
+from .config import get_elo_initial_rating, get_glicko_config
+from .leaderboard import bump_ratings_version
+from .models import Comparison, Entity, RatingPeriod
+from .replay import map_comparisons
+
+logger = logging.getLogger(__name__)
+
+# Conversion factor between the Glicko and Glicko-2 scales
+GLICKO2_SCALE = 173.7178
+
+# Convergence tolerance and iteration cap for the volatility search
+VOLATILITY_TOLERANCE = 1e-6
+VOLATILITY_MAX_ITER = 100
+
+# Number of comparisons fetched per chunk when closing a period
+DEFAULT_CHUNK_SIZE = 50_000
+
+
+def _g(phi: np.ndarray) -> np.ndarray:
+    """Reduce the impact of a game by the opponent's rating deviation."""
+    return 1.0 / np.sqrt(1.0 + 3.0 * phi**2 / np.pi**2)
+
+
+def _new_volatility(phi: np.ndarray, sigma: np.ndarray, v: np.ndarray, delta: np.ndarray, tau: float) -> np.ndarray:
+    """Solve for the new volatility of every player at once (Illinois algorithm)."""
+    a = np.log(sigma**2)
+    phi2 = phi**2
+    delta2 = delta**2
+
+    def f(x):
+        ex = np.exp(x)
+        return ex * (delta2 - phi2 - v - ex) / (2.0 * (phi2 + v + ex) ** 2) - (x - a) / tau**2
+
+    # Bracket the root
+    upper = delta2 > phi2 + v
+    b = np.where(upper, np.log(np.where(upper, delta2 - phi2 - v, 1.0)), a - tau)
+    lower = ~upper
+    for _ in range(VOLATILITY_MAX_ITER):
+        lower &= f(b) < 0
+        if not lower.any():
+            break
+        b[lower] -= tau
+
+    fa, fb = f(a), f(b)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for _ in range(VOLATILITY_MAX_ITER):
+            active = np.abs(b - a) > VOLATILITY_TOLERANCE
+            if not active.any():
+                break
+            c = a + (a - b) * fa / (fb - fa)
+            fc = f(c)
+            flip = fc * fb <= 0
+            a = np.where(active & flip, b, a)
+            fa = np.where(active, np.where(flip, fb, fa / 2.0), fa)
+            b = np.where(active, c, b)
+            fb = np.where(active, fc, fb)
+
+    return np.exp(a / 2.0)
+
+
+def glicko2_update(
+    mu: np.ndarray,
+    phi: np.ndarray,
+    sigma: np.ndarray,
+    idx1: np.ndarray,
+    idx2: np.ndarray,
+    score1: np.ndarray,
+    tau: float,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Apply one Glicko-2 rating period to all players.
+
+    All arrays are on the Glicko-2 scale. Every game is scored against the
+    ratings at the start of the period, so the whole period is a single
+    vectorized pass: per-player sums are accumulated with ``bincount`` and the
+    volatility equation is solved for all players together. Players without a
+    game in the period only have their deviation widened.
+
+    Args:
+        mu: Ratings
+        phi: Rating deviations
+        sigma: Volatilities
+        idx1: Index of the first player of each game
+        idx2: Index of the second player of each game
+        score1: Score of the first player (1 win, 0 loss, 0.5 draw)
+        tau: System constant constraining volatility changes
+
+    Returns:
+        Tuple of updated ``(mu, phi, sigma)`` arrays
+    """
+    n = len(mu)
+    g1 = _g(phi[idx2])
+    g2 = _g(phi[idx1])
+    e1 = expit(g1 * (mu[idx1] - mu[idx2]))
+    e2 = expit(g2 * (mu[idx2] - mu[idx1]))
+
+    information = np.bincount(idx1, g1**2 * e1 * (1.0 - e1), n) + np.bincount(idx2, g2**2 * e2 * (1.0 - e2), n)
+    improvement = np.bincount(idx1, g1 * (score1 - e1), n) + np.bincount(idx2, g2 * ((1.0 - score1) - e2), n)
+    played = information > 0
+
+    new_mu = mu.copy()
+    new_sigma = sigma.copy()
+    new_phi = np.sqrt(phi**2 + sigma**2)
+
+    if played.any():
+        v = 1.0 / information[played]
+        delta = v * improvement[played]
+        new_sigma[played] = _new_volatility(phi[played], sigma[played], v, delta, tau)
+        phi_star = np.sqrt(phi[played] ** 2 + new_sigma[played] ** 2)
+        new_phi[played] = 1.0 / np.sqrt(1.0 / phi_star**2 + information[played])
+        new_mu[played] = mu[played] + new_phi[played] ** 2 * improvement[played]
+
+    return new_mu, new_phi, new_sigma
+
+
+def close_rating_period(db: Session, chunk_size: int = DEFAULT_CHUNK_SIZE) -> RatingPeriod:
+    """Close the current rating period and update every entity.
+
+    The period covers all comparisons recorded since the previous period was
+    closed. Ratings, deviations and volatilities of all entities are written
+    back with a single bulk statement.
+
+    Args:
+        db: Database session
+        chunk_size: Number of comparisons to fetch per chunk
+
+    Returns:
+        The closed rating period
+    """
+    glicko = get_glicko_config()
+    center = get_elo_initial_rating()
+
+    start_id = db.query(func.max(RatingPeriod.last_comparison_id)).scalar() or 0
+    end_id = db.query(func.max(Comparison.id)).scalar() or start_id
+
+    rows = db.query(Entity.id, Entity.rating, Entity.rating_deviation, Entity.volatility).order_by(Entity.id).all()
+    entity_ids = np.asarray([row[0] for row in rows], dtype=np.int64)
+    rating = np.asarray([center if row[1] is None else row[1] for row in rows], dtype=np.float64)
+    deviation = np.asarray(
+        [glicko["initial_deviation"] if row[2] is None else row[2] for row in rows], dtype=np.float64
+    )
+    volatility = np.asarray(
+        [glicko["initial_volatility"] if row[3] is None else row[3] for row in rows], dtype=np.float64
+    )
+
+    stmt = (
+        select(Comparison.entity1_id, Comparison.entity2_id, Comparison.selected_entity_id)
+        .where(Comparison.id > start_id, Comparison.id <= end_id)
+        .execution_options(stream_results=True)
+    )
+    chunks = [map_comparisons(entity_ids, partition) for partition in db.execute(stmt).partitions(chunk_size)]
+    if chunks:
+        idx1, idx2, score1 = (np.concatenate(parts) for parts in zip(*chunks, strict=True))
+    else:
+        idx1 = idx2 = np.empty(0, dtype=np.int64)
+        score1 = np.empty(0, dtype=np.float64)
+
+    mu, phi, sigma = glicko2_update(
+        (rating - center) / GLICKO2_SCALE,
+        deviation / GLICKO2_SCALE,
+        volatility,
+        idx1,
+        idx2,
+        score1,
+        glicko["tau"],
+    )
+
+    if len(entity_ids):
+        table = Entity.__table__
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .values(
+                rating=bindparam("b_rating"),
+                rating_deviation=bindparam("b_deviation"),
+                volatility=bindparam("b_volatility"),
+                version=table.c.version + 1,
+            )
+        )
+        db.execute(
+            stmt,
+            [
+                {"b_id": int(i), "b_rating": float(r), "b_deviation": float(d), "b_volatility": float(s)}
+                for i, r, d, s in zip(entity_ids, center + GLICKO2_SCALE * mu, GLICKO2_SCALE * phi, sigma, strict=True)
+            ],
+        )
+
+    period = RatingPeriod(
+        last_comparison_id=end_id,
+        comparison_count=len(idx1),
+        entity_count=len(np.union1d(idx1, idx2)),
+    )
+    db.add(period)
+    db.commit()
+    bump_ratings_version()
+    db.refresh(period)
+
+    logger.info(f"Closed rating period {period.id}: {period.comparison_count} comparisons")
+    return period
@@ -0,0 +1,173 @@
+"""
+Rating history: rebuild the Elo leaderboard as it was at any point in time.
+
+Ratings at time ``T`` are the result of replaying every comparison made up to
+``T``. To avoid replaying from the first comparison, the replay saves a
+checkpoint of all ratings every ``RATING_CHECKPOINT_INTERVAL`` comparisons
+and later queries start from the nearest checkpoint at or before ``T``. The
+comparisons after it are the per-vote deltas: each one determines its
+rating change from the ratings before it, so they are not stored separately.
+
+Checkpoints are built lazily by the queries themselves, so a query replays at
+most one interval of comparisons once the history up to ``T`` has been
+visited. They are only valid for the K-factor and initial rating they were
+built with. Deleting an entity discards the checkpoints from its first
+comparison on, importing comparisons into the past discards those from the
+earliest imported one, and no checkpoint is placed after the oldest vote still
+waiting in the queue, which is applied with its submission time.
+"""
+
+import logging
+import zlib
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import Session
+
+from .config import get_elo_initial_rating, get_elo_k_factor, get_rating_checkpoint_interval
+from .models import Comparison, PendingVote, RatingCheckpoint
+from .replay import DEFAULT_CHUNK_SIZE, apply_elo_sequence, index_of, load_entity_index, map_comparisons
+
+logger = logging.getLogger(__name__)
+
+# Comparisons younger than this may still be joined by queued or in-flight
+# votes with an earlier timestamp, so no checkpoint is placed after them
+CHECKPOINT_MIN_AGE = timedelta(minutes=5)
+
+
+def as_utc(timestamp: datetime) -> datetime:
+    """Treat naive timestamps as UTC, as they are stored."""
+    return timestamp.astimezone(UTC) if timestamp.tzinfo else timestamp.replace(tzinfo=UTC)
+
+
+def encode_array(array: np.ndarray) -> bytes:
+    return zlib.compress(array.tobytes())
+
+
+def decode_array(data: bytes, dtype: type) -> np.ndarray:
+    return np.frombuffer(zlib.decompress(data), dtype=dtype)
+
+
+def nearest_checkpoint(db: Session, as_of: datetime, k_factor: float, initial_rating: float) -> RatingCheckpoint | None:
+    """Latest checkpoint at or before ``as_of`` built with the given parameters."""
+    stmt = (
+        select(RatingCheckpoint)
+        .where(
+            RatingCheckpoint.created_at <= as_of,
+            RatingCheckpoint.k_factor == k_factor,
+            RatingCheckpoint.initial_rating == initial_rating,
+        )
+        .order_by(RatingCheckpoint.comparison_count.desc())
+        .limit(1)
+    )
+    return db.execute(stmt).scalars().first()
+
+
+def ratings_as_of(
+    db: Session,
+    as_of: datetime,
+    k_factor: float | None = None,
+    initial_rating: float | None = None,
+    interval: int | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> dict[int, float]:
+    """Elo rating of every current entity after the comparisons made up to ``as_of``.
+
+    Starts from the nearest checkpoint and replays the comparisons after it
+    in ``(created_at, id)`` order, saving a new checkpoint every ``interval``
+    comparisons on the way. Entities are not timestamped, so entities created
+    after ``as_of`` are included with the initial rating.
+
+    Args:
+        db: Database session
+        as_of: Point in time; naive timestamps are taken as UTC
+        k_factor: Elo K-factor (defaults to ELO_K_FACTOR)
+        initial_rating: Starting rating (defaults to ELO_INITIAL_RATING)
+        interval: Comparisons between checkpoints (defaults to RATING_CHECKPOINT_INTERVAL)
+        chunk_size: Number of comparisons to fetch per chunk
+    """
+    if k_factor is None:
+        k_factor = get_elo_k_factor()
+    if initial_rating is None:
+        initial_rating = get_elo_initial_rating()
+    if interval is None:
+        interval = get_rating_checkpoint_interval()
+    as_of = as_utc(as_of)
+    checkpoint_before = min(as_of, datetime.now(UTC) - CHECKPOINT_MIN_AGE)
+    oldest_pending = db.query(func.min(PendingVote.created_at)).scalar()
+    if oldest_pending is not None:
+        checkpoint_before = min(checkpoint_before, as_utc(oldest_pending))
+
+    entity_ids = load_entity_index(db)
+    ratings = np.full(len(entity_ids), initial_rating, dtype=np.float64)
+    stmt = select(
+        Comparison.id,
+        Comparison.created_at,
+        Comparison.entity1_id,
+        Comparison.entity2_id,
+        Comparison.selected_entity_id,
+    ).where(Comparison.created_at <= as_of)
+    count = 0
+
+    checkpoint = nearest_checkpoint(db, as_of, k_factor, initial_rating)
+    if checkpoint is not None:
+        idx, found = index_of(entity_ids, decode_array(checkpoint.entity_ids, np.int64))
+        ratings[idx[found]] = decode_array(checkpoint.ratings, np.float64)[found]
+        count = checkpoint.comparison_count
+        # Compare against the stored timestamp, which may be formatted differently
+        stored = select(Comparison.created_at).where(Comparison.id == checkpoint.last_comparison_id).scalar_subquery()
+        position = tuple_(func.coalesce(stored, checkpoint.created_at), checkpoint.last_comparison_id)
+        stmt = stmt.where(tuple_(Comparison.created_at, Comparison.id) > position)
+
+    stmt = stmt.order_by(Comparison.created_at, Comparison.id).execution_options(stream_results=True)
+    checkpoints = []
+    for partition in db.execute(stmt).partitions(chunk_size):
+        start = 0
+        while start < len(partition):
+            rows = partition[start : start + interval - count % interval]
+            idx1, idx2, score1 = map_comparisons(entity_ids, [row[2:] for row in rows])
+            apply_elo_sequence(ratings, idx1, idx2, score1, k_factor)
+            count += len(rows)
+            start += len(rows)
+            last_id, last_created_at = rows[-1][:2]
+            if count % interval == 0 and as_utc(last_created_at) <= checkpoint_before:
+                checkpoints.append(
+                    RatingCheckpoint(
+                        created_at=last_created_at,
+                        last_comparison_id=last_id,
+                        comparison_count=count,
+                        k_factor=k_factor,
+                        initial_rating=initial_rating,
+                        entity_ids=encode_array(entity_ids),
+                        ratings=encode_array(ratings),
+                    )
+                )
+
+    if checkpoints:
+        db.add_all(checkpoints)
+        db.commit()
+        logger.info(f"Saved {len(checkpoints)} rating checkpoints up to comparison {count}")
+
+    return dict(zip(entity_ids.tolist(), ratings.tolist(), strict=True))
+
+
+def first_comparison_at(db: Session, entity_id: int) -> datetime | None:
+    """Time of the entity's earliest comparison, or None if it has none."""
+    times = [
+        db.query(func.min(Comparison.created_at)).filter(column == entity_id).scalar()
+        for column in (Comparison.entity1_id, Comparison.entity2_id)
+    ]
+    return min((as_utc(t) for t in times if t is not None), default=None)
+
+
+def discard_checkpoints(db: Session, since: datetime | None = None) -> int:
+    """Delete checkpoints that include comparisons made at or after ``since``, or all of them.
+
+    Call this whenever the history before existing checkpoints changes. Does
+    not commit.
+    """
+    query = db.query(RatingCheckpoint)
+    if since is not None:
+        query = query.filter(RatingCheckpoint.created_at >= as_utc(since))
+    return query.delete(synchronize_session=False)
@@ -0,0 +1,203 @@
+"""
+Streaming import of historical comparisons from NDJSON or CSV.
+
+Records flow through a generator pipeline (lines -> parsed records -> fixed
+size chunks -> bulk insert), so memory stays flat regardless of file size.
+Ratings are recomputed once at the end instead of after every comparison.
+"""
+
+import csv
+import io
+import json
+import logging
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import nullcontext
+from datetime import UTC, datetime
+from itertools import islice
+from typing import IO, Literal
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from .config import get_rating_engine
+from .history import discard_checkpoints
+from .leaderboard import bump_ratings_version
+from .models import Comparison, ComparisonCreate, Entity
+from .rating_store import get_rating_store
+from .replay import replay_elo_ratings
+
+logger = logging.getLogger(__name__)
+
+ImportFormat = Literal["ndjson", "csv"]
+
+# Number of comparisons validated and inserted per transaction
+DEFAULT_CHUNK_SIZE = 10_000
+
+# Maximum number of individual error messages kept in the summary
+MAX_REPORTED_ERRORS = 100
+
+# A parsed line: line number plus the comparison and its timestamp, or an error message
+ParsedRecord = tuple[int, ComparisonCreate | None, datetime | None, str | None]
+
+
+def parse_record(line_number: int, record: dict) -> ParsedRecord:
+    """Validate one raw record, with an optional ISO-8601 ``created_at``."""
+    try:
+        comparison = ComparisonCreate.model_validate(record)
+    except ValidationError as e:
+        fields = ", ".join(".".join(str(part) for part in error["loc"]) for error in e.errors())
+        return line_number, None, None, f"line {line_number}: invalid or missing {fields}"
+
+    created_at = record.get("created_at")
+    if created_at:
+        try:
+            created_at = datetime.fromisoformat(created_at)
+        except (TypeError, ValueError):
+            return line_number, None, None, f"line {line_number}: invalid created_at {created_at!r}"
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=UTC)
+    return line_number, comparison, created_at or None, None
+
+
+def parse_ndjson(lines: Iterable[str]) -> Iterator[ParsedRecord]:
+    """Parse newline-delimited JSON objects, skipping blank lines."""
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, None, None, f"line {line_number}: invalid JSON ({e.msg})"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, None, f"line {line_number}: expected a JSON object"
+            continue
+        yield parse_record(line_number, record)
+
+
+def parse_csv(lines: Iterable[str]) -> Iterator[ParsedRecord]:
+    """Parse CSV rows with a header naming the comparison fields."""
+    reader = csv.DictReader(lines)
+    for record in reader:
+        # The header is line 1
+        yield parse_record(reader.line_num, record)
+
+
+PARSERS: dict[str, Callable[[Iterable[str]], Iterator[ParsedRecord]]] = {
+    "ndjson": parse_ndjson,
+    "csv": parse_csv,
+}
+
+
+def chunked(records: Iterable, size: int) -> Iterator[list]:
+    """Group an iterable into lists of at most ``size`` items."""
+    iterator = iter(records)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def insert_chunk(db: Session, chunk: list[ParsedRecord], default_created_at: datetime) -> tuple[int, list[str]]:
+    """Validate one chunk against the entity table and bulk insert the valid rows.
+
+    Returns:
+        Tuple of ``(inserted, errors)``
+    """
+    errors = [error for _, _, _, error in chunk if error]
+    parsed = [(line, comparison, created_at) for line, comparison, created_at, error in chunk if not error]
+
+    entity_ids = {c.entity1_id for _, c, _ in parsed} | {c.entity2_id for _, c, _ in parsed}
+    known = set(db.execute(select(Entity.id).where(Entity.id.in_(entity_ids))).scalars()) if entity_ids else set()
+
+    rows = []
+    for line, comparison, created_at in parsed:
+        missing = [i for i in (comparison.entity1_id, comparison.entity2_id) if i not in known]
+        if missing:
+            errors.append(f"line {line}: entity with id {missing[0]} not found")
+        elif comparison.selected_entity_id not in [comparison.entity1_id, comparison.entity2_id]:
+            errors.append(f"line {line}: selected entity must be one of the compared entities")
+        else:
+            rows.append({**comparison.model_dump(), "created_at": created_at or default_created_at})
+
+    if rows:
+        db.execute(insert(Comparison), rows)
+    db.commit()
+    return len(rows), errors
+
+
+def import_comparisons(
+    db: Session,
+    records: Iterable[ParsedRecord],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    recompute: bool = True,
+    progress: Callable[[int, int], None] | None = None,
+) -> dict:
+    """Insert parsed comparisons in chunks, then recompute ratings once.
+
+    Each chunk is committed on its own, so an interrupted import keeps the
+    chunks already written. Invalid records are skipped and reported.
+    Comparisons without a ``created_at`` are stamped with the import start
+    time and keep their file order.
+
+    With the Elo engine, ratings are rebuilt by replaying the full history
+    after the last chunk; the rating store, if enabled, does not flush during
+    the replay and is reloaded from its result. With Glicko-2 the new comparisons are picked up when
+    the current rating period is closed.
+
+    Args:
+        db: Database session
+        records: Parsed records, e.g. from :func:`parse_ndjson`
+        chunk_size: Number of records inserted per transaction
+        recompute: Recompute ratings after the import
+        progress: Called with ``(imported, skipped)`` after every chunk
+
+    Returns:
+        Summary with ``imported``, ``skipped``, ``errors`` and ``ratings_recomputed``
+    """
+    started_at = datetime.now(UTC)
+    earliest = started_at
+    imported = skipped = 0
+    errors: list[str] = []
+
+    for chunk in chunked(records, chunk_size):
+        earliest = min([earliest, *(created_at for _, _, created_at, _ in chunk if created_at)])
+        inserted, chunk_errors = insert_chunk(db, chunk, started_at)
+        imported += inserted
+        skipped += len(chunk_errors)
+        errors.extend(chunk_errors[: MAX_REPORTED_ERRORS - len(errors)])
+        if progress:
+            progress(imported, skipped)
+
+    if imported:
+        # Rating history checkpoints after the earliest imported comparison are now wrong
+        discard_checkpoints(db, since=earliest)
+        db.commit()
+
+    ratings_recomputed = False
+    if recompute and imported and get_rating_engine() == "elo":
+        store = get_rating_store()
+        with store.replaying() if store is not None else nullcontext():
+            replay_elo_ratings(db)
+        ratings_recomputed = True
+    if imported:
+        bump_ratings_version()
+
+    logger.info(f"Imported {imported} comparisons ({skipped} skipped)")
+    return {"imported": imported, "skipped": skipped, "errors": errors, "ratings_recomputed": ratings_recomputed}
+
+
+def import_comparison_file(db: Session, file: IO[bytes], format: ImportFormat, **kwargs) -> dict:
+    """Stream comparisons from a binary file object in the given format.
+
+    Args:
+        db: Database session
+        file: Binary file object positioned at the start of the data
+        format: ``"ndjson"`` or ``"csv"``
+        **kwargs: Passed through to :func:`import_comparisons`
+    """
+    lines = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        return import_comparisons(db, PARSERS[format](lines), **kwargs)
+    finally:
+        # Leave closing the underlying file to the caller
+        lines.detach()
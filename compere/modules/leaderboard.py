@@ -0,0 +1,88 @@
+"""
+Serialized leaderboard responses, cached per ratings version.
+
+Every change to ratings, comparisons or entities made by this process bumps
+the ratings version after it is committed, and a leaderboard is serialized
+at most once per version. Cached responses also expire after
+``LEADERBOARD_CACHE_TTL`` seconds, so changes made by other server processes
+show up within that time.
+
+Responses carry an ``ETag`` derived from the body, so processes that render
+the same leaderboard hand out the same tag, and a request whose
+``If-None-Match`` matches it is answered with ``304 Not Modified``.
+"""
+
+import hashlib
+import threading
+from collections.abc import Callable, Hashable
+
+from fastapi import Request, Response
+
+from .cache import TTLCache
+from .config import get_leaderboard_cache_ttl
+
+# Leaderboards kept at once, e.g. one per rating model
+LEADERBOARD_CACHE_SIZE = 8
+
+_version = 0
+_version_lock = threading.Lock()
+# Serializes rendering, so concurrent misses for the same version render once
+_render_lock = threading.Lock()
+_leaderboard_cache: TTLCache | None = None
+
+
+def bump_ratings_version() -> None:
+    """Invalidate cached leaderboards; call after committing a change to ratings or entities."""
+    global _version
+    with _version_lock:
+        _version += 1
+
+
+def get_ratings_version() -> int:
+    return _version
+
+
+def get_leaderboard_cache() -> TTLCache:
+    """Get the process-wide leaderboard cache, creating it on first use."""
+    global _leaderboard_cache
+    if _leaderboard_cache is None:
+        _leaderboard_cache = TTLCache(LEADERBOARD_CACHE_SIZE, get_leaderboard_cache_ttl())
+    return _leaderboard_cache
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's ``If-None-Match`` header lists ``etag``."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in tags or etag in tags
+
+
+def cached_json_response(request: Request, key: Hashable, render: Callable[[], bytes]) -> Response:
+    """Serve a JSON body rendered at most once per ratings version.
+
+    Args:
+        request: The incoming request, for ``If-None-Match``
+        key: Identifies the leaderboard variant, e.g. the rating model
+        render: Builds the serialized body on a cache miss
+    """
+    # Read the version before rendering, so a change committed meanwhile is not cached under it
+    cache_key = (key, get_ratings_version())
+    cache = get_leaderboard_cache() if get_leaderboard_cache_ttl() > 0 else None
+
+    entry = cache.get(cache_key) if cache is not None else None
+    if entry is None:
+        with _render_lock:
+            entry = cache.get(cache_key) if cache is not None else None
+            if entry is None:
+                body = render()
+                entry = (body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"')
+                if cache is not None:
+                    cache.set(cache_key, entry)
+
+    body, etag = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,11 +1,14 @@
 import random
+from collections import defaultdict
 from math import log, sqrt
 
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from .config import get_pairing_config, get_ucb_config
+from .config import get_glicko_config, get_pairing_config, get_rating_engine, get_ucb_config
 from .database import get_db
+from .elo import comparison_score
 from .models import (
     Comparison,
     Entity,
@@ -13,6 +16,7 @@ from .models import (
     MessageResponse,
     NextComparisonResponse,
 )
+from .rating_store import get_rating_store
 
 router = APIRouter()
 
@@ -34,36 +38,55 @@ class UCB:
                 self.db.add(mab_state)
         self.db.commit()
 
+    def get_arm_stats(self) -> tuple[dict[int, tuple[int, float]], int]:
+        """Get ``(count, mean reward)`` per entity and the total count, from memory if possible"""
+        store = get_rating_store()
+        if store is not None:
+            arms = store.arm_stats()
+            # Every MABState row holds the overall count, and the rows' totals are summed
+            return arms, len(arms) * sum(count for count, _ in arms.values())
+
+        states = self.db.query(MABState).all()
+        return {state.entity_id: (state.count, state.value) for state in states}, sum(
+            state.total_count for state in states
+        )
+
     def get_ucb_scores(self) -> dict[int, float]:
         """Calculate UCB scores for all entities"""
-        states = self.db.query(MABState).all()
-        if not states:
+        arms, total_count = self.get_arm_stats()
+        if not arms:
             return {}
 
-        total_count = sum(state.total_count for state in states)
         if total_count == 0:
             total_count = 1  # Avoid log(0)
 
         exploration_constant = self._ucb_config["exploration_constant"]
         ucb_scores = {}
-        for state in states:
-            if state.count == 0:
+        for entity_id, (count, value) in arms.items():
+            if count == 0:
                 # Entities with no comparisons get infinite UCB (prioritize exploration)
-                ucb_scores[state.entity_id] = float("inf")
+                ucb_scores[entity_id] = float("inf")
             else:
-                ucb_scores[state.entity_id] = state.value + exploration_constant * sqrt(
-                    2 * log(total_count) / state.count
-                )
+                ucb_scores[entity_id] = value + exploration_constant * sqrt(2 * log(total_count) / count)
 
         return ucb_scores
 
+    def get_uncertainty_scores(self, entities: list[Entity]) -> dict[int, float]:
+        """Score entities by Glicko-2 rating deviation, relative to a new entity"""
+        initial_deviation = get_glicko_config()["initial_deviation"]
+        return {entity.id: (entity.rating_deviation or initial_deviation) / initial_deviation for entity in entities}
+
     def select_pair(self, exclude_recent: bool = True) -> tuple[Entity | None, Entity | None]:
         """Select a pair of entities for comparison using UCB"""
         entities = self.db.query(Entity).all()
         if len(entities) < 2:
             return None, None
 
-        ucb_scores = self.get_ucb_scores()
+        if get_rating_engine() == "glicko2":
+            # Rating deviation is a direct measure of how unsettled an entity is
+            ucb_scores = self.get_uncertainty_scores(entities)
+        else:
+            ucb_scores = self.get_ucb_scores()
         unexplored_weight = self._ucb_config["unexplored_weight"]
         pairing = self._pairing_config
 
@@ -116,6 +139,8 @@ class UCB:
                 remaining_entities = non_recent
 
         # Score remaining entities for selection
+        store = get_rating_store()
+        ratings = store.ratings() if store is not None else {}
         entity_scores = []
         rating_threshold = pairing["rating_threshold"]
         ucb_weight = pairing["ucb_weight"]
@@ -129,7 +154,7 @@ class UCB:
             score += ucb_scores.get(entity.id, 0) * ucb_weight
 
             # Factor 2: Rating similarity (more informative comparisons)
-            rating_diff = abs(entity1.rating - entity.rating)
+            rating_diff = abs(ratings.get(entity1.id, entity1.rating) - ratings.get(entity.id, entity.rating))
             # Prefer entities within threshold rating points
             if rating_diff < rating_threshold:
                 score += (rating_threshold - rating_diff) / rating_threshold * similarity_weight
@@ -170,6 +195,32 @@ class UCB:
             self.db.commit()
 
 
+def apply_mab_results(db: Session, results: list[tuple[int, int, int]]) -> None:
+    """Apply ``(entity1_id, entity2_id, winner_id)`` results to the MAB states in order.
+
+    Equivalent to calling :meth:`UCB.update` for both sides of every result,
+    but with one query for the states and one ``total_count`` update for the
+    whole batch. Does not commit.
+    """
+    rewards: dict[int, list[float]] = defaultdict(list)
+    for entity1_id, entity2_id, winner_id in results:
+        score = comparison_score(entity1_id, entity2_id, winner_id)
+        rewards[entity1_id].append(score)
+        rewards[entity2_id].append(1 - score)
+    if not rewards:
+        return
+
+    for state in db.query(MABState).filter(MABState.entity_id.in_(rewards)):
+        for reward in rewards[state.entity_id]:
+            state.count += 1
+            n = state.count
+            state.value = ((n - 1) / n) * state.value + (1 / n) * reward
+    db.flush()
+
+    total_count = db.query(func.coalesce(func.sum(MABState.count), 0)).scalar()
+    db.query(MABState).update({MABState.total_count: total_count}, synchronize_session=False)
+
+
 @router.get("/mab/next_comparison", response_model=NextComparisonResponse)
 def get_mab_next_comparison(db: Session = Depends(get_db)):
     """Get next comparison using MAB algorithm"""
@@ -1,8 +1,8 @@
 from datetime import datetime
 
 from pydantic import BaseModel, validator
-from sqlalchemy import JSON, Boolean, Column, DateTime, Float, ForeignKey, Integer, String
-from sqlalchemy.sql import func
+from sqlalchemy import JSON, Boolean, Column, DateTime, Float, ForeignKey, Index, Integer, LargeBinary, String
+from sqlalchemy.sql import func, text
 
 from .database import Base
 
@@ -30,6 +30,14 @@ class Entity(Base):
     description = Column(String)
     image_urls = Column(JSON)  # Store as JSON array
     rating = Column(Float, default=1500.0)
+    # Glicko-2 uncertainty, only updated when RATING_ENGINE=glicko2
+    rating_deviation = Column(Float, default=350.0, server_default=text("350.0"))
+    volatility = Column(Float, default=0.06, server_default=text("0.06"))
+    # Incremented on every rating write, for optimistic concurrency control
+    version = Column(Integer, nullable=False, default=0, server_default=text("0"))
+
+    # Serves leaderboard ordering and rank lookups (count of entities rated higher)
+    __table_args__ = (Index("ix_entities_rating_id", "rating", "id"),)
 
 
 class Comparison(Base):
@@ -40,6 +48,90 @@ class Comparison(Base):
     entity2_id = Column(Integer, ForeignKey("entities.id"))
     selected_entity_id = Column(Integer, ForeignKey("entities.id"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Client-supplied Idempotency-Key; retries with the same key return this comparison
+    idempotency_key = Column(String(255), unique=True, index=True, nullable=True)
+
+    # Support newest-first keyset pagination, overall and per entity
+    __table_args__ = (
+        Index("ix_comparisons_created_at_id", "created_at", "id"),
+        Index("ix_comparisons_entity1_created_at_id", "entity1_id", "created_at", "id"),
+        Index("ix_comparisons_entity2_created_at_id", "entity2_id", "created_at", "id"),
+    )
+
+
+class PendingVote(Base):
+    """A comparison accepted by the vote queue but not yet applied."""
+
+    __tablename__ = "pending_votes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    entity1_id = Column(Integer, nullable=False)
+    entity2_id = Column(Integer, nullable=False)
+    selected_entity_id = Column(Integer, nullable=False)
+    idempotency_key = Column(String(255), unique=True, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class RatingPeriod(Base):
+    """A closed Glicko-2 rating period."""
+
+    __tablename__ = "rating_periods"
+
+    id = Column(Integer, primary_key=True, index=True)
+    last_comparison_id = Column(Integer, nullable=False)
+    comparison_count = Column(Integer, default=0)
+    entity_count = Column(Integer, default=0)
+    closed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class RatingCheckpoint(Base):
+    """Elo ratings of all entities after a prefix of the comparison history."""
+
+    __tablename__ = "rating_checkpoints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Position of the last comparison included, in (created_at, id) order
+    created_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    last_comparison_id = Column(Integer, nullable=False)
+    comparison_count = Column(Integer, nullable=False)
+    k_factor = Column(Float, nullable=False)
+    initial_rating = Column(Float, nullable=False)
+    # Compressed int64 entity IDs and float64 ratings, in the same order
+    entity_ids = Column(LargeBinary, nullable=False)
+    ratings = Column(LargeBinary, nullable=False)
+
+
+class EmbeddingModel(Base):
+    """A fitted TF-IDF vocabulary, or feature hashing settings, that entity embeddings are computed with."""
+
+    __tablename__ = "embedding_models"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # "tfidf" or "hashing"; NULL for vocabularies stored before hashing was added
+    backend = Column(String(16), nullable=True)
+    # Hashing settings: number of features, and whether IDF weights apply
+    parameters = Column(JSON, nullable=True)
+    # Term to column index, and the float64 inverse document frequency of each column
+    vocabulary = Column(JSON, nullable=False)
+    idf = Column(LargeBinary, nullable=False)
+    # Entities the vocabulary was fitted on
+    entity_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class EntityEmbedding(Base):
+    """An entity's embedding under an embedding model."""
+
+    __tablename__ = "entity_embeddings"
+
+    entity_id = Column(Integer, ForeignKey("entities.id", ondelete="CASCADE"), primary_key=True)
+    model_id = Column(Integer, ForeignKey("embedding_models.id", ondelete="CASCADE"), nullable=False, index=True)
+    # Hash of the name and description the embedding was computed from
+    text_hash = Column(String(32), nullable=False)
+    # int32 vocabulary columns of the non-zero values, and their float32 values;
+    # without indices, a dense float32 vector with one value per column
+    indices = Column(LargeBinary, nullable=True)
+    vector = Column(LargeBinary, nullable=False)
 
 
 class MABState(Base):
@@ -91,11 +183,39 @@ class EntityOut(BaseModel):
     description: str
     image_urls: list[str]
     rating: float
+    rating_deviation: float | None = None
+    volatility: float | None = None
+    # Leaderboard position; only set on single-entity reads and leaderboards
+    rank: int | None = None
 
     class Config:
         from_attributes = True
 
 
+class EntityRankOut(BaseModel):
+    entity_id: int
+    rating: float
+    rank: int
+    total: int
+    percentile: float
+
+
+class EntityLookup(BaseModel):
+    ids: list[int]
+
+
+class EntityLookupOut(BaseModel):
+    entities: list[EntityOut]
+    # Requested IDs with no entity, in request order
+    missing: list[int]
+
+
+class EntitySuggestion(BaseModel):
+    id: int
+    name: str
+    rating: float
+
+
 class EntityUpdate(BaseModel):
     name: str | None = None
     description: str | None = None
@@ -147,6 +267,70 @@ class ComparisonOut(BaseModel):
         from_attributes = True
 
 
+class RatingInterval(BaseModel):
+    entity: EntityOut
+    rating_lower: float
+    rating_upper: float
+    rank: int
+    rank_lower: int
+    rank_upper: int
+
+
+class RatingIntervalsOut(BaseModel):
+    comparisons: int
+    rounds: int
+    confidence: float
+    intervals: list[RatingInterval]
+
+
+class RatingPeriodOut(BaseModel):
+    id: int
+    last_comparison_id: int
+    comparison_count: int
+    entity_count: int
+    closed_at: datetime | None = None
+
+    class Config:
+        from_attributes = True
+
+
+class ComparisonBatchItemResult(BaseModel):
+    index: int
+    status: str
+    comparison: ComparisonOut | None = None
+    error: str | None = None
+
+
+class ComparisonBatchResult(BaseModel):
+    created: int
+    failed: int
+    results: list[ComparisonBatchItemResult]
+
+
+class ComparisonImportResult(BaseModel):
+    imported: int
+    skipped: int
+    errors: list[str]
+    ratings_recomputed: bool
+
+
+class QueuedVoteOut(BaseModel):
+    queue_id: int
+    status: str = "queued"
+
+
+class VoteQueueStats(BaseModel):
+    enabled: bool
+    depth: int
+    lag_seconds: float
+    oldest_queued_at: datetime | None = None
+    applied: int
+    rejected: int
+    batches: int
+    last_batch_size: int
+    last_applied_at: datetime | None = None
+
+
 class MessageResponse(BaseModel):
     message: str
 
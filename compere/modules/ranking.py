@@ -0,0 +1,138 @@
+"""
+Leaderboard positions: ranks of single entities and pages of the leaderboard.
+
+An entity's rank is one more than the number of entities rated strictly
+higher, so tied entities share a rank. With the in-memory rating store, ranks
+come from a sorted copy of all ratings that the store keeps up to date, and
+each lookup is a binary search. Otherwise they are counted in the database
+over the index on ``entities.rating``; that count grows with the rank, so
+lookups near the bottom of a large leaderboard take longer. The number of
+entities is counted once per ratings version and reused by later lookups.
+
+Leaderboards are ordered by rating, then by ID, both descending, and paged
+with ``<rating>,<id>`` cursors. A page of stored ratings seeks straight to
+the cursor in the ``(rating, id)`` index and reads only the rows it returns.
+"""
+
+import numpy as np
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import Session
+
+from .cache import TTLCache
+from .config import get_leaderboard_cache_ttl
+from .errors import handle_validation_error
+from .leaderboard import get_ratings_version
+from .models import Entity, EntityOut
+from .rating_store import get_rating_store
+
+Cursor = tuple[float, int]
+
+# Entity count of the latest ratings version; expires like cached leaderboards,
+# so entities added by other server processes are counted within that time
+_entity_count_cache: TTLCache | None = None
+
+
+def count_entities(db: Session) -> int:
+    """Number of entities, counted at most once per ratings version."""
+    global _entity_count_cache
+    if _entity_count_cache is None:
+        _entity_count_cache = TTLCache(1, get_leaderboard_cache_ttl())
+    # Read the version before counting, so a change committed meanwhile is not cached under it
+    version = get_ratings_version()
+    total = _entity_count_cache.get(version)
+    if total is None:
+        total = db.query(func.count(Entity.id)).scalar()
+        _entity_count_cache.set(version, total)
+    return total
+
+
+def rank_in_db(db: Session, rating: float) -> tuple[int, int, int]:
+    """Rank of ``rating`` among the stored ratings.
+
+    Returns:
+        Tuple of ``(rank, below, total)``
+    """
+    above = db.query(func.count(Entity.id)).filter(Entity.rating > rating).scalar()
+    equal = db.query(func.count(Entity.id)).filter(Entity.rating == rating).scalar()
+    total = max(count_entities(db), above + equal)
+    return above + 1, total - above - equal, total
+
+
+def get_rating_and_rank(db: Session, entity: Entity) -> tuple[float, int]:
+    """Current rating and leaderboard rank of an entity, taken from the same source."""
+    store = get_rating_store()
+    if store is not None:
+        rating, rank, _, _ = store.rank(entity)
+        return rating, rank
+    return entity.rating, db.query(func.count(Entity.id)).filter(Entity.rating > entity.rating).scalar() + 1
+
+
+def get_rank_summary(db: Session, entity: Entity) -> dict:
+    """Rank, rating and percentile of an entity on the current leaderboard.
+
+    The percentile is the share of the other entities rated strictly lower.
+    """
+    store = get_rating_store()
+    if store is not None:
+        rating, rank, below, total = store.rank(entity)
+    else:
+        rating = entity.rating
+        rank, below, total = rank_in_db(db, rating)
+    return {
+        "entity_id": entity.id,
+        "rating": rating,
+        "rank": rank,
+        "total": total,
+        "percentile": 100.0 * below / (total - 1) if total > 1 else 100.0,
+    }
+
+
+def parse_rating_cursor(cursor: str) -> Cursor:
+    """Parse a ``<rating>,<id>`` pagination cursor."""
+    try:
+        rating, entity_id = cursor.rsplit(",", 1)
+        return float(rating), int(entity_id)
+    except ValueError:
+        handle_validation_error(f"Invalid cursor: {cursor!r}, expected <rating>,<id>")
+
+
+def format_rating_cursor(entity: EntityOut) -> str:
+    """Build the cursor that continues after ``entity``; the rating round-trips exactly."""
+    return f"{float(entity.rating)!r},{entity.id}"
+
+
+def leaderboard_page_query(db: Session, limit: int, after: Cursor | None = None, *criteria):
+    """Query for one page of the stored leaderboard, starting after ``after``.
+
+    ``criteria`` further filter the entities, e.g. a search.
+    """
+    query = db.query(Entity).filter(*criteria)
+    if after is not None:
+        query = query.filter(tuple_(Entity.rating, Entity.id) < tuple_(*after))
+    return query.order_by(Entity.rating.desc(), Entity.id.desc()).limit(limit)
+
+
+def page_of_ratings(ratings: dict[int, float], limit: int, after: Cursor | None = None) -> list[int]:
+    """Entity IDs of one leaderboard page of in-memory ratings, in leaderboard order."""
+    ids = np.fromiter(ratings.keys(), dtype=np.int64, count=len(ratings))
+    values = np.fromiter(ratings.values(), dtype=np.float64, count=len(ratings))
+    if after is not None:
+        rating, entity_id = after
+        remaining = (values < rating) | ((values == rating) & (ids < entity_id))
+        ids, values = ids[remaining], values[remaining]
+    if len(ids) > limit:
+        # Keep the top ``limit`` ratings and their ties, then order only those
+        threshold = np.partition(values, len(values) - limit)[len(values) - limit]
+        top = values >= threshold
+        ids, values = ids[top], values[top]
+    return ids[np.lexsort((-ids, -values))[:limit]].tolist()
+
+
+def assign_ranks(leaderboard: list[EntityOut]) -> list[EntityOut]:
+    """Set ``rank`` on entities sorted by rating, highest first."""
+    for position, entity in enumerate(leaderboard):
+        if position and entity.rating == leaderboard[position - 1].rating:
+            entity.rank = leaderboard[position - 1].rank
+        else:
+            entity.rank = position + 1
+    return leaderboard
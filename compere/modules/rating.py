@@ -1,38 +1,352 @@
-from fastapi import APIRouter, Depends
+import asyncio
+import random
+import time
+from collections.abc import Callable
+from datetime import datetime
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Query, Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy import bindparam, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.exc import StaleDataError
 
-from .config import get_elo_k_factor
+from .bootstrap import get_rating_intervals
+from .bradley_terry import get_bradley_terry_ratings
+from .config import get_elo_k_factor, get_rating_engine
 from .database import get_db
-from .models import Entity, EntityOut
+from .elo import apply_elo_results, comparison_score, elo_delta, expected_score  # noqa: F401 - re-exported
+from .errors import handle_database_error, handle_validation_error
+from .glicko import close_rating_period
+from .history import ratings_as_of
+from .leaderboard import bump_ratings_version, cached_json_response
+from .models import Entity, EntityOut, RatingIntervalsOut, RatingPeriod, RatingPeriodOut
+from .ranking import (
+    Cursor,
+    assign_ranks,
+    format_rating_cursor,
+    leaderboard_page_query,
+    page_of_ratings,
+    parse_rating_cursor,
+)
+from .rating_store import get_rating_store
 
 router = APIRouter()
 
+LEADERBOARD_ADAPTER = TypeAdapter(list[EntityOut])
+# Executed once per entity with executemany by compare_and_set_ratings
+COMPARE_AND_SET_RATING = (
+    update(Entity)
+    .where(Entity.id == bindparam("entity_id"), Entity.version == bindparam("expected_version"))
+    .values(rating=bindparam("new_rating"), version=Entity.version + 1)
+)
+# Page size when only a cursor is given
+DEFAULT_PAGE_SIZE = 100
+
+# Attempts at a conflicting rating update before giving up
+MAX_RATING_UPDATE_RETRIES = 10
+# Base delay of the jittered exponential backoff between attempts
+RETRY_BACKOFF_SECONDS = 0.001
+
 
-def expected_score(rating_a: float, rating_b: float) -> float:
-    """Calculate expected score for entity A against entity B."""
-    return 1 / (1 + 10 ** ((rating_b - rating_a) / 400))
+def retry_delay(attempt: int) -> float:
+    """Jittered exponential backoff before retrying a conflicting update."""
+    return random.uniform(0, RETRY_BACKOFF_SECONDS * 2**attempt)
+
+
+def retry_backoff(attempt: int) -> None:
+    """Sleep before retrying a conflicting update."""
+    time.sleep(retry_delay(attempt))
 
 
 def update_elo_ratings(db: Session, entity1: Entity, entity2: Entity, winner_id: int) -> None:
-    """Update Elo ratings for two entities based on comparison result."""
+    """Update Elo ratings for two entities based on comparison result.
+
+    Ratings are written with a compare-and-set on ``Entity.version``, so two
+    workers updating the same entity concurrently cannot overwrite each other.
+    If either entity changed since it was read, the transaction is rolled
+    back, both entities are re-read and the update is retried.
+
+    Raises:
+        StaleDataError: If the update still conflicts after MAX_RATING_UPDATE_RETRIES attempts
+    """
+    if entity1.id == entity2.id:
+        return
+
     k_factor = get_elo_k_factor()
-    expected_a = expected_score(entity1.rating, entity2.rating)
-    expected_b = 1 - expected_a
+    for attempt in range(MAX_RATING_UPDATE_RETRIES):
+        score_a = comparison_score(entity1.id, entity2.id, winner_id)
+        delta = elo_delta(entity1.rating, entity2.rating, score_a, k_factor)
+        new_ratings = {entity1: entity1.rating + delta, entity2: entity2.rating - delta}
+        if compare_and_set_ratings(db, new_ratings):
+            db.commit()
+            bump_ratings_version()
+            return
+
+        # Rolling back expires both entities, so the next attempt re-reads them
+        db.rollback()
+        retry_backoff(attempt)
+
+    raise StaleDataError(f"Rating update for entities {entity1.id} and {entity2.id} kept conflicting")
+
+
+async def update_elo_ratings_async(
+    db: AsyncSession,
+    entity1: Entity,
+    entity2: Entity,
+    winner_id: int,
+    before_commit: Callable[[Session], None] | None = None,
+) -> None:
+    """Async version of :func:`update_elo_ratings` that never blocks the event loop.
+
+    ``before_commit`` is called with the sync session after the ratings are
+    written, on every attempt, to stage changes such as the comparison row
+    being rated; they are committed together with the ratings, or rolled back
+    with them on a conflict.
+
+    Raises:
+        StaleDataError: If the update still conflicts after MAX_RATING_UPDATE_RETRIES attempts
+    """
+    if entity1.id == entity2.id:
+        await _commit_staged(db, before_commit)
+        return
+
+    def write(session: Session, new_ratings: dict[Entity, float]) -> bool:
+        if not compare_and_set_ratings(session, new_ratings):
+            return False
+        if before_commit is not None:
+            before_commit(session)
+        return True
+
+    k_factor = get_elo_k_factor()
+    for attempt in range(MAX_RATING_UPDATE_RETRIES):
+        score_a = comparison_score(entity1.id, entity2.id, winner_id)
+        delta = elo_delta(entity1.rating, entity2.rating, score_a, k_factor)
+        new_ratings = {entity1: entity1.rating + delta, entity2: entity2.rating - delta}
+        if await db.run_sync(write, new_ratings):
+            await db.commit()
+            bump_ratings_version()
+            # Async sessions do not expire on commit; record the written state without a re-read
+            for entity, rating in new_ratings.items():
+                set_committed_value(entity, "rating", rating)
+                set_committed_value(entity, "version", entity.version + 1)
+            return
+
+        # Expired attributes cannot be lazy-loaded in async code, so re-read explicitly
+        await db.rollback()
+        await asyncio.sleep(retry_delay(attempt))
+        await db.refresh(entity1)
+        await db.refresh(entity2)
+
+    raise StaleDataError(f"Rating update for entities {entity1.id} and {entity2.id} kept conflicting")
+
+
+def compare_and_set_ratings(db: Session, new_ratings: dict[Entity, float]) -> bool:
+    """Write new ratings only if no entity changed since it was read.
 
-    if winner_id == entity1.id:
-        score_a, score_b = 1, 0
-    elif winner_id == entity2.id:
-        score_a, score_b = 0, 1
+    Rows are updated in ID order so concurrent writers always lock them in the
+    same order. Drivers that report row counts of executemany get a single
+    statement for all rows, others one per row. The caller commits on success
+    and rolls back on failure.
+
+    Returns:
+        True if every entity was updated, False if any had a newer version
+    """
+    items = sorted(new_ratings.items(), key=lambda item: item[0].id)
+    connection = db.connection()
+    if len(items) > 1 and connection.dialect.supports_sane_multi_rowcount:
+        params = [
+            {"entity_id": entity.id, "expected_version": entity.version, "new_rating": rating}
+            for entity, rating in items
+        ]
+        return connection.execute(COMPARE_AND_SET_RATING, params).rowcount == len(params)
+
+    for entity, rating in items:
+        updated = (
+            db.query(Entity)
+            .filter(Entity.id == entity.id, Entity.version == entity.version)
+            .update({Entity.rating: rating, Entity.version: Entity.version + 1}, synchronize_session=False)
+        )
+        if updated != 1:
+            return False
+    return True
+
+
+def record_comparison_result(db: Session, entity1: Entity, entity2: Entity, winner_id: int) -> None:
+    """Apply the rating update for a new comparison with the configured engine.
+
+    Elo ratings move immediately, in the in-memory rating store if it is
+    enabled. With the Glicko-2 engine, ratings only move when the current
+    rating period is closed.
+    """
+    if get_rating_engine() == "glicko2":
+        # The new comparison still changes the Bradley-Terry leaderboard
+        bump_ratings_version()
+        return
+    store = get_rating_store()
+    if store is not None:
+        store.record(entity1, entity2, winner_id)
+        bump_ratings_version()
+        return
+    update_elo_ratings(db, entity1, entity2, winner_id)
+
+
+async def _commit_staged(db: AsyncSession, before_commit: Callable[[Session], None] | None) -> None:
+    if before_commit is not None:
+        await db.run_sync(before_commit)
+        await db.commit()
+
+
+async def record_comparison_result_async(
+    db: AsyncSession,
+    entity1: Entity,
+    entity2: Entity,
+    winner_id: int,
+    before_commit: Callable[[Session], None] | None = None,
+) -> None:
+    """Async version of :func:`record_comparison_result`.
+
+    ``before_commit`` stages changes to commit in the same transaction as the
+    rating update, see :func:`update_elo_ratings_async`.
+    """
+    if get_rating_engine() == "glicko2":
+        await _commit_staged(db, before_commit)
+        bump_ratings_version()
+        return
+    store = get_rating_store()
+    if store is not None:
+        # Commit first so a rejected write never moves the in-memory ratings
+        await _commit_staged(db, before_commit)
+        store.record(entity1, entity2, winner_id)
+        bump_ratings_version()
+        return
+    await update_elo_ratings_async(db, entity1, entity2, winner_id, before_commit)
+
+
+@router.get(
+    "/ratings",
+    response_model=list[EntityOut],
+    responses={304: {"description": "Leaderboard unchanged since the ETag sent in If-None-Match"}},
+)
+def get_ratings(
+    request: Request,
+    response: Response,
+    model: Literal["elo", "bt"] = Query("elo", description="Rating model: running Elo or Bradley-Terry fit"),
+    as_of: datetime | None = Query(None, description="Rebuild the Elo leaderboard as it was at this time"),
+    limit: int | None = Query(None, ge=1, le=1000, description="Page size; omit for the whole leaderboard"),
+    after: str | None = Query(None, description="Cursor from X-Next-Cursor: return entities after it"),
+    top: int | None = Query(None, ge=1, le=1000, description="Return only the k highest-rated entities"),
+    db: Session = Depends(get_db),
+):
+    """Get all entities sorted by rating (leaderboard)
+
+    Current leaderboards are served pre-serialized with an ETag until ratings
+    change. With ``limit`` or ``top`` one page is returned; pass its
+    ``X-Next-Cursor`` header as ``after`` to get the next one.
+    """
+    paged = limit is not None or after is not None or top is not None
+    if top is not None and (limit is not None or after is not None):
+        handle_validation_error("top cannot be combined with limit or after")
+    if as_of is not None:
+        if model != "elo" or get_rating_engine() != "elo":
+            handle_validation_error("as_of is only supported for Elo ratings")
+        if paged:
+            handle_validation_error("as_of cannot be combined with limit, after or top")
+        try:
+            return get_leaderboard(db, ratings_as_of(db, as_of))
+        except SQLAlchemyError as e:
+            db.rollback()
+            handle_database_error(e, "get rating history")
+    if paged:
+        page_size = top or limit or DEFAULT_PAGE_SIZE
+        try:
+            page = get_leaderboard_page(db, model, page_size, parse_rating_cursor(after) if after else None)
+        except SQLAlchemyError as e:
+            handle_database_error(e, "get leaderboard page")
+        if top is None and len(page) == page_size:
+            response.headers["X-Next-Cursor"] = format_rating_cursor(page[-1])
+        return page
+    return cached_json_response(
+        request, ("ratings", model), lambda: LEADERBOARD_ADAPTER.dump_json(get_current_leaderboard(db, model))
+    )
+
+
+def get_current_leaderboard(db: Session, model: str) -> list[EntityOut]:
+    """Get the current leaderboard for a rating model."""
+    if model == "bt":
+        return get_leaderboard(db, get_bradley_terry_ratings(db))
+    store = get_rating_store()
+    if store is not None:
+        return get_leaderboard(db, store.ratings())
+    return assign_ranks(
+        [
+            EntityOut.model_validate(entity)
+            for entity in db.query(Entity).order_by(Entity.rating.desc(), Entity.id.desc())
+        ]
+    )
+
+
+def get_leaderboard_page(db: Session, model: str, limit: int, after: Cursor | None) -> list[EntityOut]:
+    """Get one page of the current leaderboard for a rating model.
+
+    Stored Elo ratings are read from the ``(rating, id)`` index, so a page
+    costs the same wherever it starts; Bradley-Terry and in-memory ratings
+    are paged in memory. Ranks are only set on the first page, since ranking
+    a later page would mean counting every entity before it.
+    """
+    store = get_rating_store()
+    if model == "elo" and store is None:
+        page = [EntityOut.model_validate(entity) for entity in leaderboard_page_query(db, limit, after)]
     else:
-        score_a, score_b = 0.5, 0.5
+        ratings = get_bradley_terry_ratings(db) if model == "bt" else store.ratings()
+        entity_ids = page_of_ratings(ratings, limit, after)
+        entities = {entity.id: entity for entity in db.query(Entity).filter(Entity.id.in_(entity_ids))}
+        page = [
+            EntityOut.model_validate(entities[entity_id]).model_copy(update={"rating": ratings[entity_id]})
+            for entity_id in entity_ids
+            if entity_id in entities
+        ]
+    return assign_ranks(page) if after is None else page
+
+
+def get_leaderboard(db: Session, ratings: dict[int, float]) -> list[EntityOut]:
+    """Get all entities with a rating in ``ratings``, sorted by that rating."""
+    leaderboard = [
+        EntityOut.model_validate(entity).model_copy(update={"rating": ratings[entity.id]})
+        for entity in db.query(Entity).all()
+        if entity.id in ratings
+    ]
+    leaderboard.sort(key=lambda entity: (entity.rating, entity.id), reverse=True)
+    return assign_ranks(leaderboard)
+
 
-    entity1.rating += k_factor * (score_a - expected_a)
-    entity2.rating += k_factor * (score_b - expected_b)
+@router.get("/ratings/intervals", response_model=RatingIntervalsOut)
+def rating_intervals(
+    rounds: int | None = Query(None, ge=0, le=10_000, description="Bootstrap rounds (default: BOOTSTRAP_ROUNDS)"),
+    confidence: float = Query(0.95, gt=0, lt=1, description="Coverage of the intervals"),
+    seed: int | None = Query(None, description="Seed for reproducible resampling"),
+    db: Session = Depends(get_db),
+) -> dict:
+    """Get Bradley-Terry ratings with bootstrap confidence intervals for ratings and ranks.
 
-    db.commit()
+    Results are cached until the number of comparisons changes.
+    """
+    try:
+        return get_rating_intervals(db, rounds, confidence, seed)
+    except SQLAlchemyError as e:
+        handle_database_error(e, "compute rating intervals")
 
 
-@router.get("/ratings", response_model=list[EntityOut])
-def get_ratings(db: Session = Depends(get_db)):
-    """Get all entities sorted by rating (leaderboard)"""
-    return db.query(Entity).order_by(Entity.rating.desc()).all()
+@router.post("/ratings/periods", response_model=RatingPeriodOut)
+def close_period(db: Session = Depends(get_db)) -> RatingPeriod:
+    """Close the current Glicko-2 rating period and update all ratings"""
+    if get_rating_engine() != "glicko2":
+        handle_validation_error("Rating periods are only used when RATING_ENGINE=glicko2")
+    try:
+        return close_rating_period(db)
+    except SQLAlchemyError as e:
+        db.rollback()
+        handle_database_error(e, "close rating period")
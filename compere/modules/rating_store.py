@@ -0,0 +1,363 @@
+"""
+Write-behind in-memory Elo ratings.
+
+With ``RATING_STORE_ENABLED=true``, each server process keeps every entity's
+rating, comparison count and score sum in NumPy arrays. Votes update the
+arrays instead of reading and writing two ``entities`` rows, and a flusher
+thread writes the accumulated rating changes back every
+``RATING_STORE_FLUSH_INTERVAL`` seconds, after ``RATING_STORE_FLUSH_EVERY``
+updates, and at shutdown.
+
+Flushes add each entity's accumulated change to its stored rating rather
+than overwriting it, so writes from another process are not lost. The
+comparisons themselves are committed before the store is updated, so
+``compere replay`` rebuilds exact ratings if a process dies between flushes.
+"""
+
+import logging
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+
+import numpy as np
+from sqlalchemy import bindparam, case, func, select, update
+from sqlalchemy.orm import Session
+
+from .config import get_elo_k_factor, get_rating_store_config
+from .database import SessionLocal
+from .elo import comparison_score, elo_delta
+from .models import Comparison, Entity
+
+logger = logging.getLogger(__name__)
+
+# Initial array capacity; arrays double when new entities outgrow it
+INITIAL_CAPACITY = 1024
+
+
+def comparison_stats(db: Session) -> dict[int, tuple[int, float]]:
+    """Comparison count and summed score per entity, from the stored comparisons."""
+    score1 = case(
+        (Comparison.selected_entity_id == Comparison.entity1_id, 1.0),
+        (Comparison.selected_entity_id == Comparison.entity2_id, 0.0),
+        else_=0.5,
+    )
+    stats: dict[int, tuple[int, float]] = {}
+    for entity_column, score in ((Comparison.entity1_id, score1), (Comparison.entity2_id, 1 - score1)):
+        rows = db.execute(select(entity_column, func.count(), func.sum(score)).group_by(entity_column))
+        for entity_id, count, total in rows:
+            previous_count, previous_total = stats.get(entity_id, (0, 0.0))
+            stats[entity_id] = (previous_count + count, previous_total + float(total or 0))
+    return stats
+
+
+class SortedRatings:
+    """Ratings held in ascending order, for binary-search rank lookups.
+
+    A rating change shifts only the ratings between its old and new
+    position, which for an Elo update is a short stretch of the array. Not
+    thread-safe; :class:`RatingStore` calls it under its lock.
+    """
+
+    def __init__(self, ratings: np.ndarray | None = None):
+        ratings = np.zeros(0) if ratings is None else np.sort(np.asarray(ratings, dtype=np.float64))
+        self._size = len(ratings)
+        self._values = np.zeros(max(1024, 2 * self._size))
+        self._values[: self._size] = ratings
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, rating: float) -> None:
+        if self._size == len(self._values):
+            grown = np.zeros(2 * len(self._values))
+            grown[: self._size] = self._values[: self._size]
+            self._values = grown
+        i = int(np.searchsorted(self._values[: self._size], rating))
+        self._values[i + 1 : self._size + 1] = self._values[i : self._size]
+        self._values[i] = rating
+        self._size += 1
+
+    def remove(self, rating: float) -> None:
+        i = int(np.searchsorted(self._values[: self._size], rating))
+        self._values[i : self._size - 1] = self._values[i + 1 : self._size]
+        self._size -= 1
+
+    def move(self, old: float, new: float) -> None:
+        """Replace one occurrence of ``old`` by ``new``."""
+        values = self._values[: self._size]
+        i = int(np.searchsorted(values, old))
+        j = int(np.searchsorted(values, new))
+        if j > i:
+            values[i : j - 1] = values[i + 1 : j]
+            values[j - 1] = new
+        else:
+            values[j + 1 : i + 1] = values[j:i]
+            values[j] = new
+
+    def rank(self, rating: float) -> tuple[int, int]:
+        """Rank of ``rating`` and the number of ratings strictly below it."""
+        values = self._values[: self._size]
+        above = self._size - int(np.searchsorted(values, rating, side="right"))
+        return above + 1, int(np.searchsorted(values, rating, side="left"))
+
+
+class RatingStore:
+    """Elo ratings of all entities held in memory and flushed to the database in batches.
+
+    All methods are thread-safe.
+    """
+
+    def __init__(
+        self,
+        k_factor: float,
+        flush_interval: float = 1.0,
+        flush_every: int = 1000,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ):
+        self.k_factor = k_factor
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self.session_factory = session_factory
+        self._lock = threading.Lock()
+        # Held by flushes and by replays, so no flush lands in the middle of a replay
+        self._flush_lock = threading.Lock()
+        self._reset(INITIAL_CAPACITY)
+        self._flush_requested = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _reset(self, capacity: int) -> None:
+        self._slots: dict[int, int] = {}
+        self._size = 0
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._ratings = np.zeros(capacity)
+        self._counts = np.zeros(capacity, dtype=np.int64)
+        self._scores = np.zeros(capacity)
+        # Rating change not yet written to the database
+        self._deltas = np.zeros(capacity)
+        self._dirty = np.zeros(capacity, dtype=bool)
+        self._sorted = SortedRatings()
+        self._unflushed = 0
+
+    def _slot(self, entity_id: int, rating: float) -> int:
+        """Array position of an entity, adding it with ``rating`` if it is new."""
+        slot = self._slots.get(entity_id)
+        if slot is not None:
+            return slot
+        if self._size == len(self._ids):
+            capacity = 2 * len(self._ids)
+            for name in ("_ids", "_ratings", "_counts", "_scores", "_deltas", "_dirty"):
+                array = getattr(self, name)
+                grown = np.zeros(capacity, dtype=array.dtype)
+                grown[: self._size] = array[: self._size]
+                setattr(self, name, grown)
+        slot = self._size
+        self._size += 1
+        self._slots[entity_id] = slot
+        self._ids[slot] = entity_id
+        self._ratings[slot] = rating
+        self._sorted.add(rating)
+        return slot
+
+    def load(self, db: Session) -> None:
+        """Replace the store's contents with the ratings and comparison counts in the database."""
+        entities = db.execute(select(Entity.id, Entity.rating)).all()
+        stats = comparison_stats(db)
+        with self._lock:
+            size = len(entities)
+            self._reset(max(INITIAL_CAPACITY, 2 * size))
+            for slot, (entity_id, rating) in enumerate(entities):
+                self._slots[entity_id] = slot
+                self._ids[slot] = entity_id
+                self._ratings[slot] = rating
+                self._counts[slot], self._scores[slot] = stats.get(entity_id, (0, 0.0))
+            self._size = size
+            self._sorted = SortedRatings(self._ratings[:size])
+        logger.info(f"Loaded {len(entities)} ratings into the rating store")
+
+    def record(self, entity1: Entity, entity2: Entity, winner_id: int) -> None:
+        """Apply one comparison result."""
+        self.record_many({entity1.id: entity1, entity2.id: entity2}, [(entity1.id, entity2.id, winner_id)])
+
+    def record_many(self, entities: dict[int, Entity], results: Iterable[tuple[int, int, int]]) -> None:
+        """Apply ``(entity1_id, entity2_id, winner_id)`` results in order.
+
+        ``entities`` supplies the stored rating of any entity created since
+        the store was loaded.
+        """
+        updates = 0
+        with self._lock:
+            for entity1_id, entity2_id, winner_id in results:
+                slot1 = self._slot(entity1_id, entities[entity1_id].rating)
+                slot2 = self._slot(entity2_id, entities[entity2_id].rating)
+                score = comparison_score(entity1_id, entity2_id, winner_id)
+                self._counts[slot1] += 1
+                self._counts[slot2] += 1
+                self._scores[slot1] += score
+                self._scores[slot2] += 1 - score
+                if slot1 == slot2:
+                    continue
+                old1, old2 = self._ratings[slot1], self._ratings[slot2]
+                delta = elo_delta(old1, old2, score, self.k_factor)
+                self._ratings[slot1] += delta
+                self._ratings[slot2] -= delta
+                self._sorted.move(old1, self._ratings[slot1])
+                self._sorted.move(old2, self._ratings[slot2])
+                self._deltas[slot1] += delta
+                self._deltas[slot2] -= delta
+                self._dirty[[slot1, slot2]] = True
+                updates += 1
+            self._unflushed += updates
+            if self._unflushed >= self.flush_every:
+                self._flush_requested.set()
+
+    def ratings(self) -> dict[int, float]:
+        """Current rating of every entity in the store."""
+        with self._lock:
+            return dict(zip(self._ids[: self._size].tolist(), self._ratings[: self._size].tolist(), strict=True))
+
+    def rating_arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """Copies of the entity IDs in the store and their current ratings."""
+        with self._lock:
+            return self._ids[: self._size].copy(), self._ratings[: self._size].copy()
+
+    def rank(self, entity: Entity) -> tuple[float, int, int, int]:
+        """Current rating and rank of an entity.
+
+        Returns:
+            Tuple of ``(rating, rank, below, total)``, where ``below`` counts
+            the entities rated strictly lower
+        """
+        with self._lock:
+            rating = float(self._ratings[self._slot(entity.id, entity.rating)])
+            rank, below = self._sorted.rank(rating)
+            return rating, rank, below, len(self._sorted)
+
+    def remove(self, entity_id: int) -> None:
+        """Drop a deleted entity; its unflushed rating change is discarded."""
+        with self._lock:
+            slot = self._slots.pop(entity_id, None)
+            if slot is None:
+                return
+            self._sorted.remove(self._ratings[slot])
+            last = self._size - 1
+            if slot != last:
+                for name in ("_ids", "_ratings", "_counts", "_scores", "_deltas", "_dirty"):
+                    array = getattr(self, name)
+                    array[slot] = array[last]
+                self._slots[int(self._ids[slot])] = slot
+            self._dirty[last] = False
+            self._deltas[last] = 0.0
+            self._size = last
+
+    def arm_stats(self) -> dict[int, tuple[int, float]]:
+        """Comparison count and mean score of every entity, for UCB pairing."""
+        with self._lock:
+            counts = self._counts[: self._size]
+            means = np.divide(self._scores[: self._size], counts, out=np.zeros(self._size), where=counts > 0)
+            arms = zip(counts.tolist(), means.tolist(), strict=True)
+            return dict(zip(self._ids[: self._size].tolist(), arms, strict=True))
+
+    def flush(self) -> int:
+        """Write the accumulated rating changes to the database.
+
+        Returns:
+            Number of entities written
+        """
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        with self._lock:
+            slots = np.flatnonzero(self._dirty[: self._size])
+            entity_ids = self._ids[slots]
+            deltas = self._deltas[slots].copy()
+            self._deltas[slots] = 0
+            self._dirty[slots] = False
+            self._unflushed = 0
+        if not len(slots):
+            return 0
+
+        stmt = (
+            update(Entity.__table__)
+            .where(Entity.__table__.c.id == bindparam("b_id"))
+            .values(rating=Entity.__table__.c.rating + bindparam("b_delta"), version=Entity.__table__.c.version + 1)
+        )
+        params = [
+            {"b_id": entity_id, "b_delta": delta}
+            for entity_id, delta in zip(entity_ids.tolist(), deltas.tolist(), strict=True)
+        ]
+        try:
+            with self.session_factory() as db:
+                db.execute(stmt, params)
+                db.commit()
+        except Exception:
+            # Keep the changes for the next flush
+            with self._lock:
+                self._deltas[slots] += deltas
+                self._dirty[slots] = True
+            raise
+        return len(slots)
+
+    @contextmanager
+    def replaying(self) -> Iterator[None]:
+        """Hold off flushes while ratings are rebuilt from the comparisons, then reload them.
+
+        Pending changes are dropped rather than flushed: the replay already
+        counts the votes they came from. If the replay fails, they are kept.
+        """
+        with self._flush_lock:
+            yield
+            with self.session_factory() as db:
+                self.load(db)
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            self._flush_requested.wait(self.flush_interval)
+            self._flush_requested.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Rating store flush failed, retrying at the next interval")
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="rating-store-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop the flusher and write any remaining changes."""
+        self._stop.set()
+        self._flush_requested.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+
+_store: RatingStore | None = None
+
+
+def get_rating_store() -> RatingStore | None:
+    """Get the process-wide rating store, or None if it is disabled."""
+    return _store
+
+
+def start_rating_store() -> RatingStore:
+    """Load the process-wide rating store and start its flusher."""
+    global _store
+    if _store is None:
+        _, flush_interval, flush_every = get_rating_store_config()
+        store = RatingStore(get_elo_k_factor(), flush_interval, flush_every)
+        with store.session_factory() as db:
+            store.load(db)
+        store.start()
+        _store = store
+    return _store
+
+
+def stop_rating_store() -> None:
+    global _store
+    if _store is not None:
+        _store.stop()
+        _store = None
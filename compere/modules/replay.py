@@ -0,0 +1,178 @@
+"""
+Offline Elo rebuilds by replaying the full comparison history.
+"""
+
+import logging
+
+import numpy as np
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+
+from .config import get_elo_initial_rating, get_elo_k_factor
+from .models import Comparison, Entity
+
+logger = logging.getLogger(__name__)
+
+# Number of comparison rows fetched from the database per chunk
+DEFAULT_CHUNK_SIZE = 50_000
+
+
+def load_entity_index(db: Session) -> np.ndarray:
+    """Load all entity IDs as a sorted array.
+
+    The position of an ID in the returned array is its dense index into the
+    rating arrays used by the replay and fitting engines.
+    """
+    ids = db.execute(select(Entity.id).order_by(Entity.id)).scalars().all()
+    return np.asarray(ids, dtype=np.int64)
+
+
+def index_of(entity_ids: np.ndarray, ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Look up the dense index of each ID in a sorted entity ID array.
+
+    Returns:
+        Tuple of ``(idx, found)``; ``idx`` is only meaningful where ``found`` is True
+    """
+    idx = np.searchsorted(entity_ids, ids)
+    if len(entity_ids) == 0:
+        return idx, np.zeros(len(ids), dtype=bool)
+    last = len(entity_ids) - 1
+    found = (idx <= last) & (entity_ids[np.minimum(idx, last)] == ids)
+    return idx, found
+
+
+def map_comparisons(entity_ids: np.ndarray, rows: list) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Map a chunk of comparison rows onto dense entity indices.
+
+    Args:
+        entity_ids: Sorted array of known entity IDs
+        rows: Sequence of ``(entity1_id, entity2_id, selected_entity_id)`` rows
+
+    Returns:
+        Tuple of ``(idx1, idx2, score1)`` arrays, where ``score1`` is the score
+        of the first entity (1 for a win, 0 for a loss, 0.5 otherwise). Rows
+        referencing unknown entities or comparing an entity with itself are
+        dropped.
+    """
+    idx1, idx2, score1, _ = map_weighted_comparisons(entity_ids, [(*row, 1) for row in rows])
+    return idx1, idx2, score1
+
+
+def map_weighted_comparisons(
+    entity_ids: np.ndarray, rows: list
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Map aggregated comparison rows onto dense entity indices.
+
+    Like :func:`map_comparisons`, but each row carries a trailing count, as
+    produced by a ``GROUP BY`` over the comparison columns.
+
+    Returns:
+        Tuple of ``(idx1, idx2, score1, counts)`` arrays
+    """
+    if len(rows) == 0 or len(entity_ids) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64)
+
+    # NULL IDs become NaN here and are filtered out below
+    chunk = np.asarray(rows, dtype=np.float64).reshape(-1, 4)
+    chunk = chunk[np.isfinite(chunk[:, 0]) & np.isfinite(chunk[:, 1])]
+    e1 = chunk[:, 0].astype(np.int64)
+    e2 = chunk[:, 1].astype(np.int64)
+    selected = chunk[:, 2]
+
+    idx1, found1 = index_of(entity_ids, e1)
+    idx2, found2 = index_of(entity_ids, e2)
+    valid = found1 & found2 & (e1 != e2)
+
+    score1 = np.where(selected == e1, 1.0, np.where(selected == e2, 0.0, 0.5))
+    return idx1[valid], idx2[valid], score1[valid], chunk[valid, 3]
+
+
+def apply_elo_sequence(
+    ratings: np.ndarray,
+    idx1: np.ndarray,
+    idx2: np.ndarray,
+    score1: np.ndarray,
+    k_factor: float,
+) -> None:
+    """Apply a sequence of Elo updates to ``ratings`` in place.
+
+    Elo is order-dependent, so each update must see the result of the previous
+    one. The loop runs over plain Python scalars, which is considerably faster
+    than indexing into the NumPy array element by element.
+    """
+    values = ratings.tolist()
+    for a, b, s in zip(idx1.tolist(), idx2.tolist(), score1.tolist(), strict=True):
+        ra = values[a]
+        rb = values[b]
+        delta = k_factor * (s - 1.0 / (1.0 + 10.0 ** ((rb - ra) / 400.0)))
+        values[a] = ra + delta
+        values[b] = rb - delta
+    ratings[:] = values
+
+
+def write_ratings(db: Session, entity_ids: np.ndarray, ratings: np.ndarray) -> None:
+    """Write ratings for all given entities back with a single bulk UPDATE."""
+    if len(entity_ids) == 0:
+        return
+    table = Entity.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("b_id"))
+        .values(rating=bindparam("b_rating"), version=table.c.version + 1)
+    )
+    db.execute(
+        stmt,
+        [{"b_id": int(i), "b_rating": float(r)} for i, r in zip(entity_ids, ratings, strict=True)],
+    )
+
+
+def replay_elo_ratings(
+    db: Session,
+    k_factor: float | None = None,
+    initial_rating: float | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> dict[str, int]:
+    """Rebuild every entity rating by replaying all comparisons in order.
+
+    Comparisons are streamed in ``created_at`` order in chunks of
+    ``chunk_size`` rows, so memory use is bounded by the number of entities
+    rather than the number of comparisons. All ratings are written back in one
+    bulk statement and committed once.
+
+    Args:
+        db: Database session
+        k_factor: Elo K-factor to replay with (defaults to ELO_K_FACTOR)
+        initial_rating: Starting rating for every entity (defaults to ELO_INITIAL_RATING)
+        chunk_size: Number of comparisons to fetch per chunk
+
+    Returns:
+        Summary with the number of entities, applied and skipped comparisons
+    """
+    if k_factor is None:
+        k_factor = get_elo_k_factor()
+    if initial_rating is None:
+        initial_rating = get_elo_initial_rating()
+
+    entity_ids = load_entity_index(db)
+    ratings = np.full(len(entity_ids), initial_rating, dtype=np.float64)
+
+    stmt = (
+        select(Comparison.entity1_id, Comparison.entity2_id, Comparison.selected_entity_id)
+        .order_by(Comparison.created_at, Comparison.id)
+        .execution_options(stream_results=True)
+    )
+
+    applied = 0
+    skipped = 0
+    for partition in db.execute(stmt).partitions(chunk_size):
+        idx1, idx2, score1 = map_comparisons(entity_ids, partition)
+        apply_elo_sequence(ratings, idx1, idx2, score1, k_factor)
+        applied += len(idx1)
+        skipped += len(partition) - len(idx1)
+
+    write_ratings(db, entity_ids, ratings)
+    db.commit()
+
+    logger.info(f"Replayed {applied} comparisons over {len(entity_ids)} entities ({skipped} skipped)")
+    return {"entities": len(entity_ids), "comparisons": applied, "skipped": skipped}
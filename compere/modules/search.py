@@ -0,0 +1,147 @@
+"""
+Full-text search over entity names and descriptions.
+
+SQLite databases get an FTS5 table that mirrors ``entities`` and is kept in
+sync by triggers on insert, delete and name or description changes, so
+rating writes never touch it. PostgreSQL databases get a GIN index over a
+``tsvector`` of the same two columns, which PostgreSQL maintains itself.
+Search terms match whole words by prefix, case-insensitively, and every word
+must match.
+
+The index is only searched with ``ENTITY_SEARCH_BACKEND=auto``, as it does not
+match inside words. By default, and on other databases or SQLite builds
+without FTS5, search uses ``ILIKE '%term%'`` scans.
+"""
+
+import logging
+import re
+
+from sqlalchemy import case, column, func, inspect, literal_column, select, table, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Query, Session
+
+from .config import get_entity_search_backend
+from .models import Entity
+
+logger = logging.getLogger(__name__)
+
+# Relevance weight of a name match relative to a description match (FTS5 only)
+NAME_WEIGHT = 10.0
+
+FTS_TABLE = table("entities_fts", column("rowid"))
+
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS entities_fts USING fts5("
+    "name, description, content='entities', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS entities_fts_insert AFTER INSERT ON entities BEGIN "
+    "INSERT INTO entities_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS entities_fts_delete AFTER DELETE ON entities BEGIN "
+    "INSERT INTO entities_fts(entities_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS entities_fts_update AFTER UPDATE OF name, description ON entities BEGIN "
+    "INSERT INTO entities_fts(entities_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); "
+    "INSERT INTO entities_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+]
+
+# Queries must use this exact expression for PostgreSQL to pick the index
+POSTGRES_DOCUMENT = "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(description, ''))"
+POSTGRES_INDEX_DDL = f"CREATE INDEX IF NOT EXISTS ix_entities_search ON entities USING GIN ({POSTGRES_DOCUMENT})"
+
+_backends: dict[Engine | Connection, str] = {}
+
+
+def create_search_index(bind: Engine) -> None:
+    """Create the full-text index for the database, and fill it if it may be out of date."""
+    if bind.dialect.name == "sqlite":
+        with bind.begin() as conn:
+            # Without the triggers (a new index, or a recreated entities table) the index may be out of date
+            in_sync = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'entities_fts_insert'")).first()
+            try:
+                for ddl in SQLITE_FTS_DDL:
+                    conn.execute(text(ddl))
+            except OperationalError:
+                logger.warning("SQLite was built without FTS5, entity search falls back to LIKE")
+                return
+            if not in_sync:
+                conn.execute(text("INSERT INTO entities_fts(entities_fts) VALUES ('rebuild')"))
+                logger.info("Built the entity full-text index")
+    elif bind.dialect.name == "postgresql":
+        with bind.begin() as conn:
+            conn.execute(text(POSTGRES_INDEX_DDL))
+    _backends.pop(bind, None)
+
+
+def get_search_backend(bind: Engine | Connection) -> str:
+    """Get the search backend for a database: 'fts5', 'postgres' or 'like'."""
+    if get_entity_search_backend() == "like":
+        return "like"
+    backend = _backends.get(bind)
+    if backend is None:
+        if bind.dialect.name == "sqlite":
+            backend = "fts5" if inspect(bind).has_table("entities_fts") else "like"
+        elif bind.dialect.name == "postgresql":
+            backend = "postgres"
+        else:
+            backend = "like"
+        _backends[bind] = backend
+    return backend
+
+
+def search_words(term: str) -> list[str]:
+    return re.findall(r"\w+", term)
+
+
+def _fts5_match(words: list[str]):
+    # Quoted words are matched literally; the trailing * makes each a prefix query
+    query = " ".join(f'"{word}"*' for word in words)
+    return literal_column("entities_fts").op("MATCH")(query)
+
+
+def _postgres_query(words: list[str]):
+    return func.to_tsquery(literal_column("'simple'"), " & ".join(f"{word}:*" for word in words))
+
+
+def _like_condition(term: str):
+    pattern = f"%{term}%"
+    return Entity.name.ilike(pattern) | Entity.description.ilike(pattern)
+
+
+def search_condition(db: Session, term: str):
+    """Filter criterion matching entities whose name or description match ``term``."""
+    words = search_words(term)
+    backend = get_search_backend(db.get_bind()) if words else "like"
+    if backend == "fts5":
+        return Entity.id.in_(select(FTS_TABLE.c.rowid).where(_fts5_match(words)))
+    if backend == "postgres":
+        return literal_column(POSTGRES_DOCUMENT).op("@@")(_postgres_query(words))
+    return _like_condition(term)
+
+
+def search_by_relevance(db: Session, term: str) -> Query:
+    """Query for entities matching ``term``, best matches first.
+
+    The LIKE fallback has no relevance score; it lists name matches before
+    description matches, then orders by rating.
+    """
+    words = search_words(term)
+    backend = get_search_backend(db.get_bind()) if words else "like"
+    if backend == "fts5":
+        relevance = func.bm25(literal_column("entities_fts"), NAME_WEIGHT, 1.0)
+        return (
+            db.query(Entity)
+            .join(FTS_TABLE, FTS_TABLE.c.rowid == Entity.id)
+            .filter(_fts5_match(words))
+            .order_by(relevance, Entity.id)
+        )
+    if backend == "postgres":
+        document = literal_column(POSTGRES_DOCUMENT)
+        tsquery = _postgres_query(words)
+        return (
+            db.query(Entity)
+            .filter(document.op("@@")(tsquery))
+            .order_by(func.ts_rank(document, tsquery).desc(), Entity.id)
+        )
+    name_first = case((Entity.name.ilike(f"%{term}%"), 0), else_=1)
+    return db.query(Entity).filter(_like_condition(term)).order_by(name_first, Entity.rating.desc(), Entity.id.desc())
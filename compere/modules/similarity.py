@@ -1,69 +1,66 @@
 """
 Entity similarity calculations for intelligent pairing.
+
+The most dissimilar pair is the pair with the lowest cosine similarity. Up to
+``DISSIMILAR_EXACT_MAX_ENTITIES`` entities it is found exactly, comparing all
+pairs a block of rows at a time. Larger catalogs use an approximate search:
+from each of ``DISSIMILAR_SEARCH_ANCHORS`` anchor entities it repeatedly
+jumps to the entity least similar to the current one, keeping the best pair
+seen. Each jump is one pass over the embeddings, so the search takes time
+and memory linear in the number of entities.
+
+Embeddings are sparse TF-IDF rows and both searches work on them in CSR
+form, so products cost time in proportion to the non-zero weights. Only
+similarities are made dense: one block of rows at a time in the exact
+search, one vector of ``n`` per jump in the approximate one.
 """
 
 from collections.abc import Sequence
 
 import numpy as np
 from fastapi import APIRouter, Depends
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
+from sklearn.preprocessing import normalize
+from sqlalchemy.engine import Engine
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
-from .database import get_db
+from .config import get_dissimilar_search_config
+from .database import engine, get_db
+from .embeddings import MAX_FEATURES, load_embedding_cache
 from .errors import handle_database_error
 from .models import Entity, EntityOut
 
 router = APIRouter()
 
-# Module-level vectorizer for consistent embeddings
-_vectorizer: TfidfVectorizer | None = None
-
-
-def _get_entity_text(entity: Entity) -> str:
-    """Extract text representation from entity for embedding."""
-    parts = [entity.name]
-    if entity.description:
-        parts.append(entity.description)
-    return " ".join(parts)
+# Similarities, or dense embedding values, computed at once by the exact search, bounding its memory
+EXACT_BLOCK_ELEMENTS = 4_000_000
+# Jumps from each anchor of the approximate search; most stop after two or three
+MAX_SWEEPS = 8
 
 
-def generate_embeddings(entities: Sequence[Entity]) -> np.ndarray:
-    """Generate TF-IDF embeddings for a list of entities.
+def generate_embeddings(entities: Sequence[Entity], bind: Engine = engine) -> sparse.csr_matrix | np.ndarray:
+    """Get TF-IDF or hashed embeddings for a list of entities.
 
-    Uses TF-IDF vectorization on entity name and description to create
-    meaningful text-based embeddings for similarity comparison.
+    Embeddings of entity name and description come from the resident
+    embedding cache; only entities without a stored embedding are
+    transformed.
 
     Args:
         entities: Sequence of Entity objects to embed
+        bind: Engine of the database the entities were loaded from
 
     Returns:
-        numpy array of shape (n_entities, n_features) containing embeddings
+        CSR matrix of shape (n_entities, n_features) containing embeddings,
+        or a dense array if there is no vocabulary to embed with
     """
-    global _vectorizer
-
     if len(entities) == 0:
         return np.array([])
 
-    # Extract text from entities
-    texts = [_get_entity_text(entity) for entity in entities]
-
-    # Create or refit vectorizer
-    # Note: In production, consider using pre-trained embeddings
-    # (e.g., sentence-transformers, OpenAI embeddings) for better quality
-    _vectorizer = TfidfVectorizer(
-        max_features=100,
-        stop_words="english",
-        ngram_range=(1, 2),
-    )
-
-    try:
-        embeddings = _vectorizer.fit_transform(texts).toarray()
-    except ValueError:
-        # If vectorization fails (e.g., all stop words), return random embeddings
-        embeddings = np.random.rand(len(entities), 100)
-
+    embeddings = load_embedding_cache(bind).embed(entities)
+    if embeddings.shape[1] == 0:
+        # No usable vocabulary (e.g. all stop words), return random embeddings
+        embeddings = np.random.rand(len(entities), MAX_FEATURES)
     return embeddings
 
 
@@ -80,8 +77,16 @@ def get_dissimilar_entities(db: Session, n: int = 2) -> list[Entity]:
     Returns:
         List of n most dissimilar entities
     """
-    entities = db.query(Entity).all()
+    return select_dissimilar_entities(db.query(Entity).all(), n, db.get_bind())
+
 
+def select_dissimilar_entities(entities: Sequence[Entity], n: int = 2, bind: Engine = engine) -> list[Entity]:
+    """Pick the most dissimilar pair from already loaded entities.
+
+    This is the CPU-bound part of :func:`get_dissimilar_entities`, split out
+    so async callers can load entities themselves and run it in a thread.
+    ``bind`` is the engine of the database the entities were loaded from.
+    """
     if len(entities) < n:
         return list(entities)
 
@@ -89,18 +94,94 @@ def get_dissimilar_entities(db: Session, n: int = 2) -> list[Entity]:
         return list(entities)
 
     # Generate embeddings for all entities
-    embeddings = generate_embeddings(entities)
+    # Normalizing keeps sparse rows sparse; cached rows are normalized already
+    embeddings = normalize(generate_embeddings(entities, bind)).astype(np.float32)
+
+    exact_max, anchors = get_dissimilar_search_config()
+    if len(entities) <= exact_max:
+        first, second, _ = most_dissimilar_pair(embeddings)
+    else:
+        first, second, _ = approximate_most_dissimilar_pair(embeddings, anchors)
 
-    # Calculate pairwise cosine similarity
-    similarities = cosine_similarity(embeddings)
+    return [entities[first], entities[second]]
 
-    # Set diagonal to 1 to avoid selecting same entity
-    np.fill_diagonal(similarities, 1.0)
 
-    # Find the pair with lowest similarity (most dissimilar)
-    most_dissimilar_pair = np.unravel_index(np.argmin(similarities), similarities.shape)
+def _dense_row(embeddings: sparse.csr_matrix | np.ndarray, row: int) -> np.ndarray:
+    if sparse.issparse(embeddings):
+        return embeddings[row].toarray().ravel()
+    return embeddings[row]
 
-    return [entities[most_dissimilar_pair[0]], entities[most_dissimilar_pair[1]]]
+
+def most_dissimilar_pair(embeddings: sparse.csr_matrix | np.ndarray) -> tuple[int, int, float]:
+    """Exact pair of rows with the lowest cosine similarity.
+
+    Args:
+        embeddings: L2-normalized rows, at least two, as a CSR matrix or dense array
+
+    Returns:
+        Tuple of ``(i, j, similarity)``; ties go to the first pair in row order
+    """
+    n, dimensions = embeddings.shape
+    # Sparse blocks are made dense, which is wider than the similarities with hashed embeddings
+    block = max(1, EXACT_BLOCK_ELEMENTS // max(n, dimensions))
+    best = (np.inf, 0, 1)
+    is_sparse = sparse.issparse(embeddings)
+    # Without negative weights no pair is below zero, so the first zero found is the answer
+    floor = 0.0 if (embeddings.data if is_sparse else embeddings).min(initial=0.0) >= 0 else -np.inf
+    for start in range(0, n, block):
+        if is_sparse:
+            # The sparse rows times a dense block costs one pass over the non-zeros per block row
+            similarities = np.ascontiguousarray((embeddings @ embeddings[start : start + block].toarray().T).T)
+        else:
+            similarities = embeddings[start : start + block] @ embeddings.T
+        # Never pair an entity with itself
+        rows = np.arange(len(similarities))
+        similarities[rows, start + rows] = np.inf
+        row, column = np.unravel_index(np.argmin(similarities), similarities.shape)
+        if similarities[row, column] < best[0]:
+            best = (float(similarities[row, column]), start + int(row), int(column))
+        if best[0] <= floor:
+            break
+    similarity, first, second = best
+    return first, second, similarity
+
+
+def approximate_most_dissimilar_pair(
+    embeddings: sparse.csr_matrix | np.ndarray, anchors: int, seed: int = 0
+) -> tuple[int, int, float]:
+    """Pair of rows with a low cosine similarity, found in ``O(anchors * n)`` time.
+
+    From each anchor row, jumps to the row least similar to the current one
+    until the pair stops improving. More anchors find better pairs more
+    reliably, at proportionally more time. Anchors are drawn with ``seed``,
+    so the same embeddings give the same pair.
+
+    Args:
+        embeddings: L2-normalized rows, at least two, as a CSR matrix or dense array
+        anchors: Number of starting rows
+        seed: Seed for drawing the anchors
+
+    Returns:
+        Tuple of ``(i, j, similarity)``
+    """
+    n = embeddings.shape[0]
+    rng = np.random.default_rng(seed)
+    best = (np.inf, 0, 1)
+    for current in rng.choice(n, size=min(anchors, n), replace=False).tolist():
+        previous_best = np.inf
+        for _ in range(MAX_SWEEPS):
+            # A sparse matrix times a dense vector costs one pass over the non-zeros
+            similarities = embeddings @ _dense_row(embeddings, current)
+            similarities[current] = np.inf
+            farthest = int(np.argmin(similarities))
+            similarity = float(similarities[farthest])
+            if similarity < best[0]:
+                best = (similarity, current, farthest)
+            if similarity >= previous_best:
+                break
+            previous_best, current = similarity, farthest
+    similarity, first, second = best
+    return first, second, similarity
 
 
 @router.get("/dissimilar_entities", response_model=list[EntityOut])
@@ -0,0 +1,229 @@
+"""
+Durable vote queue: acknowledge comparisons immediately and apply them in batches.
+
+With ``VOTE_QUEUE_ENABLED=true``, ``POST /comparisons/`` stores the vote in
+the ``pending_votes`` table and returns 202. A background worker drains the
+table oldest first in micro-batches, applying the Elo and MAB updates in
+submission order with one commit per batch. Consumed votes are deleted in
+the same transaction, so a crash neither loses nor double-applies a vote.
+"""
+
+import logging
+import threading
+from collections.abc import Callable
+from datetime import UTC, datetime
+
+from fastapi import APIRouter, Depends
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+
+from .comparison import record_comparisons
+from .config import get_vote_queue_config
+from .database import SessionLocal, get_async_db
+from .errors import handle_database_error
+from .history import as_utc
+from .mab import apply_mab_results
+from .models import ComparisonCreate, PendingVote, VoteQueueStats
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def apply_votes(db: Session, votes: list[PendingVote]) -> tuple[int, int]:
+    """Apply pending votes in one transaction and remove them from the queue.
+
+    Votes that are no longer valid, e.g. because an entity was deleted while
+    they were queued, are dropped and logged.
+
+    Returns:
+        Tuple of ``(applied, rejected)``
+
+    Raises:
+        StaleDataError: If another worker consumed some of the votes first
+    """
+    vote_ids = [vote.id for vote in votes]
+    comparisons = [
+        ComparisonCreate(
+            entity1_id=vote.entity1_id, entity2_id=vote.entity2_id, selected_entity_id=vote.selected_entity_id
+        )
+        for vote in votes
+    ]
+    row_values = [{"created_at": vote.created_at, "idempotency_key": vote.idempotency_key} for vote in votes]
+
+    def consume(db: Session, created: list[ComparisonCreate]) -> None:
+        apply_mab_results(db, [(c.entity1_id, c.entity2_id, c.selected_entity_id) for c in created])
+        deleted = db.query(PendingVote).filter(PendingVote.id.in_(vote_ids)).delete(synchronize_session=False)
+        if deleted != len(vote_ids):
+            raise StaleDataError("Queued votes were consumed by another worker")
+
+    results = record_comparisons(
+        db, comparisons, row_values=row_values, before_commit=consume, return_comparisons=False
+    )
+    rejected = [result for result in results if result["status"] == "error"]
+    for result in rejected:
+        logger.warning(f"Dropped queued vote {vote_ids[result['index']]}: {result['error']}")
+    return len(results) - len(rejected), len(rejected)
+
+
+def drop_vote(db: Session, vote_id: int) -> None:
+    db.query(PendingVote).filter(PendingVote.id == vote_id).delete(synchronize_session=False)
+    db.commit()
+
+
+def drain_once(db: Session, batch_size: int) -> tuple[int, int]:
+    """Apply the oldest ``batch_size`` queued votes.
+
+    If the batch fails for a reason other than a write conflict, its votes
+    are applied one at a time so that a single bad vote cannot block the
+    queue; votes that still fail are dropped and logged.
+
+    Returns:
+        Tuple of ``(applied, rejected)``; both are zero if the queue is empty
+    """
+    votes = db.query(PendingVote).order_by(PendingVote.id).limit(batch_size).all()
+    if not votes:
+        return 0, 0
+    try:
+        return apply_votes(db, votes)
+    except StaleDataError:
+        db.rollback()
+        raise
+    except SQLAlchemyError as e:
+        db.rollback()
+        if len(votes) == 1:
+            logger.error(f"Dropped queued vote {votes[0].id}: {e}")
+            drop_vote(db, votes[0].id)
+            return 0, 1
+        logger.warning(f"Queued batch of {len(votes)} votes failed, applying them one at a time: {e}")
+
+    applied = rejected = 0
+    for _ in votes:
+        vote_applied, vote_rejected = drain_once(db, 1)
+        applied += vote_applied
+        rejected += vote_rejected
+    return applied, rejected
+
+
+def queue_depth(db: Session) -> tuple[int, datetime | None]:
+    """Number of queued votes and the time the oldest one was queued."""
+    depth, oldest = db.execute(select(func.count(PendingVote.id), func.min(PendingVote.created_at))).one()
+    return depth, as_utc(oldest) if oldest else None
+
+
+class VoteQueueWorker:
+    """Background thread that drains the vote queue.
+
+    The worker sleeps for ``poll_interval`` seconds whenever the queue is
+    empty and drains back to back while it is not.
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        poll_interval: float,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.session_factory = session_factory
+        self.applied = 0
+        self.rejected = 0
+        self.batches = 0
+        self.last_batch_size = 0
+        self.last_applied_at: datetime | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def drain(self) -> int:
+        """Apply one batch, returning the number of votes taken off the queue."""
+        with self.session_factory() as db:
+            applied, rejected = drain_once(db, self.batch_size)
+        if applied or rejected:
+            self.applied += applied
+            self.rejected += rejected
+            self.batches += 1
+            self.last_batch_size = applied + rejected
+            self.last_applied_at = datetime.now(UTC)
+        return applied + rejected
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                drained = self.drain()
+            except StaleDataError as e:
+                logger.warning(f"Vote queue batch conflicted, retrying: {e}")
+                continue
+            except Exception:
+                logger.exception("Vote queue worker failed to apply a batch")
+                drained = 0
+            if not drained:
+                self._stop.wait(self.poll_interval)
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="vote-queue-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop after the batch in progress; queued votes stay in the table."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+_worker: VoteQueueWorker | None = None
+
+
+def get_vote_worker() -> VoteQueueWorker | None:
+    return _worker
+
+
+def start_vote_worker() -> VoteQueueWorker:
+    """Start the process-wide vote queue worker."""
+    global _worker
+    if _worker is None:
+        _, batch_size, poll_interval = get_vote_queue_config()
+        _worker = VoteQueueWorker(batch_size, poll_interval)
+        _worker.start()
+        logger.info(f"Vote queue worker started (batch size {batch_size})")
+    return _worker
+
+
+def stop_vote_worker() -> None:
+    global _worker
+    if _worker is not None:
+        _worker.stop()
+        _worker = None
+
+
+# NOTE: This router MUST be included BEFORE the comparison router
+# otherwise "queue" gets interpreted as a comparison_id parameter
+@router.get("/comparisons/queue", response_model=VoteQueueStats)
+async def get_vote_queue_stats(db: AsyncSession = Depends(get_async_db)) -> dict:
+    """Get the depth and apply lag of the vote queue.
+
+    ``lag_seconds`` is the age of the oldest vote still waiting to be applied,
+    and zero when the queue is empty.
+    """
+    try:
+        depth, oldest = await db.run_sync(queue_depth)
+    except SQLAlchemyError as e:
+        handle_database_error(e, "get vote queue stats")
+
+    worker = get_vote_worker()
+    return {
+        "enabled": get_vote_queue_config()[0],
+        "depth": depth,
+        "lag_seconds": (datetime.now(UTC) - oldest).total_seconds() if oldest else 0.0,
+        "oldest_queued_at": oldest,
+        "applied": worker.applied if worker else 0,
+        "rejected": worker.rejected if worker else 0,
+        "batches": worker.batches if worker else 0,
+        "last_batch_size": worker.last_batch_size if worker else 0,
+        "last_applied_at": worker.last_applied_at if worker else None,
+    }
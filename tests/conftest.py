@@ -3,13 +3,20 @@ Pytest configuration and fixtures for all tests.
 """
 
 import os
+import shutil
 import sys
+import tempfile
 
 import pytest
 
 # Add the compere package to the path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
+# Each run gets a fresh database unless one is configured; the configuration is
+# read once on import, so this has to happen before any test module imports compere
+_database_dir = tempfile.mkdtemp(prefix="compere-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_database_dir, 'compere.db')}")
+
 
 @pytest.fixture(scope="session", autouse=True)
 def setup_test_environment():
@@ -24,6 +31,7 @@ def setup_test_environment():
     yield
 
     # Don't drop tables at end - let other tests run
+    shutil.rmtree(_database_dir, ignore_errors=True)
 
 
 def clear_config_cache():
@@ -24,6 +24,12 @@ class TestAPIEndpoints:
         # This would be a health check endpoint if we had one
         pass
 
+    def test_readiness_endpoint(self):
+        """Test that the readiness check reaches the database through the async engine"""
+        response = client.get("/health/ready")
+        assert response.status_code == 200
+        assert response.json()["database"] == "connected"
+
     def test_create_entity_endpoint(self):
         """Test entity creation endpoint"""
         entity_data = {
@@ -0,0 +1,160 @@
+"""
+Tests for entity name autocomplete.
+"""
+
+import os
+import sys
+import time
+import uuid
+
+import numpy as np
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add the compere package to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compere.main import app
+from compere.modules.autocomplete import AutocompleteIndex, get_autocomplete_index, name_keys, top_rated
+from compere.modules.database import Base, SessionLocal
+from compere.modules.models import Entity
+
+client = TestClient(app)
+
+
+def _names(suggestions):
+    return [suggestion["name"] for suggestion in suggestions]
+
+
+def _refresh():
+    """Run the refresh the background thread would."""
+    client.get("/entities/autocomplete", params={"prefix": "x"})
+    with SessionLocal() as db:
+        get_autocomplete_index().refresh(db)
+
+
+class TestAutocompleteIndex:
+    def test_name_keys(self):
+        assert name_keys("Blue Bottle  Coffee") == ["blue bottle coffee", "bottle coffee", "coffee"]
+        assert name_keys("Café Über") == ["cafe uber", "uber"]
+        assert name_keys("!!!") == []
+
+    def test_matches_word_prefixes_by_rating(self):
+        index = AutocompleteIndex()
+        index.build([(1, "Blue Bottle Coffee", 1500.0), (2, "Bottega", 1600.0), (3, "Burger Barn", 1400.0)])
+
+        assert _names(index.complete("BOT", 10)) == ["Bottega", "Blue Bottle Coffee"]
+        assert _names(index.complete("blue  bot", 10)) == ["Blue Bottle Coffee"]
+        assert _names(index.complete("b", 2)) == ["Bottega", "Blue Bottle Coffee"]
+        assert _names(index.complete("ottle", 10)) == []
+        assert index.complete("  ", 10) == []
+
+    def test_incremental_updates(self):
+        index = AutocompleteIndex()
+        index.build([])
+        index.add(5000, "Noodle Noodle House", 1500.0)
+        index.add(7, "Noodle Bar", 1550.0)
+        # Repeated words give one suggestion per entity
+        assert [s["id"] for s in index.complete("noodle", 10)] == [7, 5000]
+
+        index.add(7, "Ramen Bar", 1550.0)
+        assert _names(index.complete("noodle", 10)) == ["Noodle Noodle House"]
+        assert _names(index.complete("ram", 10)) == ["Ramen Bar"]
+
+        index.remove(5000)
+        assert index.complete("noodle", 10) == []
+        assert len(index) == 1
+
+    def test_merge_keeps_lookups(self):
+        index = AutocompleteIndex()
+        index.build([(1, "Noodle Bar", 1500.0), (2, "Noodle House", 1600.0), (3, "Ramen Bar", 1400.0)])
+        index.add(4, "Noodle Shop", 1700.0)
+        index.add(2, "Udon House", 1600.0)
+        index.remove(3)
+        expected = {prefix: index.complete(prefix, 10) for prefix in ("noodle", "udon", "bar", "house", "r")}
+
+        index.merge()
+
+        assert {prefix: index.complete(prefix, 10) for prefix in expected} == expected
+        assert _names(expected["noodle"]) == ["Noodle Shop", "Noodle Bar"]
+        assert _names(expected["bar"]) == ["Noodle Bar"]
+        assert index._new_keys == [] and index._stale_ids == set()
+
+    def test_background_refresh(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'autocomplete.db'}")
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine)
+        index = AutocompleteIndex()
+        with session_factory() as db:
+            db.add(Entity(id=1, name="Refreshed Wombat", description="", image_urls=[], rating=1500.0))
+            db.commit()
+            index.load(db)
+            db.add(Entity(id=2, name="Refreshed Quokka", description="", image_urls=[], rating=1600.0))
+            db.query(Entity).filter(Entity.id == 1).update({Entity.rating: 1700.0})
+            db.commit()
+        index.add(2, "Refreshed Quokka", 1600.0)
+
+        index.start(0.01, session_factory=session_factory)
+        try:
+            deadline = time.monotonic() + 5
+            while index.complete("refreshed", 1)[0]["id"] != 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            index.stop()
+            engine.dispose()
+
+        assert _names(index.complete("refreshed", 10)) == ["Refreshed Wombat", "Refreshed Quokka"]
+        assert index._new_keys == []
+
+    def test_top_rated_matches_full_sort(self):
+        rng = np.random.default_rng(0)
+        ids = rng.integers(0, 300, 1000)
+        ratings = np.round(rng.normal(1500, 50, 300))[ids]
+        unique_ids = np.unique(ids)
+        expected = sorted(unique_ids.tolist(), key=lambda i: (-ratings[ids == i][0], -i))
+
+        for limit in (1, 10, 200, 400):
+            assert top_rated(ids, ratings, limit).tolist() == expected[:limit]
+
+
+class TestAutocompleteEndpoint:
+    def test_follows_entity_changes(self):
+        # Names are unique per run, the database is shared with earlier runs
+        tag = uuid.uuid4().hex[:8]
+        created = [
+            client.post("/entities/", json={"name": name, "description": "Typeahead", "image_urls": []}).json()
+            for name in [f"Quokka {tag} Cafe", f"Quokka {tag} Diner"]
+        ]
+        with SessionLocal() as db:
+            db.query(Entity).filter(Entity.id == created[1]["id"]).update({Entity.rating: 5000.0})
+            db.commit()
+
+        _refresh()
+
+        response = client.get("/entities/autocomplete", params={"prefix": f"quokka {tag}"})
+        assert response.status_code == 200
+        assert _names(response.json()) == [f"Quokka {tag} Diner", f"Quokka {tag} Cafe"]
+        assert response.json()[0]["rating"] == 5000.0
+
+        client.put(f"/entities/{created[0]['id']}", json={"name": f"Wombat {tag} Cafe"})
+        suggestions = client.get("/entities/autocomplete", params={"prefix": f"wombat {tag}"}).json()
+        assert _names(suggestions) == [f"Wombat {tag} Cafe"]
+
+        client.delete(f"/entities/{created[1]['id']}")
+        assert client.get("/entities/autocomplete", params={"prefix": f"quokka {tag}"}).json() == []
+
+    def test_sees_entities_added_elsewhere(self):
+        tag = uuid.uuid4().hex[:8]
+        client.get("/entities/autocomplete", params={"prefix": "x"})
+        with SessionLocal() as db:
+            db.add(Entity(name=f"Imported Platypus {tag}", description="", image_urls=[], rating=1500.0))
+            db.commit()
+
+        _refresh()
+
+        suggestions = client.get("/entities/autocomplete", params={"prefix": f"platypus {tag}"}).json()
+        assert _names(suggestions) == [f"Imported Platypus {tag}"]
+
+    def test_requires_prefix(self):
+        assert client.get("/entities/autocomplete").status_code == 422
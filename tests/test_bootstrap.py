@@ -0,0 +1,177 @@
+"""
+Tests for bootstrap rating intervals.
+"""
+
+import os
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+# Add the compere package to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compere.main import app
+from compere.modules import bootstrap
+from compere.modules.bootstrap import bootstrap_intervals, cell_pairs, get_rating_intervals
+from compere.modules.database import SessionLocal
+
+client = TestClient(app)
+
+
+def cells_from_wins(wins):
+    """Aggregated cells for a dense matrix of win counts"""
+    idx1, idx2 = np.nonzero(wins)
+    return idx1, idx2, np.ones(len(idx1)), wins[idx1, idx2].astype(np.float64)
+
+
+@pytest.fixture
+def wins():
+    # Entity 0 beats everyone, entities 1 and 2 are evenly matched, entity 3 loses
+    return np.array(
+        [
+            [0, 30, 30, 30],
+            [2, 0, 15, 25],
+            [2, 15, 0, 25],
+            [1, 5, 5, 0],
+        ]
+    )
+
+
+class TestBootstrapIntervals:
+    def test_intervals_contain_estimates(self, wins):
+        bounds = bootstrap_intervals(cells_from_wins(wins), 4, rounds=100, seed=1)
+
+        assert np.all(bounds["theta_lower"] <= bounds["theta"])
+        assert np.all(bounds["theta"] <= bounds["theta_upper"])
+        assert bounds["rank"].tolist()[0] == 1
+        assert (bounds["rank_lower"][0], bounds["rank_upper"][0]) == (1, 1)
+        # The tied pair can swap places
+        assert bounds["rank_lower"][1] == bounds["rank_lower"][2] == 2
+        assert bounds["rank_upper"][1] == bounds["rank_upper"][2] == 3
+
+    def test_more_votes_narrow_intervals(self, wins):
+        small = bootstrap_intervals(cells_from_wins(wins), 4, rounds=100, seed=1)
+        large = bootstrap_intervals(cells_from_wins(wins * 20), 4, rounds=100, seed=1)
+
+        assert np.all(large["theta_upper"] - large["theta_lower"] < small["theta_upper"] - small["theta_lower"])
+
+    def test_seed_is_reproducible(self, wins):
+        first = bootstrap_intervals(cells_from_wins(wins), 4, rounds=20, seed=7)
+        second = bootstrap_intervals(cells_from_wins(wins), 4, rounds=20, seed=7)
+        np.testing.assert_array_equal(first["theta_lower"], second["theta_lower"])
+
+    def test_worker_processes(self, wins):
+        bounds = bootstrap_intervals(cells_from_wins(wins), 4, rounds=20, workers=2, seed=1)
+        assert bounds["rank_lower"][0] == 1
+        assert np.all(bounds["theta_lower"] <= bounds["theta_upper"])
+
+    def test_cell_pairs_merge_directions_and_skip_self_comparisons(self):
+        # 0 beats 1 twice, 1 beats 0 once, a tie between 2 and 0, and a self-comparison
+        cells = (np.array([0, 1, 2, 1]), np.array([1, 0, 0, 1]), np.array([1.0, 1.0, 0.5, 1.0]), np.ones(4))
+        pair_i, pair_j, cell_pair, cell_wins = cell_pairs(cells, 3)
+
+        assert list(zip(pair_i.tolist(), pair_j.tolist(), strict=True)) == [(0, 1), (0, 2)]
+        assert cell_pair.tolist() == [0, 0, 1, 2]
+        assert cell_wins[:3].tolist() == [1.0, 0.0, 0.5]
+
+    def test_no_comparisons(self):
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+        bounds = bootstrap_intervals(empty, 3, rounds=10)
+        assert np.all(bounds["theta_lower"] == bounds["theta_upper"])
+
+
+class TestIntervalsEndpoint:
+    def test_intervals_are_sorted_and_cached(self):
+        ids = [
+            client.post("/entities/", json={"name": f"Interval {i}", "description": "", "image_urls": []}).json()["id"]
+            for i in range(3)
+        ]
+        for _ in range(5):
+            client.post(
+                "/comparisons/", json={"entity1_id": ids[0], "entity2_id": ids[1], "selected_entity_id": ids[0]}
+            )
+
+        with patch("compere.modules.bootstrap.bootstrap_intervals", wraps=bootstrap_intervals) as compute:
+            first = client.get("/ratings/intervals", params={"rounds": 20, "seed": 3})
+            second = client.get("/ratings/intervals", params={"rounds": 20, "seed": 3})
+
+        assert first.status_code == 200
+        assert first.json() == second.json()
+        assert compute.call_count == 1
+
+        body = first.json()
+        assert body["rounds"] == 20
+        ranks = [interval["rank"] for interval in body["intervals"]]
+        assert ranks == sorted(ranks)
+        for interval in body["intervals"]:
+            assert interval["rating_lower"] <= interval["rating_upper"]
+            assert interval["rank_lower"] <= interval["rank_upper"]
+
+    def test_cache_sees_delete_then_create(self):
+        """Replacing an entity keeps both counts but must not serve the old intervals"""
+        ids = [
+            client.post("/entities/", json={"name": f"Replaced {i}", "description": "", "image_urls": []}).json()["id"]
+            for i in range(3)
+        ]
+        client.post("/comparisons/", json={"entity1_id": ids[0], "entity2_id": ids[2], "selected_entity_id": ids[0]})
+        params = {"rounds": 10, "seed": 5}
+        listed = {
+            interval["entity"]["id"] for interval in client.get("/ratings/intervals", params=params).json()["intervals"]
+        }
+        assert ids[1] in listed
+
+        client.delete(f"/entities/{ids[1]}")
+        new_id = client.post("/entities/", json={"name": "Replacement", "description": "", "image_urls": []}).json()[
+            "id"
+        ]
+        intervals = client.get("/ratings/intervals", params=params).json()["intervals"]
+        listed = {interval["entity"]["id"] for interval in intervals}
+        assert new_id in listed
+        assert ids[1] not in listed
+
+    def test_concurrent_requests_share_one_computation(self):
+        started = threading.Barrier(3, timeout=10)
+        release = threading.Event()
+        calls = []
+        original = bootstrap.compute_rating_intervals
+
+        def blocking(db, state, rounds, *args):
+            calls.append(rounds)
+            if rounds != 6:
+                # Another key computes at the same time instead of waiting for this one
+                started.wait()
+                release.wait(10)
+            return original(db, state, rounds, *args)
+
+        results = {}
+
+        def request(name, rounds):
+            with SessionLocal() as db:
+                results[name] = get_rating_intervals(db, rounds=rounds, seed=11)
+
+        with patch("compere.modules.bootstrap.compute_rating_intervals", side_effect=blocking):
+            threads = [threading.Thread(target=request, args=(name, 5)) for name in ("first", "second")]
+            threads[0].start()
+            while not calls:
+                time.sleep(0.01)
+            threads[1].start()
+            other = threading.Thread(target=request, args=("other", 7))
+            other.start()
+            started.wait()
+            # A third key is not held up by the two computations in progress
+            request("quick", 6)
+            release.set()
+            for thread in [*threads, other]:
+                thread.join(10)
+
+        assert sorted(calls) == [5, 6, 7]
+        assert results["first"] is results["second"]
+        assert results["other"]["rounds"] == 7
+
+    def test_invalid_confidence(self):
+        assert client.get("/ratings/intervals", params={"confidence": 1.5}).status_code == 422
@@ -0,0 +1,153 @@
+"""
+Tests for the Bradley-Terry ranking engine.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from scipy import sparse
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add the compere package to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compere.main import app
+from compere.modules.bradley_terry import fit_bradley_terry, fit_strengths, get_bradley_terry_ratings
+from compere.modules.database import Base
+from compere.modules.models import Comparison, Entity
+
+engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db_session():
+    """Create a fresh database session for each test"""
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+def _win_matrix(n, votes):
+    """Build a win matrix from (winner, loser) index pairs"""
+    winners, losers = zip(*votes, strict=True)
+    return sparse.coo_matrix((np.ones(len(votes)), (winners, losers)), shape=(n, n)).tocsr()
+
+
+class TestFitStrengths:
+    """Test the Newton solver on win-count matrices"""
+
+    def test_recovers_ordering(self):
+        """Strengths should follow the win record"""
+        votes = [(0, 1)] * 8 + [(1, 0)] * 2 + [(1, 2)] * 7 + [(2, 1)] * 3 + [(0, 2)] * 9 + [(2, 0)]
+        theta, _ = fit_strengths(_win_matrix(3, votes))
+        assert theta[0] > theta[1] > theta[2]
+
+    def test_finite_for_undefeated_entities(self):
+        """The prior keeps strengths finite when an entity never lost"""
+        theta, _ = fit_strengths(_win_matrix(2, [(0, 1)] * 5))
+        assert np.all(np.isfinite(theta))
+        assert theta[0] > theta[1]
+
+    def test_symmetric_record_gives_equal_strengths(self):
+        """Entities with identical records should get identical strengths"""
+        theta, _ = fit_strengths(_win_matrix(2, [(0, 1), (1, 0)]))
+        assert theta[0] == pytest.approx(theta[1])
+
+    def test_warm_start_converges_faster(self):
+        """Starting from the previous solution should need fewer iterations"""
+        rng = np.random.default_rng(42)
+        n = 50
+        strength = rng.normal(size=n)
+        i = rng.integers(0, n, 2000)
+        j = rng.integers(0, n, 2000)
+        keep = i != j
+        i, j = i[keep], j[keep]
+        first_wins = rng.random(len(i)) < 1 / (1 + np.exp(strength[j] - strength[i]))
+        votes = list(zip(np.where(first_wins, i, j), np.where(first_wins, j, i), strict=True))
+
+        theta, cold_iterations = fit_strengths(_win_matrix(n, votes))
+        _, warm_iterations = fit_strengths(_win_matrix(n, [*votes, (0, 1)]), initial=theta)
+        assert warm_iterations < cold_iterations
+
+    def test_empty(self):
+        """An empty matrix gives an empty solution"""
+        theta, iterations = fit_strengths(sparse.csr_matrix((0, 0)))
+        assert len(theta) == 0
+        assert iterations == 0
+
+
+class TestFitFromDatabase:
+    """Test fitting from the comparison table"""
+
+    def test_fit_bradley_terry(self, db_session):
+        """Ratings should be keyed by entity ID and follow the win record"""
+        entities = [Entity(name=f"BT {i}", description="", image_urls=[], rating=1500.0) for i in range(3)]
+        db_session.add_all(entities)
+        db_session.commit()
+        a, b, c = (e.id for e in entities)
+        for e1, e2, winner in [(a, b, a), (a, b, a), (b, c, b), (b, c, b), (a, c, a), (c, a, a)]:
+            db_session.add(Comparison(entity1_id=e1, entity2_id=e2, selected_entity_id=winner))
+        db_session.commit()
+
+        ratings = fit_bradley_terry(db_session, warm_start=False)
+        assert set(ratings) == {a, b, c}
+        assert ratings[a] > ratings[b] > ratings[c]
+
+    def test_cache_sees_delete_then_create(self, db_session):
+        """Replacing an entity keeps both counts but must not serve the old fit"""
+        entities = [Entity(name=f"BT Cache {i}", description="", image_urls=[], rating=1500.0) for i in range(3)]
+        db_session.add_all(entities)
+        db_session.commit()
+        a, b, c = entities
+        db_session.add(Comparison(entity1_id=a.id, entity2_id=c.id, selected_entity_id=a.id))
+        db_session.commit()
+        assert set(get_bradley_terry_ratings(db_session)) == {a.id, b.id, c.id}
+
+        # Not the highest ID, so the new entity cannot reuse it
+        db_session.delete(b)
+        d = Entity(name="BT Cache 3", description="", image_urls=[], rating=1500.0)
+        db_session.add(d)
+        db_session.commit()
+        assert set(get_bradley_terry_ratings(db_session)) == {a.id, c.id, d.id}
+
+
+class TestRatingsEndpoint:
+    """Test the Bradley-Terry leaderboard"""
+
+    def test_ratings_model_bt(self):
+        """The bt model should return a sorted leaderboard"""
+        e1 = client.post("/entities/", json={"name": "BT Winner", "description": "", "image_urls": []}).json()
+        e2 = client.post("/entities/", json={"name": "BT Loser", "description": "", "image_urls": []}).json()
+        for _ in range(3):
+            client.post(
+                "/comparisons/",
+                json={"entity1_id": e1["id"], "entity2_id": e2["id"], "selected_entity_id": e1["id"]},
+            )
+
+        response = client.get("/ratings?model=bt")
+        assert response.status_code == 200
+        data = response.json()
+        ratings = [entity["rating"] for entity in data]
+        assert ratings == sorted(ratings, reverse=True)
+        by_id = {entity["id"]: entity["rating"] for entity in data}
+        assert by_id[e1["id"]] > by_id[e2["id"]]
+
+    def test_ratings_invalid_model(self):
+        """Unknown models should be rejected"""
+        response = client.get("/ratings?model=unknown")
+        assert response.status_code == 422
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,62 @@
+"""
+Tests for the bounded in-memory caches.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the compere package to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compere.modules.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+    """Test LRU eviction and expiry"""
+
+    def test_get_and_set(self):
+        """Stored values are returned until they expire"""
+        clock = FakeClock()
+        cache = TTLCache(maxsize=10, ttl=60, clock=clock)
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        assert cache.get("missing", "default") == "default"
+
+        clock.now = 61
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_least_recently_used_is_evicted(self):
+        """Reading an entry protects it from eviction"""
+        cache = TTLCache(maxsize=2, ttl=60, clock=FakeClock())
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    def test_expired_entries_are_pruned_on_set(self):
+        """Expired entries do not hold on to memory"""
+        clock = FakeClock()
+        cache = TTLCache(maxsize=10, ttl=60, clock=clock)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        clock.now = 100
+        cache.set("c", 3)
+        assert len(cache) == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -68,6 +68,62 @@ class TestCLI:
             assert result.exit_code == 0
             mock_run.assert_called_once_with("compere.main:app", host="0.0.0.0", port=8000, reload=True)
 
+    def test_cli_replay(self):
+        """Test replay subcommand rebuilds ratings without starting the server"""
+        runner = CliRunner()
+        summary = {"entities": 3, "comparisons": 10, "skipped": 1}
+        with (
+            patch("compere.cli.uvicorn.run") as mock_run,
+            patch("compere.modules.replay.replay_elo_ratings", return_value=summary) as mock_replay,
+        ):
+            result = runner.invoke(main, ["replay", "--k-factor", "16"])
+            assert result.exit_code == 0
+            mock_run.assert_not_called()
+            assert mock_replay.call_args.kwargs["k_factor"] == 16.0
+            assert "Replayed 10 comparisons over 3 entities" in result.output
+
+    def test_cli_replay_with_rating_store(self):
+        """Replaying under servers with a rating store needs --force"""
+        runner = CliRunner()
+        summary = {"entities": 3, "comparisons": 10, "skipped": 1}
+        with (
+            patch("compere.modules.config.get_rating_store_config", return_value=(True, 1.0, 1000)),
+            patch("compere.modules.replay.replay_elo_ratings", return_value=summary) as mock_replay,
+        ):
+            result = runner.invoke(main, ["replay"])
+            assert result.exit_code != 0
+            assert "RATING_STORE_ENABLED" in result.output
+            mock_replay.assert_not_called()
+
+            assert runner.invoke(main, ["replay", "--force"]).exit_code == 0
+            mock_replay.assert_called_once()
+
+    def test_cli_replay_refuses_glicko2(self):
+        """Replay rebuilds Elo ratings, which would overwrite Glicko-2 ones"""
+        runner = CliRunner()
+        with (
+            patch("compere.modules.config.get_rating_engine", return_value="glicko2"),
+            patch("compere.modules.replay.replay_elo_ratings") as mock_replay,
+        ):
+            for args in (["replay"], ["replay", "--force"]):
+                result = runner.invoke(main, args)
+                assert result.exit_code != 0
+                assert "RATING_ENGINE is glicko2" in result.output
+            mock_replay.assert_not_called()
+
+    def test_cli_import(self, tmp_path):
+        """Test import subcommand picks the format from the extension"""
+        path = tmp_path / "votes.csv"
+        path.write_text("entity1_id,entity2_id,selected_entity_id\n")
+        runner = CliRunner()
+        summary = {"imported": 5, "skipped": 1, "errors": ["line 3: invalid JSON"], "ratings_recomputed": True}
+        with patch("compere.modules.importer.import_comparison_file", return_value=summary) as mock_import:
+            result = runner.invoke(main, ["import", str(path), "--no-recompute"])
+            assert result.exit_code == 0
+            assert mock_import.call_args.args[2] == "csv"
+            assert mock_import.call_args.kwargs["recompute"] is False
+            assert "Imported 5 comparisons (1 skipped)" in result.output
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
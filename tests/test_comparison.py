@@ -4,6 +4,8 @@ Tests for comparison module - focusing on error handling and edge cases.
 
 import os
 import sys
+import uuid
+from unittest.mock import patch
 
 import pytest
 from fastapi.testclient import TestClient
@@ -12,6 +14,9 @@ from fastapi.testclient import TestClient
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
 from compere.main import app
+from compere.modules.comparison import MAX_BATCH_SIZE, get_idempotency_cache
+from compere.modules.config import get_elo_k_factor
+from compere.modules.rating import apply_elo_results
 
 client = TestClient(app)
 
@@ -150,6 +155,50 @@ class TestComparisonListing:
         for comp in comparisons:
             assert entity1["id"] in [comp["entity1_id"], comp["entity2_id"]]
 
+    def test_cursor_pagination_walks_entity_history(self):
+        """Following X-Next-Cursor visits every comparison of an entity exactly once"""
+        a, b, c = (
+            client.post("/entities/", json={"name": f"Cursor Entity {i}", "description": "", "image_urls": []}).json()
+            for i in range(3)
+        )
+        # Batched comparisons share a timestamp, single ones use the database default
+        batch = [{"entity1_id": a["id"], "entity2_id": b["id"], "selected_entity_id": a["id"]}] * 4
+        batch += [{"entity1_id": c["id"], "entity2_id": a["id"], "selected_entity_id": a["id"]}] * 3
+        client.post("/comparisons/batch", json=batch)
+        for _ in range(2):
+            client.post(
+                "/comparisons/", json={"entity1_id": b["id"], "entity2_id": a["id"], "selected_entity_id": b["id"]}
+            )
+        client.post("/comparisons/", json={"entity1_id": b["id"], "entity2_id": c["id"], "selected_entity_id": b["id"]})
+
+        seen = []
+        params = {"entity_id": a["id"], "limit": 4}
+        while True:
+            response = client.get("/comparisons/", params=params)
+            assert response.status_code == 200
+            seen.extend(comp["id"] for comp in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+            params["after"] = cursor
+
+        assert len(seen) == len(set(seen)) == 9
+        expected = client.get("/comparisons/", params={"entity_id": a["id"], "limit": 100}).json()
+        assert seen == [comp["id"] for comp in expected]
+
+    def test_cursor_pagination_all_comparisons(self):
+        """A cursor page continues exactly where the previous one ended"""
+        first = client.get("/comparisons/", params={"limit": 3})
+        cursor = first.headers["X-Next-Cursor"]
+        second = client.get("/comparisons/", params={"limit": 3, "after": cursor})
+        by_offset = client.get("/comparisons/", params={"limit": 6}).json()
+        assert [comp["id"] for comp in first.json() + second.json()] == [comp["id"] for comp in by_offset]
+
+    def test_invalid_cursor(self):
+        """Malformed cursors are rejected"""
+        response = client.get("/comparisons/", params={"after": "not-a-cursor"})
+        assert response.status_code == 400
+
 
 class TestGetComparison:
     """Test getting specific comparison"""
@@ -278,6 +327,27 @@ class TestRatingUpdates:
         assert updated_entity1["rating"] > initial_rating1
         assert updated_entity2["rating"] < initial_rating2
 
+    def test_rating_conflict_stores_no_comparison(self):
+        """A vote rejected with 409 leaves neither a comparison nor a rating change behind"""
+        entity1, entity2 = [
+            client.post(
+                "/entities/",
+                json={"name": f"Conflict Entity {i}", "description": "Test", "image_urls": []},
+            ).json()
+            for i in range(2)
+        ]
+        data = {"entity1_id": entity1["id"], "entity2_id": entity2["id"], "selected_entity_id": entity1["id"]}
+
+        with (
+            patch("compere.modules.rating.compare_and_set_ratings", return_value=False),
+            patch("compere.modules.rating.retry_delay", return_value=0),
+        ):
+            response = client.post("/comparisons/", json=data)
+
+        assert response.status_code == 409
+        assert client.get(f"/comparisons/?entity_id={entity1['id']}").json() == []
+        assert client.get(f"/entities/{entity1['id']}").json()["rating"] == entity1["rating"]
+
 
 class TestComparisonValidation:
     """Test comparison input validation"""
@@ -300,5 +370,144 @@ class TestComparisonValidation:
         assert response.status_code == 422
 
 
+class TestIdempotency:
+    """Test Idempotency-Key handling on comparison creation"""
+
+    def _create_pair(self):
+        return [
+            client.post(
+                "/entities/",
+                json={"name": f"Idempotent Entity {i}", "description": "Test", "image_urls": []},
+            ).json()
+            for i in range(2)
+        ]
+
+    def test_retry_returns_original_comparison(self):
+        """A retried request returns the first result and applies the vote once"""
+        a, b = self._create_pair()
+        data = {"entity1_id": a["id"], "entity2_id": b["id"], "selected_entity_id": a["id"]}
+        headers = {"Idempotency-Key": f"retry-{uuid.uuid4()}"}
+
+        first = client.post("/comparisons/", json=data, headers=headers)
+        rating_after_first = client.get(f"/entities/{a['id']}").json()["rating"]
+        second = client.post("/comparisons/", json=data, headers=headers)
+
+        assert first.status_code == second.status_code == 200
+        assert first.json() == second.json()
+        assert client.get(f"/entities/{a['id']}").json()["rating"] == rating_after_first
+
+    def test_retry_after_cache_eviction(self):
+        """The stored key is the source of truth when the cache has no entry"""
+        a, b = self._create_pair()
+        data = {"entity1_id": a["id"], "entity2_id": b["id"], "selected_entity_id": b["id"]}
+        headers = {"Idempotency-Key": f"evicted-{uuid.uuid4()}"}
+
+        first = client.post("/comparisons/", json=data, headers=headers)
+        get_idempotency_cache().clear()
+        second = client.post("/comparisons/", json=data, headers=headers)
+
+        assert second.status_code == 200
+        assert second.json()["id"] == first.json()["id"]
+
+    def test_retry_after_rating_conflict_records_vote(self):
+        """A key is only stored once the vote and its rating update succeeded"""
+        a, b = self._create_pair()
+        data = {"entity1_id": a["id"], "entity2_id": b["id"], "selected_entity_id": a["id"]}
+        headers = {"Idempotency-Key": f"conflict-{uuid.uuid4()}"}
+
+        with (
+            patch("compere.modules.rating.compare_and_set_ratings", return_value=False),
+            patch("compere.modules.rating.retry_delay", return_value=0),
+        ):
+            assert client.post("/comparisons/", json=data, headers=headers).status_code == 409
+        assert get_idempotency_cache().get(headers["Idempotency-Key"]) is None
+
+        retry = client.post("/comparisons/", json=data, headers=headers)
+        assert retry.status_code == 200
+        assert client.get(f"/entities/{a['id']}").json()["rating"] > a["rating"]
+
+    def test_key_reused_for_different_comparison(self):
+        """Reusing a key for another vote is a conflict"""
+        a, b = self._create_pair()
+        headers = {"Idempotency-Key": f"reused-{uuid.uuid4()}"}
+        data = {"entity1_id": a["id"], "entity2_id": b["id"], "selected_entity_id": a["id"]}
+
+        assert client.post("/comparisons/", json=data, headers=headers).status_code == 200
+        response = client.post("/comparisons/", json={**data, "selected_entity_id": b["id"]}, headers=headers)
+        assert response.status_code == 409
+
+    def test_without_key_creates_new_comparisons(self):
+        """Requests without a key are never deduplicated"""
+        a, b = self._create_pair()
+        data = {"entity1_id": a["id"], "entity2_id": b["id"], "selected_entity_id": a["id"]}
+        first = client.post("/comparisons/", json=data)
+        second = client.post("/comparisons/", json=data)
+        assert first.json()["id"] != second.json()["id"]
+
+
+class TestComparisonBatch:
+    """Test bulk comparison ingestion"""
+
+    def _create_entities(self, count):
+        return [
+            client.post(
+                "/entities/",
+                json={"name": f"Batch Entity {i}", "description": "Test", "image_urls": []},
+            ).json()
+            for i in range(count)
+        ]
+
+    def test_batch_matches_sequential_updates(self):
+        """A batch applies Elo updates in order, exactly like single submissions"""
+        a, b, c = self._create_entities(3)
+        votes = [(a, b, a), (b, c, b), (a, c, c), (a, b, a)]
+
+        ratings = {e["id"]: e["rating"] for e in (a, b, c)}
+        apply_elo_results(ratings, [(e1["id"], e2["id"], w["id"]) for e1, e2, w in votes], get_elo_k_factor())
+
+        response = client.post(
+            "/comparisons/batch",
+            json=[
+                {"entity1_id": e1["id"], "entity2_id": e2["id"], "selected_entity_id": w["id"]} for e1, e2, w in votes
+            ],
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["created"] == 4
+        assert data["failed"] == 0
+        assert [r["comparison"]["entity1_id"] for r in data["results"]] == [e1["id"] for e1, _, _ in votes]
+        assert [r["comparison"]["selected_entity_id"] for r in data["results"]] == [w["id"] for _, _, w in votes]
+        created_ids = [r["comparison"]["id"] for r in data["results"]]
+        assert created_ids == sorted(created_ids)
+
+        for entity_id, expected in ratings.items():
+            assert client.get(f"/entities/{entity_id}").json()["rating"] == pytest.approx(expected)
+
+    def test_batch_reports_item_errors(self):
+        """Invalid items are reported per index without rejecting the batch"""
+        a, b = self._create_entities(2)
+        response = client.post(
+            "/comparisons/batch",
+            json=[
+                {"entity1_id": a["id"], "entity2_id": b["id"], "selected_entity_id": a["id"]},
+                {"entity1_id": a["id"], "entity2_id": 99999, "selected_entity_id": a["id"]},
+                {"entity1_id": a["id"], "entity2_id": b["id"], "selected_entity_id": 99999},
+            ],
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["created"] == 1
+        assert data["failed"] == 2
+        assert [r["status"] for r in data["results"]] == ["created", "error", "error"]
+        assert "not found" in data["results"][1]["error"]
+        assert data["results"][1]["comparison"] is None
+
+    def test_batch_too_large(self):
+        """Batches above the size limit are rejected"""
+        item = {"entity1_id": 1, "entity2_id": 2, "selected_entity_id": 1}
+        response = client.post("/comparisons/batch", json=[item] * (MAX_BATCH_SIZE + 1))
+        assert response.status_code == 400
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
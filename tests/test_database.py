@@ -0,0 +1,80 @@
+"""
+Tests for database setup and additive schema migrations.
+"""
+
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+# Add the compere package to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compere.modules.database import init_db, run_migrations
+from compere.modules.models import Entity  # noqa: F401 - Import models to register them with SQLAlchemy
+
+
+@pytest.fixture
+def legacy_engine(tmp_path):
+    """An SQLite database with the original entities table"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE entities (id INTEGER PRIMARY KEY, name VARCHAR, description VARCHAR, "
+                "image_urls JSON, rating FLOAT)"
+            )
+        )
+        conn.execute(
+            text("INSERT INTO entities (name, description, image_urls, rating) VALUES ('Old', '', '[]', 1600)")
+        )
+    yield engine
+    engine.dispose()
+
+
+class TestMigrations:
+    """Test additive migrations on existing tables"""
+
+    def test_adds_missing_columns_with_defaults(self, legacy_engine):
+        """New columns are added and backfilled from their server defaults"""
+        run_migrations(legacy_engine)
+
+        columns = {column["name"] for column in inspect(legacy_engine).get_columns("entities")}
+        assert {"rating_deviation", "volatility"} <= columns
+
+        with legacy_engine.connect() as conn:
+            row = conn.execute(text("SELECT rating, rating_deviation, volatility FROM entities")).one()
+        assert row == (1600.0, 350.0, 0.06)
+
+    def test_adds_indexes_to_existing_tables(self, legacy_engine):
+        """Indexes introduced later are created on existing tables"""
+        with legacy_engine.begin() as conn:
+            conn.execute(
+                text(
+                    "CREATE TABLE comparisons (id INTEGER PRIMARY KEY, entity1_id INTEGER, entity2_id INTEGER, "
+                    "selected_entity_id INTEGER, created_at DATETIME)"
+                )
+            )
+        run_migrations(legacy_engine)
+
+        indexes = {index["name"] for index in inspect(legacy_engine).get_indexes("comparisons")}
+        assert {
+            "ix_comparisons_created_at_id",
+            "ix_comparisons_entity1_created_at_id",
+            "ix_comparisons_entity2_created_at_id",
+            "ix_comparisons_idempotency_key",
+        } <= indexes
+
+    def test_init_db_is_idempotent(self, legacy_engine):
+        """Running init_db repeatedly leaves the schema unchanged"""
+        init_db(legacy_engine)
+        init_db(legacy_engine)
+
+        inspector = inspect(legacy_engine)
+        assert "comparisons" in inspector.get_table_names()
+        assert "rating_periods" in inspector.get_table_names()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
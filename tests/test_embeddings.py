@@ -0,0 +1,382 @@
+"""
+Tests for the persistent entity embedding cache.
+"""
+
+import json
+import os
+import sys
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add the compere package to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compere.main import app
+from compere.modules.database import init_db
+from compere.modules.embedding_snapshot import MANIFEST, write_snapshot
+from compere.modules.embeddings import (
+    EmbeddingCache,
+    HashingModel,
+    TfidfModel,
+    entity_text,
+    get_embedding_cache,
+    transform_texts,
+)
+from compere.modules.models import EmbeddingModel, Entity, EntityEmbedding
+from compere.modules.similarity import generate_embeddings, get_dissimilar_entities
+
+client = TestClient(app)
+
+HASHING = {"backend": "hashing", "hash_features": 1024, "hash_idf": True, "workers": 1}
+
+TEXTS = [
+    ("Blue Bottle Coffee", "Third-wave coffee roaster"),
+    ("Burger Barn", "Smash burgers and fries"),
+    ("Noodle House", "Hand-pulled noodles and dumplings"),
+    ("Corner Cafe", "Coffee, pastries and sandwiches"),
+]
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'embeddings.db'}")
+    init_db(engine)
+    yield sessionmaker(bind=engine, expire_on_commit=False)
+    engine.dispose()
+
+
+def _add_entities(session_factory, texts):
+    with session_factory() as db:
+        entities = [Entity(name=name, description=description, image_urls=[]) for name, description in texts]
+        db.add_all(entities)
+        db.commit()
+        return entities
+
+
+def _count_transforms(cache):
+    """Patch the cache's model to count transformed texts."""
+    transformed = []
+    original = cache.model.transform
+
+    def transform(texts):
+        transformed.extend(texts)
+        return original(texts)
+
+    cache.model.transform = transform
+    return transformed
+
+
+class TestTfidfModel:
+    def test_matches_tfidf_vectorizer(self):
+        texts = [f"{name} {description}" for name, description in TEXTS]
+        vectorizer = TfidfVectorizer(max_features=100, stop_words="english", ngram_range=(1, 2))
+        expected = vectorizer.fit_transform(texts).toarray()
+
+        model = TfidfModel(1, vectorizer.vocabulary_, vectorizer.idf_)
+        np.testing.assert_allclose(model.transform(texts).toarray(), expected, rtol=1e-6)
+
+
+class TestHashingModel:
+    def test_rows_do_not_depend_on_other_texts(self):
+        model = HashingModel(1, 1024, idf=True)
+        texts = [f"{name} {description}" for name, description in TEXTS]
+        np.testing.assert_array_equal(model.transform(texts)[:1].toarray(), model.transform(texts[:1]).toarray())
+
+    def test_weights_match_tfidf_vectorizer(self):
+        texts = [f"{name} {description}" for name, description in TEXTS]
+        # Wide enough that no two terms share a column
+        model = HashingModel(1, 2**18, idf=True)
+        counts = model.transform(texts)
+        embeddings = model.weigh(counts, np.bincount(counts.indices, minlength=model.dimensions), len(texts))
+
+        expected = TfidfVectorizer(stop_words="english", ngram_range=(1, 2)).fit_transform(texts)
+        np.testing.assert_allclose((embeddings @ embeddings.T).toarray(), (expected @ expected.T).toarray(), rtol=1e-5)
+
+    def test_parallel_transform(self):
+        model = HashingModel(1, 1024, idf=False)
+        texts = [f"{name} {description}" for name, description in TEXTS]
+        with patch("compere.modules.embeddings.PARALLEL_MIN_TEXTS", 2):
+            embeddings = transform_texts(model, texts, workers=2)
+        np.testing.assert_array_equal(embeddings.toarray(), model.transform(texts).toarray())
+
+
+class TestEmbeddingCache:
+    def test_embeds_only_new_and_changed_text(self, session_factory):
+        entities = _add_entities(session_factory, TEXTS)
+        cache = EmbeddingCache(session_factory)
+        cache.load()
+        assert len(cache) == len(entities)
+        transformed = _count_transforms(cache)
+
+        first = cache.embed(entities)
+        assert first.shape == (len(entities), cache.model.dimensions)
+        np.testing.assert_array_equal(cache.embed(entities).toarray(), first.toarray())
+        cache.update(entities[1])
+        assert transformed == []
+
+        entities[1].description = "Burgers and milkshakes"
+        cache.update(entities[1])
+        assert transformed == [entity_text(entities[1])]
+
+        (new,) = _add_entities(session_factory, [("Taco Stand", "Tacos al pastor")])
+        cache.embed([*entities, new])
+        assert transformed[1:] == ["Taco Stand Tacos al pastor"]
+
+    def test_load_embeds_changed_text(self, session_factory):
+        entities = _add_entities(session_factory, TEXTS)
+        cache = EmbeddingCache(session_factory)
+        cache.load()
+        cache.embed(entities)
+        with session_factory() as db:
+            db.get(Entity, entities[0].id).name = "Renamed Elsewhere"
+            db.commit()
+
+        reloaded = EmbeddingCache(session_factory)
+        with patch.object(TfidfModel, "transform", autospec=True, side_effect=TfidfModel.transform) as transform:
+            reloaded.load()
+        assert transform.call_args.args[1] == ["Renamed Elsewhere Third-wave coffee roaster"]
+
+    def test_embeddings_persist(self, session_factory):
+        entities = _add_entities(session_factory, TEXTS)
+        cache = EmbeddingCache(session_factory)
+        cache.load()
+        embeddings = cache.embed(entities)
+
+        reloaded = EmbeddingCache(session_factory)
+        reloaded.load()
+        transformed = _count_transforms(reloaded)
+        assert len(reloaded) == len(entities)
+        np.testing.assert_array_equal(reloaded.embed(entities).toarray(), embeddings.toarray())
+        assert transformed == []
+
+    def test_refits_when_entities_outgrow_vocabulary(self, session_factory):
+        entities = _add_entities(session_factory, TEXTS[:2])
+        cache = EmbeddingCache(session_factory)
+        cache.load()
+        cache.embed(entities)
+        first_model = cache.model.id
+
+        entities += _add_entities(session_factory, TEXTS[2:])
+        cache.embed(entities)
+        assert cache.model.id != first_model
+        assert "noodles" in cache.model._counter.vocabulary
+        with session_factory() as db:
+            assert {row.model_id for row in db.query(EntityEmbedding)} == {cache.model.id}
+            assert db.query(EmbeddingModel).count() == 2
+
+    def test_remove(self, session_factory):
+        entities = _add_entities(session_factory, TEXTS)
+        cache = EmbeddingCache(session_factory)
+        cache.load()
+        embeddings = cache.embed(entities)
+
+        cache.remove(entities[0].id)
+        assert len(cache) == len(entities) - 1
+        np.testing.assert_array_equal(cache.embed(entities[1:]).toarray(), embeddings[1:].toarray())
+
+    def test_loads_dense_vectors(self, session_factory):
+        entities = _add_entities(session_factory, TEXTS)
+        cache = EmbeddingCache(session_factory)
+        cache.load()
+        embeddings = cache.embed(entities).toarray()
+        # Rows stored before embeddings were kept sparse have no indices
+        with session_factory() as db:
+            for row in db.query(EntityEmbedding):
+                position = [entity.id for entity in entities].index(row.entity_id)
+                row.indices = None
+                row.vector = embeddings[position].tobytes()
+            db.commit()
+
+        reloaded = EmbeddingCache(session_factory)
+        reloaded.load()
+        transformed = _count_transforms(reloaded)
+        np.testing.assert_array_equal(reloaded.embed(entities).toarray(), embeddings)
+        assert transformed == []
+
+    def test_compaction_keeps_rows(self, session_factory):
+        entities = _add_entities(session_factory, TEXTS)
+        cache = EmbeddingCache(session_factory)
+        cache.load()
+        expected = cache.model.transform([entity_text(entity) for entity in entities]).toarray()
+
+        # Rewriting rows fills the buffer with stale slices until it is compacted
+        with patch("compere.modules.embeddings.INITIAL_CAPACITY", 16):
+            cache._reset()
+            for _ in range(20):
+                cache._digests[:] = b""
+                for entity in entities:
+                    cache.update(entity)
+        assert len(cache._columns) < 4 * np.count_nonzero(expected)
+        np.testing.assert_array_equal(cache.embed(entities).toarray(), expected)
+
+
+@patch("compere.modules.embeddings.get_embedding_config", return_value=HASHING)
+class TestHashingCache:
+    def test_growth_neither_refits_nor_rewrites_rows(self, _, session_factory):
+        entities = _add_entities(session_factory, TEXTS[:1])
+        cache = EmbeddingCache(session_factory)
+        cache.load()
+        model_id = cache.model.id
+        with session_factory() as db:
+            stored = db.get(EntityEmbedding, entities[0].id).vector
+        transformed = _count_transforms(cache)
+
+        entities += _add_entities(session_factory, TEXTS[1:])
+        cache.embed(entities)
+        assert cache.model.id == model_id
+        assert transformed == [entity_text(entity) for entity in entities[1:]]
+        with session_factory() as db:
+            assert db.get(EntityEmbedding, entities[0].id).vector == stored
+
+    def test_document_counts_follow_changes(self, _, session_factory):
+        entities = _add_entities(session_factory, TEXTS)
+        cache = EmbeddingCache(session_factory)
+        cache.load()
+        entities[0].description = "Coffee and noodles"
+        cache.update(entities[0])
+        cache.remove(entities[1].id)
+
+        rows = cache._gather(np.arange(len(cache)))
+        np.testing.assert_array_equal(cache._document_counts, np.bincount(rows.indices, minlength=1024))
+        # Weighted by the remaining entities only
+        weighted = cache.model.weigh(rows, cache._document_counts, len(cache))
+        positions = [cache._rows[entity.id] for entity in entities[2:]]
+        np.testing.assert_array_equal(cache.embed(entities[2:]).toarray(), weighted[positions].toarray())
+
+    def test_switching_backend_reembeds(self, config, session_factory):
+        entities = _add_entities(session_factory, TEXTS)
+        config.return_value = {**HASHING, "backend": "tfidf"}
+        EmbeddingCache(session_factory).load()
+
+        config.return_value = HASHING
+        cache = EmbeddingCache(session_factory)
+        cache.load()
+        assert isinstance(cache.model, HashingModel)
+        with session_factory() as db:
+            assert {row.model_id for row in db.query(EntityEmbedding)} == {cache.model.id}
+        assert cache.embed(entities).shape == (len(entities), 1024)
+
+
+class TestEmbeddingSnapshot:
+    def test_write_replaces_previous_generation(self, tmp_path):
+        first = write_snapshot(str(tmp_path), {"rows": 2}, {"ids": (np.array([4, 7]), 8)})
+        second = write_snapshot(str(tmp_path), {"rows": 1}, {"ids": (np.array([9]), 8)})
+        assert sorted(os.listdir(tmp_path)) == sorted([MANIFEST, second])
+        assert first != second
+        assert len(np.load(tmp_path / second / "ids.npy")) == 8
+
+    def test_processes_share_snapshot(self, session_factory, tmp_path):
+        entities = _add_entities(session_factory, TEXTS)
+        writer = EmbeddingCache(session_factory, snapshot_dir=str(tmp_path))
+        assert writer.load() is False
+        embeddings = writer.embed(entities).toarray()
+
+        reader = EmbeddingCache(session_factory, snapshot_dir=str(tmp_path))
+        with patch.object(TfidfModel, "transform", autospec=True) as transform:
+            assert reader.load() is True
+            np.testing.assert_array_equal(reader.embed(entities).toarray(), embeddings)
+        transform.assert_not_called()
+        assert isinstance(reader._values, np.memmap)
+
+        # Changes write private pages only
+        entities[0].name = "Green Bottle Coffee"
+        reader.update(entities[0])
+        assert reader.embed(entities[:1]).nnz > 0
+        np.testing.assert_array_equal(writer.embed(entities[:1]).toarray(), embeddings[:1])
+
+    def test_refresh_picks_up_changes_since_snapshot(self, session_factory, tmp_path):
+        entities = _add_entities(session_factory, TEXTS)
+        EmbeddingCache(session_factory, snapshot_dir=str(tmp_path)).load()
+        with session_factory() as db:
+            db.get(Entity, entities[0].id).name = "Renamed Elsewhere"
+            db.delete(db.get(Entity, entities[1].id))
+            db.commit()
+
+        reader = EmbeddingCache(session_factory, snapshot_dir=str(tmp_path))
+        assert reader.load() is True
+        assert len(reader) == len(entities)
+        generation = json.loads((tmp_path / MANIFEST).read_text())["generation"]
+        transformed = _count_transforms(reader)
+        reader.refresh()
+        assert transformed == ["Renamed Elsewhere Third-wave coffee roaster"]
+        assert len(reader) == len(entities) - 1
+        assert json.loads((tmp_path / MANIFEST).read_text())["generation"] != generation
+
+    def test_refresh_keeps_newer_updates(self, session_factory):
+        entities = _add_entities(session_factory, TEXTS)
+        cache = EmbeddingCache(session_factory)
+        cache.load()
+
+        def session_during_update():
+            # Renamed while the refresh reads texts, which still have the old name
+            cache.session_factory = session_factory
+            entities[0].name = "Renamed Meanwhile"
+            cache.update(entities[0])
+            return session_factory()
+
+        cache.session_factory = session_during_update
+        cache.refresh()
+        expected = cache.model.transform([entity_text(entities[0])]).toarray()
+        np.testing.assert_array_equal(cache.embed(entities[:1]).toarray(), expected)
+
+    def test_follows_refit_in_other_process(self, session_factory, tmp_path):
+        entities = _add_entities(session_factory, TEXTS[:2])
+        first = EmbeddingCache(session_factory, snapshot_dir=str(tmp_path))
+        first.load()
+        second = EmbeddingCache(session_factory, snapshot_dir=str(tmp_path))
+        second.load()
+
+        entities += _add_entities(session_factory, TEXTS[2:])
+        embeddings = first.embed(entities).toarray()
+        transformed = _count_transforms(second)
+        np.testing.assert_array_equal(second.embed(entities).toarray(), embeddings)
+        assert second.model.id == first.model.id
+        assert transformed == []
+
+
+class TestEmbeddingEndpoints:
+    def test_entity_changes_update_embeddings(self, session_factory):
+        cache = EmbeddingCache(session_factory)
+        cache.load()
+        transformed = _count_transforms(cache)
+        entity = {"name": "Embedded Diner", "description": "Pancakes", "image_urls": []}
+
+        with patch("compere.modules.entity.get_embedding_cache", return_value=cache):
+            entity_id = client.post("/entities/", json=entity).json()["id"]
+            client.put(f"/entities/{entity_id}", json={"image_urls": ["https://example.com/a.png"]})
+            client.put(f"/entities/{entity_id}", json={"description": "Waffles"})
+            assert transformed == ["Embedded Diner Pancakes", "Embedded Diner Waffles"]
+
+            client.delete(f"/entities/{entity_id}")
+            assert len(cache) == 0
+
+    def test_caches_are_per_database(self, session_factory):
+        """A session on another database is served from that database's embeddings"""
+        client.post("/entities/", json={"name": "Default Database Diner", "description": "Omelettes", "image_urls": []})
+        _add_entities(session_factory, TEXTS)
+
+        with patch.dict("compere.modules.embeddings._caches"), session_factory() as db:
+            pair = get_dissimilar_entities(db)
+            entities = db.query(Entity).all()
+            bind = db.get_bind()
+            assert {entity.name for entity in pair} <= {name for name, _ in TEXTS}
+            assert len(get_embedding_cache(bind)) == len(TEXTS)
+            assert get_embedding_cache(bind) is not get_embedding_cache()
+
+            reloaded = EmbeddingCache(session_factory)
+            reloaded.load()
+            expected = reloaded.embed(entities).toarray()
+            np.testing.assert_allclose(generate_embeddings(entities, bind).toarray(), expected)
+
+    def test_dissimilar_entities(self):
+        for name, description in TEXTS:
+            client.post("/entities/", json={"name": name, "description": description, "image_urls": []})
+        response = client.get("/dissimilar_entities")
+        assert response.status_code == 200
+        assert len(response.json()) == 2
@@ -283,5 +283,35 @@ class TestEntitySearch:
         assert isinstance(response.json(), list)
 
 
+class TestEntityLookup:
+    """Test fetching entities by ID list"""
+
+    def test_lookup_preserves_order_and_reports_missing(self):
+        """Test that found entities keep request order and missing IDs are listed"""
+        ids = [
+            client.post("/entities/", json={"name": f"Lookup {i}", "description": "Lookup", "image_urls": []}).json()[
+                "id"
+            ]
+            for i in range(3)
+        ]
+
+        response = client.post("/entities/lookup", json={"ids": [ids[2], 999999, ids[0], ids[2], -1]})
+        assert response.status_code == 200
+        data = response.json()
+        assert [e["id"] for e in data["entities"]] == [ids[2], ids[0]]
+        assert data["entities"][0]["name"] == "Lookup 2"
+        assert data["missing"] == [999999, -1]
+
+    def test_lookup_empty(self):
+        """Test looking up no IDs"""
+        response = client.post("/entities/lookup", json={"ids": []})
+        assert response.json() == {"entities": [], "missing": []}
+
+    def test_lookup_too_many(self):
+        """Test that oversized lookups are rejected"""
+        response = client.post("/entities/lookup", json={"ids": list(range(10_001))})
+        assert response.status_code == 400
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,102 @@
+"""
+Tests for the streaming comparison export.
+"""
+
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+from datetime import UTC, datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Add the compere package to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compere.main import app
+from compere.modules.export import EXPORT_FIELDS
+
+client = TestClient(app)
+
+
+@pytest.fixture(scope="module")
+def exported_pair():
+    """Two entities and two comparisons between them, won by each side once"""
+    a, b = (
+        client.post(
+            "/entities/",
+            json={"name": f"Export Entity {i}", "description": f"Description {i}", "image_urls": []},
+        ).json()
+        for i in range(2)
+    )
+    first = client.post(
+        "/comparisons/", json={"entity1_id": a["id"], "entity2_id": b["id"], "selected_entity_id": a["id"]}
+    ).json()
+    second = client.post(
+        "/comparisons/", json={"entity1_id": a["id"], "entity2_id": b["id"], "selected_entity_id": b["id"]}
+    ).json()
+    return a, b, first, second
+
+
+def _ndjson(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+class TestExport:
+    """Test preference-pair export formats and filters"""
+
+    def test_export_ndjson(self, exported_pair):
+        """Each comparison becomes a chosen/rejected pair with entity text"""
+        a, b, first, second = exported_pair
+        response = client.get("/export/comparisons", params={"since_id": first["id"] - 1})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+
+        rows = _ndjson(response)
+        assert [row["comparison_id"] for row in rows] == [first["id"], second["id"]]
+        assert rows[0]["chosen_id"] == a["id"]
+        assert rows[0]["chosen_name"] == "Export Entity 0"
+        assert rows[0]["rejected_description"] == "Description 1"
+        assert rows[1]["chosen_id"] == b["id"]
+        assert rows[1]["rejected_id"] == a["id"]
+
+    def test_export_since_id(self, exported_pair):
+        """Incremental exports only include newer comparisons"""
+        _, _, first, second = exported_pair
+        rows = _ndjson(client.get("/export/comparisons", params={"since_id": first["id"]}))
+        assert [row["comparison_id"] for row in rows] == [second["id"]]
+
+    def test_export_since_with_offset(self, exported_pair):
+        """Timestamps with a UTC offset are compared in UTC"""
+        _, _, first, second = exported_pair
+        created = datetime.fromisoformat(second["created_at"])
+        created = created.replace(tzinfo=UTC) if created.tzinfo is None else created
+        since = (created - timedelta(minutes=1)).astimezone(timezone(timedelta(hours=5)))
+        rows = _ndjson(client.get("/export/comparisons", params={"since": since.isoformat(), "since_id": first["id"]}))
+        assert [row["comparison_id"] for row in rows] == [second["id"]]
+
+    def test_export_csv_gzip(self, exported_pair):
+        """CSV output has a header and can be gzip-compressed"""
+        _, _, first, _ = exported_pair
+        response = client.get(
+            "/export/comparisons", params={"format": "csv", "gzip": "true", "since_id": first["id"] - 1}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/gzip"
+        assert 'filename="comparisons.csv.gz"' in response.headers["content-disposition"]
+
+        reader = csv.DictReader(io.StringIO(gzip.decompress(response.content).decode()))
+        assert reader.fieldnames == EXPORT_FIELDS
+        assert [int(row["comparison_id"]) for row in reader] == [first["id"], first["id"] + 1]
+
+    def test_export_invalid_format(self):
+        """Unknown formats are rejected"""
+        response = client.get("/export/comparisons", params={"format": "parquet"})
+        assert response.status_code == 422
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
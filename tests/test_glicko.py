@@ -0,0 +1,150 @@
+"""
+Tests for the Glicko-2 rating engine.
+"""
+
+import os
+import sys
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add the compere package to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compere.main import app
+from compere.modules.database import Base
+from compere.modules.glicko import GLICKO2_SCALE, close_rating_period, glicko2_update
+from compere.modules.models import Comparison, Entity, RatingPeriod
+
+engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db_session():
+    """Create a fresh database session for each test"""
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+def _to_glicko2(ratings, deviations):
+    """Convert Glicko ratings and deviations to the Glicko-2 scale"""
+    return (np.asarray(ratings) - 1500.0) / GLICKO2_SCALE, np.asarray(deviations) / GLICKO2_SCALE
+
+
+class TestGlicko2Update:
+    """Test the vectorized rating-period update"""
+
+    def test_glickman_example(self):
+        """Reproduce the worked example from Glickman's Glicko-2 paper"""
+        mu, phi = _to_glicko2([1500, 1400, 1550, 1700], [200, 30, 100, 300])
+        sigma = np.full(4, 0.06)
+        idx1 = np.array([0, 0, 0])
+        idx2 = np.array([1, 2, 3])
+        score1 = np.array([1.0, 0.0, 0.0])
+
+        new_mu, new_phi, new_sigma = glicko2_update(mu, phi, sigma, idx1, idx2, score1, tau=0.5)
+
+        assert 1500 + GLICKO2_SCALE * new_mu[0] == pytest.approx(1464.06, abs=0.01)
+        assert GLICKO2_SCALE * new_phi[0] == pytest.approx(151.52, abs=0.01)
+        assert new_sigma[0] == pytest.approx(0.05999, abs=1e-5)
+
+    def test_inactive_players_only_widen_deviation(self):
+        """Players without games keep their rating but become less certain"""
+        mu, phi = _to_glicko2([1500, 1500, 1600], [100, 100, 50])
+        sigma = np.full(3, 0.06)
+
+        new_mu, new_phi, new_sigma = glicko2_update(
+            mu, phi, sigma, np.array([0]), np.array([1]), np.array([1.0]), tau=0.5
+        )
+
+        assert new_mu[2] == mu[2]
+        assert new_sigma[2] == sigma[2]
+        assert new_phi[2] == pytest.approx(np.sqrt(phi[2] ** 2 + 0.06**2))
+        assert new_mu[0] > mu[0] > new_mu[1]
+        assert new_phi[0] < phi[0]
+
+
+class TestRatingPeriods:
+    """Test closing rating periods against the database"""
+
+    def test_close_rating_period(self, db_session):
+        """Closing a period updates ratings and only covers new comparisons"""
+        entities = [
+            Entity(name=f"Glicko {i}", description="", image_urls=[], rating=1500.0, rating_deviation=350.0)
+            for i in range(3)
+        ]
+        db_session.add_all(entities)
+        db_session.commit()
+        a, b, c = entities
+        db_session.add(Comparison(entity1_id=a.id, entity2_id=b.id, selected_entity_id=a.id))
+        db_session.commit()
+
+        period = close_rating_period(db_session)
+        assert period.comparison_count == 1
+        assert period.entity_count == 2
+
+        for entity in entities:
+            db_session.refresh(entity)
+        assert a.rating > 1500.0 > b.rating
+        assert a.rating_deviation < 350.0
+        assert c.rating == 1500.0
+        assert c.rating_deviation > 350.0
+
+        # Nothing new since the last period
+        second = close_rating_period(db_session)
+        assert second.comparison_count == 0
+        assert second.last_comparison_id == period.last_comparison_id
+        assert db_session.query(RatingPeriod).count() == 2
+
+
+class TestRatingPeriodEndpoint:
+    """Test the rating period endpoint"""
+
+    def test_close_period_requires_glicko_engine(self):
+        """Closing a period is rejected with the Elo engine"""
+        response = client.post("/ratings/periods")
+        assert response.status_code == 400
+        assert "RATING_ENGINE=glicko2" in response.json()["detail"]
+
+    def test_close_period_with_glicko_engine(self):
+        """Closing a period returns its summary"""
+        with patch("compere.modules.rating.get_rating_engine", return_value="glicko2"):
+            response = client.post("/ratings/periods")
+        assert response.status_code == 200
+        data = response.json()
+        assert "last_comparison_id" in data
+        assert "comparison_count" in data
+
+    def test_glicko_engine_defers_rating_updates(self):
+        """With Glicko-2, comparisons do not move ratings until the period closes"""
+        e1 = client.post("/entities/", json={"name": "Deferred 1", "description": "", "image_urls": []}).json()
+        e2 = client.post("/entities/", json={"name": "Deferred 2", "description": "", "image_urls": []}).json()
+        assert e1["rating_deviation"] == 350.0
+
+        with patch("compere.modules.rating.get_rating_engine", return_value="glicko2"):
+            client.post(
+                "/comparisons/",
+                json={"entity1_id": e1["id"], "entity2_id": e2["id"], "selected_entity_id": e1["id"]},
+            )
+            assert client.get(f"/entities/{e1['id']}").json()["rating"] == 1500.0
+
+            client.post("/ratings/periods")
+            updated = client.get(f"/entities/{e1['id']}").json()
+            assert updated["rating"] > 1500.0
+            assert updated["rating_deviation"] < 350.0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,184 @@
+"""
+Tests for rating history checkpoints and as-of leaderboards.
+"""
+
+import os
+import sys
+from datetime import UTC, datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add the compere package to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compere.main import app
+from compere.modules import history
+from compere.modules.database import Base
+from compere.modules.elo import apply_elo_results
+from compere.modules.history import discard_checkpoints, first_comparison_at, ratings_as_of
+from compere.modules.models import Comparison, Entity, PendingVote, RatingCheckpoint
+
+client = TestClient(app)
+
+K_FACTOR = 32.0
+START = datetime(2024, 1, 1, tzinfo=UTC)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def votes(db):
+    """Ten entities and 50 comparisons, one per day"""
+    entities = [Entity(name=f"History {i}", rating=1500.0) for i in range(10)]
+    db.add_all(entities)
+    db.flush()
+    ids = [e.id for e in entities]
+    votes = []
+    for day in range(50):
+        a, b = ids[day % 10], ids[(day * 3 + 1) % 10]
+        votes.append((a, b, a if day % 4 else b))
+    db.add_all(
+        Comparison(entity1_id=a, entity2_id=b, selected_entity_id=w, created_at=START + timedelta(days=day))
+        for day, (a, b, w) in enumerate(votes)
+    )
+    db.commit()
+    return ids, votes
+
+
+def expected_ratings(ids, votes):
+    ratings = dict.fromkeys(ids, 1500.0)
+    apply_elo_results(ratings, votes, K_FACTOR)
+    return ratings
+
+
+class TestRatingsAsOf:
+    def test_matches_replay_of_prefix(self, db, votes):
+        ids, all_votes = votes
+        as_of = START + timedelta(days=20, hours=12)
+
+        ratings = ratings_as_of(db, as_of, k_factor=K_FACTOR, initial_rating=1500.0, interval=7)
+
+        assert ratings == pytest.approx(expected_ratings(ids, all_votes[:21]))
+
+    def test_before_first_comparison(self, db, votes):
+        ids, _ = votes
+        ratings = ratings_as_of(db, START - timedelta(days=1), k_factor=K_FACTOR, initial_rating=1500.0)
+        assert ratings == dict.fromkeys(ids, 1500.0)
+
+    def test_checkpoints_are_built_and_reused(self, db, votes):
+        ids, all_votes = votes
+        end = START + timedelta(days=60)
+        ratings_as_of(db, end, k_factor=K_FACTOR, initial_rating=1500.0, interval=10)
+        assert db.query(RatingCheckpoint).count() == 5
+
+        replayed = []
+        original = history.apply_elo_sequence
+
+        def counting(ratings, idx1, *args):
+            replayed.append(len(idx1))
+            original(ratings, idx1, *args)
+
+        with patch("compere.modules.history.apply_elo_sequence", side_effect=counting):
+            ratings = ratings_as_of(
+                db, START + timedelta(days=34), k_factor=K_FACTOR, initial_rating=1500.0, interval=10
+            )
+
+        # Starts from the checkpoint after 30 comparisons
+        assert sum(replayed) == 5
+        assert ratings == pytest.approx(expected_ratings(ids, all_votes[:35]))
+        assert db.query(RatingCheckpoint).count() == 5
+
+    def test_checkpoints_depend_on_parameters(self, db, votes):
+        ids, all_votes = votes
+        ratings_as_of(db, START + timedelta(days=60), k_factor=K_FACTOR, initial_rating=1500.0, interval=10)
+
+        ratings = ratings_as_of(db, START + timedelta(days=60), k_factor=16.0, initial_rating=1500.0, interval=10)
+
+        expected = dict.fromkeys(ids, 1500.0)
+        apply_elo_results(expected, all_votes, 16.0)
+        assert ratings == pytest.approx(expected)
+
+    def test_recent_comparisons_are_not_checkpointed(self, db, votes):
+        ids, _ = votes
+        db.add_all(Comparison(entity1_id=ids[0], entity2_id=ids[1], selected_entity_id=ids[0]) for _ in range(10))
+        db.commit()
+
+        ratings_as_of(db, datetime.now(UTC) + timedelta(days=1), k_factor=K_FACTOR, initial_rating=1500.0, interval=10)
+
+        assert db.query(RatingCheckpoint).count() == 5
+
+    def test_discard_checkpoints_since(self, db, votes):
+        ratings_as_of(db, START + timedelta(days=60), k_factor=K_FACTOR, initial_rating=1500.0, interval=10)
+
+        assert discard_checkpoints(db, since=START + timedelta(days=25)) == 3
+        assert discard_checkpoints(db) == 2
+
+    def test_first_comparison_at(self, db, votes):
+        ids, _ = votes
+        late = Entity(name="Late", rating=1500.0)
+        db.add(late)
+        db.flush()
+        db.add(
+            Comparison(
+                entity1_id=ids[0],
+                entity2_id=late.id,
+                selected_entity_id=late.id,
+                created_at=START + timedelta(days=25, hours=12),
+            )
+        )
+        db.commit()
+
+        assert first_comparison_at(db, late.id) == START + timedelta(days=25, hours=12)
+        assert first_comparison_at(db, ids[1]) == START
+        assert first_comparison_at(db, late.id + 1) is None
+
+    def test_queued_votes_are_not_checkpointed_past(self, db, votes):
+        ids, all_votes = votes
+        db.add(
+            PendingVote(
+                entity1_id=ids[0],
+                entity2_id=ids[1],
+                selected_entity_id=ids[0],
+                created_at=START + timedelta(days=25, hours=12),
+            )
+        )
+        db.commit()
+
+        ratings = ratings_as_of(db, START + timedelta(days=60), k_factor=K_FACTOR, initial_rating=1500.0, interval=10)
+
+        assert ratings == pytest.approx(expected_ratings(ids, all_votes))
+        assert db.query(RatingCheckpoint).count() == 2
+
+
+class TestRatingsAsOfEndpoint:
+    def test_as_of_leaderboard(self):
+        ids = [
+            client.post("/entities/", json={"name": f"As of {i}", "description": "", "image_urls": []}).json()["id"]
+            for i in range(2)
+        ]
+        # SQLite's CURRENT_TIMESTAMP has whole-second resolution
+        before = datetime.now(UTC) - timedelta(seconds=1)
+        client.post("/comparisons/", json={"entity1_id": ids[0], "entity2_id": ids[1], "selected_entity_id": ids[0]})
+
+        past = {e["id"]: e["rating"] for e in client.get("/ratings", params={"as_of": before.isoformat()}).json()}
+        assert past[ids[0]] == past[ids[1]] == 1500.0
+
+        now = datetime.now(UTC) + timedelta(seconds=1)
+        current = {e["id"]: e["rating"] for e in client.get("/ratings", params={"as_of": now.isoformat()}).json()}
+        assert current[ids[0]] > current[ids[1]]
+
+    def test_as_of_requires_elo(self):
+        response = client.get("/ratings", params={"model": "bt", "as_of": datetime.now(UTC).isoformat()})
+        assert response.status_code == 400
@@ -0,0 +1,203 @@
+"""
+Tests for streaming comparison imports.
+"""
+
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+from datetime import UTC, datetime
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add the compere package to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compere.main import app
+from compere.modules.database import Base
+from compere.modules.importer import chunked, import_comparison_file, parse_csv, parse_ndjson
+from compere.modules.models import Comparison, Entity
+from compere.modules.rating import update_elo_ratings
+
+engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db_session():
+    """Create a fresh database session for each test"""
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def entities(db_session):
+    """Create a handful of entities at the default rating"""
+    created = [Entity(name=f"Import {i}", description="", image_urls=[], rating=1500.0) for i in range(3)]
+    db_session.add_all(created)
+    db_session.commit()
+    return created
+
+
+def _ndjson(records):
+    return io.BytesIO("".join(json.dumps(r) + "\n" for r in records).encode())
+
+
+class TestParsers:
+    """Test line parsing"""
+
+    def test_parse_ndjson_reports_bad_lines(self):
+        """Invalid lines are reported with their line number and blank lines skipped"""
+        lines = [
+            '{"entity1_id": 1, "entity2_id": 2, "selected_entity_id": 1}\n',
+            "\n",
+            "not json\n",
+            '{"entity1_id": 1}\n',
+            '{"entity1_id": 1, "entity2_id": 2, "selected_entity_id": 2, "created_at": "2024-01-01T00:00:00"}\n',
+        ]
+        records = list(parse_ndjson(lines))
+        assert len(records) == 4
+        assert records[0][1].selected_entity_id == 1
+        assert "line 3: invalid JSON" in records[1][3]
+        assert "line 4" in records[2][3] and "entity2_id" in records[2][3]
+        assert records[3][2] == datetime(2024, 1, 1, tzinfo=UTC)
+
+    def test_parse_csv(self):
+        """CSV values are converted by the comparison schema"""
+        lines = ["entity1_id,entity2_id,selected_entity_id\n", "1,2,2\n", "1,x,1\n"]
+        records = list(parse_csv(lines))
+        assert records[0][0] == 2
+        assert records[0][1].entity2_id == 2
+        assert records[1][3].startswith("line 3")
+
+    def test_chunked(self):
+        """Chunks have at most the requested size"""
+        assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+class TestImport:
+    """Test chunked imports with a deferred rating recompute"""
+
+    def test_import_matches_incremental_updates(self, db_session, entities):
+        """Ratings after an import equal those of recording each vote live"""
+        a, b, c = (e.id for e in entities)
+        votes = [(a, b, a), (b, c, c), (a, c, a), (a, b, b)]
+        records = [{"entity1_id": e1, "entity2_id": e2, "selected_entity_id": w} for e1, e2, w in votes]
+
+        progress = []
+        summary = import_comparison_file(
+            db_session, _ndjson(records), "ndjson", chunk_size=3, progress=lambda *p: progress.append(p)
+        )
+        assert summary == {"imported": 4, "skipped": 0, "errors": [], "ratings_recomputed": True}
+        assert progress == [(3, 0), (4, 0)]
+        assert db_session.query(Comparison).count() == 4
+
+        imported = {e.id: e.rating for e in db_session.query(Entity)}
+        for e in entities:
+            e.rating = 1500.0
+        db_session.commit()
+        by_id = {e.id: e for e in entities}
+        for e1, e2, winner in votes:
+            update_elo_ratings(db_session, by_id[e1], by_id[e2], winner)
+
+        for e in entities:
+            assert imported[e.id] == pytest.approx(e.rating)
+
+    def test_import_skips_invalid_records(self, db_session, entities):
+        """Unknown entities and invalid winners are skipped, not fatal"""
+        a, b = entities[0].id, entities[1].id
+        records = [
+            {"entity1_id": a, "entity2_id": b, "selected_entity_id": a},
+            {"entity1_id": a, "entity2_id": 99999, "selected_entity_id": a},
+            {"entity1_id": a, "entity2_id": b, "selected_entity_id": 99999},
+        ]
+        summary = import_comparison_file(db_session, _ndjson(records), "ndjson", recompute=False)
+        assert summary["imported"] == 1
+        assert summary["skipped"] == 2
+        assert "line 2: entity with id 99999 not found" in summary["errors"]
+        assert not summary["ratings_recomputed"]
+        db_session.refresh(entities[0])
+        assert entities[0].rating == 1500.0
+
+    def test_import_keeps_timestamps(self, db_session, entities):
+        """Historical timestamps from the file are stored as given"""
+        a, b = entities[0].id, entities[1].id
+        data = f"entity1_id,entity2_id,selected_entity_id,created_at\n{a},{b},{a},2023-05-01T12:00:00+00:00\n"
+        import_comparison_file(db_session, io.BytesIO(data.encode()), "csv")
+        comparison = db_session.query(Comparison).one()
+        assert comparison.created_at.replace(tzinfo=UTC) == datetime(2023, 5, 1, 12, tzinfo=UTC)
+
+
+class TestImportEndpoint:
+    """Test the HTTP upload endpoint"""
+
+    def test_import_upload(self):
+        """An NDJSON body is imported and summarised"""
+        ids = [
+            client.post("/entities/", json={"name": f"Upload {i}", "description": "", "image_urls": []}).json()["id"]
+            for i in range(2)
+        ]
+        body = _ndjson(
+            [
+                {"entity1_id": ids[0], "entity2_id": ids[1], "selected_entity_id": ids[0]},
+                {"entity1_id": ids[0], "entity2_id": 99999, "selected_entity_id": ids[0]},
+            ]
+        ).getvalue()
+        response = client.post(
+            "/comparisons/import?format=ndjson", content=body, headers={"Content-Type": "application/x-ndjson"}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["imported"] == 1
+        assert data["skipped"] == 1
+        assert client.get(f"/entities/{ids[0]}").json()["rating"] > client.get(f"/entities/{ids[1]}").json()["rating"]
+
+    def test_upload_file_work_runs_off_the_event_loop(self):
+        """Writes to the spooled file block once it spills to disk, so they run in the thread pool"""
+        ids = [
+            client.post("/entities/", json={"name": f"Spilled {i}", "description": "", "image_urls": []}).json()["id"]
+            for i in range(2)
+        ]
+        body = _ndjson([{"entity1_id": ids[0], "entity2_id": ids[1], "selected_entity_id": ids[1]}] * 50).getvalue()
+        on_loop = []
+
+        class RecordingFile(tempfile.SpooledTemporaryFile):
+            def write(self, data):
+                try:
+                    asyncio.get_running_loop()
+                    on_loop.append(True)
+                except RuntimeError:
+                    on_loop.append(False)
+                return super().write(data)
+
+        with (
+            patch("compere.modules.comparison.tempfile.SpooledTemporaryFile", RecordingFile),
+            patch("compere.modules.comparison.IMPORT_SPOOL_SIZE", 64),
+        ):
+            response = client.post("/comparisons/import?format=ndjson", content=body)
+
+        assert response.status_code == 200
+        assert response.json()["imported"] == 50
+        assert on_loop and not any(on_loop)
+
+    def test_import_rejects_unknown_format(self):
+        """Only NDJSON and CSV are accepted"""
+        response = client.post("/comparisons/import?format=xml", content=b"")
+        assert response.status_code == 422
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
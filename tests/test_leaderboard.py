@@ -0,0 +1,161 @@
+"""
+Tests for cached leaderboard responses.
+"""
+
+import os
+import sys
+import uuid
+from unittest.mock import patch
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+# Add the compere package to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compere.main import app
+from compere.modules import rating
+from compere.modules.database import SessionLocal
+from compere.modules.leaderboard import bump_ratings_version
+from compere.modules.ranking import page_of_ratings
+from compere.modules.rating_store import RatingStore
+
+client = TestClient(app)
+
+
+def _post_entity(name):
+    response = client.post("/entities/", json={"name": name, "description": "Leaderboard test", "image_urls": []})
+    return response.json()["id"]
+
+
+class TestLeaderboardCache:
+    def test_repeat_reads_are_served_from_cache(self):
+        _post_entity("Cached A")
+        with patch("compere.modules.rating.get_current_leaderboard", wraps=rating.get_current_leaderboard) as build:
+            first = client.get("/ratings")
+            second = client.get("/ratings")
+            assert build.call_count == 1
+
+            bump_ratings_version()
+            client.get("/ratings")
+            assert build.call_count == 2
+
+        assert first.content == second.content
+        assert first.headers["etag"] == second.headers["etag"]
+
+    def test_not_modified_until_ratings_change(self):
+        a, b = _post_entity("Cached B"), _post_entity("Cached C")
+        etag = client.get("/ratings").headers["etag"]
+
+        unchanged = client.get("/ratings", headers={"If-None-Match": etag})
+        assert unchanged.status_code == 304
+        assert unchanged.content == b""
+        assert client.get("/ratings", headers={"If-None-Match": f'W/{etag}, "other"'}).status_code == 304
+
+        client.post("/comparisons/", json={"entity1_id": a, "entity2_id": b, "selected_entity_id": a})
+        changed = client.get("/ratings", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["etag"] != etag
+        assert next(e for e in changed.json() if e["id"] == a)["rating"] > 1500.0
+
+    def test_entity_changes_invalidate(self):
+        entity_id = _post_entity("Cached D")
+        client.get("/ratings")
+        client.put(f"/entities/{entity_id}", json={"name": "Cached D renamed"})
+        assert any(e["name"] == "Cached D renamed" for e in client.get("/ratings").json())
+
+        client.delete(f"/entities/{entity_id}")
+        assert all(e["id"] != entity_id for e in client.get("/ratings").json())
+
+    def test_models_are_cached_separately(self):
+        _post_entity("Cached E")
+        elo = client.get("/ratings")
+        bt = client.get("/ratings", params={"model": "bt"})
+        assert bt.status_code == 200
+        assert {e["id"] for e in bt.json()} == {e["id"] for e in elo.json()}
+
+    def test_zero_ttl_disables_caching(self):
+        _post_entity("Cached F")
+        with (
+            patch("compere.modules.leaderboard.get_leaderboard_cache_ttl", return_value=0),
+            patch("compere.modules.rating.get_current_leaderboard", wraps=rating.get_current_leaderboard) as build,
+        ):
+            first = client.get("/ratings")
+            second = client.get("/ratings", headers={"If-None-Match": first.headers["etag"]})
+
+        assert build.call_count == 2
+        assert second.status_code == 304
+
+
+def _walk(path, **params):
+    """Follow X-Next-Cursor through every page."""
+    items, cursor = [], None
+    while True:
+        response = client.get(path, params={**params, **({"after": cursor} if cursor else {})})
+        assert response.status_code == 200
+        items.extend(response.json())
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            return items
+
+
+class TestLeaderboardPages:
+    def test_pages_cover_leaderboard_in_order(self):
+        ids = [_post_entity(f"Paged {i}") for i in range(5)]
+        client.post("/comparisons/", json={"entity1_id": ids[0], "entity2_id": ids[1], "selected_entity_id": ids[0]})
+
+        for model in ("elo", "bt"):
+            full = client.get("/ratings", params={"model": model}).json()
+            pages = _walk("/ratings", model=model, limit=3)
+            assert [e["id"] for e in pages] == [e["id"] for e in full]
+
+    def test_pages_from_rating_store(self):
+        _post_entity("Paged store")
+        store = RatingStore(32.0, session_factory=SessionLocal)
+        with SessionLocal() as db:
+            store.load(db)
+        with patch("compere.modules.rating.get_rating_store", return_value=store):
+            full = client.get("/ratings").json()
+            assert [e["id"] for e in _walk("/ratings", limit=4)] == [e["id"] for e in full]
+
+    def test_top_k(self):
+        _post_entity("Paged top")
+        full = client.get("/ratings").json()
+        top = client.get("/ratings", params={"top": 3})
+        assert top.json() == full[:3]
+        assert "x-next-cursor" not in top.headers
+
+        assert client.get("/ratings", params={"top": 3, "after": "1500.0,1"}).status_code == 400
+        assert client.get("/ratings", params={"after": "not-a-cursor"}).status_code == 400
+
+    def test_ranks_only_on_first_page(self):
+        _post_entity("Paged ranks")
+        first = client.get("/ratings", params={"limit": 2})
+        assert [e["rank"] for e in first.json()] == [e["rank"] for e in client.get("/ratings").json()[:2]]
+        later = client.get("/ratings", params={"limit": 2, "after": first.headers["x-next-cursor"]}).json()
+        assert all(e["rank"] is None for e in later)
+
+    def test_entity_list_cursor(self):
+        # A prefix unique to this run, the database is shared with earlier runs
+        prefix = f"Cursor{uuid.uuid4().hex[:8]}"
+        for i in range(4):
+            _post_entity(f"{prefix} search {i}")
+        everything = client.get("/entities/", params={"search": prefix, "limit": 1000}).json()
+        pages = _walk("/entities/", search=prefix, limit=3)
+        assert [e["id"] for e in pages] == [e["id"] for e in everything]
+        assert len(pages) == 4
+
+
+class TestPageOfRatings:
+    def test_matches_sorted_order(self):
+        rng = np.random.default_rng(0)
+        ratings = {i: float(v) for i, v in enumerate(rng.integers(1400, 1410, 200))}
+        expected = sorted(ratings, key=lambda i: (ratings[i], i), reverse=True)
+
+        pages, cursor = [], None
+        while len(pages) < len(expected):
+            page = page_of_ratings(ratings, 15, cursor)
+            pages.extend(page)
+            cursor = (ratings[page[-1]], page[-1])
+        assert pages == expected
+        assert page_of_ratings(ratings, 15, cursor) == []
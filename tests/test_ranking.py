@@ -0,0 +1,123 @@
+"""
+Tests for single-entity rank lookups.
+"""
+
+import os
+import sys
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+# Add the compere package to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compere.main import app
+from compere.modules.database import SessionLocal
+from compere.modules.leaderboard import bump_ratings_version
+from compere.modules.models import Entity
+from compere.modules.rating_store import RatingStore, SortedRatings
+
+client = TestClient(app)
+
+
+def _post_entity(name):
+    response = client.post("/entities/", json={"name": name, "description": "Rank test", "image_urls": []})
+    return response.json()["id"]
+
+
+def _set_ratings(ratings):
+    with SessionLocal() as db:
+        for entity_id, rating in ratings.items():
+            db.query(Entity).filter(Entity.id == entity_id).update({Entity.rating: rating})
+        db.commit()
+    bump_ratings_version()
+
+
+class TestSortedRatings:
+    def test_updates_keep_order(self):
+        rng = np.random.default_rng(0)
+        ratings = list(rng.normal(1500, 100, 50))
+        sorted_ratings = SortedRatings(np.array(ratings))
+
+        for _ in range(500):
+            i = int(rng.integers(len(ratings)))
+            new = ratings[i] + float(rng.normal(0, 30))
+            sorted_ratings.move(ratings[i], new)
+            ratings[i] = new
+        for rating in rng.normal(1500, 100, 2000):
+            sorted_ratings.add(rating)
+            ratings.append(rating)
+        for rating in ratings[:1000]:
+            sorted_ratings.remove(rating)
+        del ratings[:1000]
+
+        assert len(sorted_ratings) == len(ratings)
+        values = np.array(ratings)
+        for rating in values[::50]:
+            assert sorted_ratings.rank(rating) == (int((values > rating).sum()) + 1, int((values < rating).sum()))
+
+    def test_ties_share_a_rank(self):
+        sorted_ratings = SortedRatings(np.array([1400.0, 1500.0, 1500.0, 1600.0]))
+        assert sorted_ratings.rank(1500.0) == (2, 1)
+        assert sorted_ratings.rank(1600.0) == (1, 3)
+        assert sorted_ratings.rank(1400.0) == (4, 0)
+
+
+class TestRankEndpoint:
+    def test_rank_and_percentile(self):
+        ids = [_post_entity(f"Ranked {i}") for i in range(3)]
+        _set_ratings({ids[0]: 3000.0, ids[1]: 2999.0, ids[2]: 2999.0})
+
+        first = client.get(f"/entities/{ids[0]}/rank").json()
+        tied = client.get(f"/entities/{ids[1]}/rank").json()
+        assert first["rank"] == 1
+        assert first["percentile"] == 100.0
+        assert tied["rank"] == client.get(f"/entities/{ids[2]}/rank").json()["rank"] == 2
+        assert tied["total"] == first["total"]
+        assert tied["percentile"] == pytest.approx(100.0 * (tied["total"] - 3) / (tied["total"] - 1))
+
+        assert client.get(f"/entities/{ids[1]}").json()["rank"] == 2
+        leaderboard = client.get("/ratings").json()
+        assert [e["rank"] for e in leaderboard[:3]] == [1, 2, 2]
+
+    def test_total_is_counted_once_per_ratings_version(self):
+        entity_id = _post_entity("Counted")
+        total = client.get(f"/entities/{entity_id}/rank").json()["total"]
+        with SessionLocal() as db:
+            db.add(Entity(name="Counted later", description="Rank test", image_urls=[], rating=1500.0))
+            db.commit()
+
+        assert client.get(f"/entities/{entity_id}/rank").json()["total"] == total
+        bump_ratings_version()
+        assert client.get(f"/entities/{entity_id}/rank").json()["total"] == total + 1
+
+    def test_unknown_entity(self):
+        assert client.get("/entities/99999/rank").status_code == 404
+
+    def test_rank_from_rating_store(self):
+        ids = [_post_entity(f"Store ranked {i}") for i in range(2)]
+        _set_ratings({ids[0]: 4000.0, ids[1]: 4000.0})
+        store = RatingStore(32.0, session_factory=SessionLocal)
+        with SessionLocal() as db:
+            store.load(db)
+
+        with (
+            patch("compere.modules.ranking.get_rating_store", return_value=store),
+            patch("compere.modules.comparison.get_rating_store", return_value=store),
+            patch("compere.modules.rating.get_rating_store", return_value=store),
+            patch("compere.modules.entity.get_rating_store", return_value=store),
+        ):
+            vote = {"entity1_id": ids[0], "entity2_id": ids[1], "selected_entity_id": ids[1]}
+            assert client.post("/comparisons/", json=vote).status_code == 200
+            assert client.get(f"/entities/{ids[1]}/rank").json()["rank"] == 1
+            assert client.get(f"/entities/{ids[0]}/rank").json()["rank"] == 2
+            # Rating and rank both come from the store before it is flushed
+            entity = client.get(f"/entities/{ids[1]}").json()
+            assert entity["rating"] == store.ratings()[ids[1]] > 4000.0
+            assert entity["rank"] == 1
+
+            client.delete(f"/entities/{ids[1]}")
+            assert client.get(f"/entities/{ids[0]}/rank").json()["rank"] == 1
+            assert client.get(f"/entities/{ids[0]}/rank").json()["total"] == len(store.ratings())
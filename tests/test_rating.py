@@ -0,0 +1,154 @@
+"""
+Tests for concurrency-safe Elo rating updates.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add the compere package to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compere.modules.database import Base
+from compere.modules.models import Entity
+from compere.modules.rating import (
+    compare_and_set_ratings,
+    expected_score,
+    update_elo_ratings,
+    update_elo_ratings_async,
+)
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """A file-backed SQLite database shared by several connections"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'ratings.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+def _create_entities(factory, count):
+    db = factory()
+    entities = [Entity(name=f"Concurrent {i}", description="", image_urls=[], rating=1500.0) for i in range(count)]
+    db.add_all(entities)
+    db.commit()
+    ids = [e.id for e in entities]
+    db.close()
+    return ids
+
+
+class TestCompareAndSet:
+    """Test version-checked rating writes"""
+
+    def test_stale_version_is_rejected(self, session_factory):
+        """A write based on an outdated read must not be applied"""
+        (entity_id,) = _create_entities(session_factory, 1)
+        reader = session_factory()
+        writer = session_factory()
+        stale = reader.get(Entity, entity_id)
+        fresh = writer.get(Entity, entity_id)
+
+        assert compare_and_set_ratings(writer, {fresh: 1600.0})
+        writer.commit()
+
+        assert not compare_and_set_ratings(reader, {stale: 1400.0})
+        reader.rollback()
+
+        check = session_factory()
+        entity = check.get(Entity, entity_id)
+        assert entity.rating == 1600.0
+        assert entity.version == 1
+        for db in (reader, writer, check):
+            db.close()
+
+    def test_update_bumps_versions(self, session_factory):
+        """Each Elo update increments the version of both entities"""
+        a_id, b_id = _create_entities(session_factory, 2)
+        db = session_factory()
+        a, b = db.get(Entity, a_id), db.get(Entity, b_id)
+
+        update_elo_ratings(db, a, b, a_id)
+
+        assert a.version == 1
+        assert b.version == 1
+        assert a.rating == pytest.approx(1516.0)
+        db.close()
+
+
+class TestConcurrentUpdates:
+    """Test that concurrent votes on shared entities are never lost"""
+
+    def test_no_lost_updates(self, session_factory):
+        """Elo is zero-sum, so the total rating must be preserved"""
+        ids = _create_entities(session_factory, 3)
+        votes_per_worker = 20
+        workers = 4
+        errors = []
+
+        def vote(worker):
+            db = session_factory()
+            try:
+                for i in range(votes_per_worker):
+                    e1_id = ids[(worker + i) % 3]
+                    e2_id = ids[(worker + i + 1) % 3]
+                    e1, e2 = db.get(Entity, e1_id), db.get(Entity, e2_id)
+                    update_elo_ratings(db, e1, e2, e1_id)
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+            finally:
+                db.close()
+
+        threads = [threading.Thread(target=vote, args=(w,)) for w in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        db = session_factory()
+        entities = db.query(Entity).all()
+        assert sum(e.rating for e in entities) == pytest.approx(1500.0 * 3)
+        assert sum(e.version for e in entities) == 2 * workers * votes_per_worker
+        db.close()
+
+
+class TestAsyncUpdates:
+    """Test the event-loop friendly rating update"""
+
+    def test_async_update_retries_on_conflict(self, session_factory, tmp_path):
+        """A write by another session between read and update is re-read, not overwritten"""
+        a_id, b_id = _create_entities(session_factory, 2)
+
+        async def vote():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'ratings.db'}")
+            try:
+                async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+                    a, b = await db.get(Entity, a_id), await db.get(Entity, b_id)
+
+                    other = session_factory()
+                    compare_and_set_ratings(other, {other.get(Entity, a_id): 1600.0})
+                    other.commit()
+                    other.close()
+
+                    await update_elo_ratings_async(db, a, b, a_id)
+                    return a.rating, a.version
+            finally:
+                await engine.dispose()
+
+        rating, version = asyncio.run(vote())
+        assert version == 2
+        assert rating == pytest.approx(1600.0 + 32.0 * (1 - expected_score(1600.0, 1500.0)))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
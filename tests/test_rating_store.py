@@ -0,0 +1,186 @@
+"""
+Tests for the write-behind in-memory rating store.
+"""
+
+import json
+import os
+import sys
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add the compere package to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compere.main import app
+from compere.modules.database import Base, SessionLocal
+from compere.modules.elo import apply_elo_results
+from compere.modules.models import Comparison, Entity
+from compere.modules.rating_store import RatingStore
+from compere.modules.replay import replay_elo_ratings
+
+client = TestClient(app)
+
+K_FACTOR = 32.0
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'store.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def store(session_factory):
+    with session_factory() as db:
+        db.add_all(Entity(name=f"Stored {i}", description="", image_urls=[], rating=1500.0) for i in range(3))
+        db.commit()
+    store = RatingStore(K_FACTOR, flush_interval=60, flush_every=1000, session_factory=session_factory)
+    with session_factory() as db:
+        store.load(db)
+    return store
+
+
+def _entities(session_factory):
+    with session_factory() as db:
+        return {e.id: e for e in db.query(Entity).order_by(Entity.id)}
+
+
+class TestRatingStore:
+    def test_record_matches_elo_and_defers_writes(self, store, session_factory):
+        entities = _entities(session_factory)
+        a, b, c = entities
+        results = [(a, b, a), (b, c, c), (a, c, a)]
+        store.record_many(entities, results)
+
+        expected = {a: 1500.0, b: 1500.0, c: 1500.0}
+        apply_elo_results(expected, results, K_FACTOR)
+        assert store.ratings() == pytest.approx(expected)
+        assert all(e.rating == 1500.0 for e in _entities(session_factory).values())
+
+        assert store.flush() == 3
+        stored = _entities(session_factory)
+        assert {i: e.rating for i, e in stored.items()} == pytest.approx(expected)
+        assert all(e.version == 1 for e in stored.values())
+        assert store.flush() == 0
+
+    def test_flush_adds_to_concurrent_changes(self, store, session_factory):
+        entities = _entities(session_factory)
+        a, b, _ = entities
+        store.record(entities[a], entities[b], a)
+        with session_factory() as db:
+            db.query(Entity).filter(Entity.id == a).update({Entity.rating: Entity.rating + 100})
+            db.commit()
+
+        store.flush()
+        assert _entities(session_factory)[a].rating == pytest.approx(1600 + K_FACTOR / 2)
+
+    def test_load_counts_comparisons(self, session_factory):
+        with session_factory() as db:
+            a, b = Entity(name="A", rating=1500.0), Entity(name="B", rating=1500.0)
+            db.add_all([a, b])
+            db.flush()
+            db.add_all(
+                [
+                    Comparison(entity1_id=a.id, entity2_id=b.id, selected_entity_id=a.id),
+                    Comparison(entity1_id=b.id, entity2_id=a.id, selected_entity_id=a.id),
+                    Comparison(entity1_id=a.id, entity2_id=b.id, selected_entity_id=b.id),
+                ]
+            )
+            db.commit()
+            store = RatingStore(K_FACTOR, session_factory=session_factory)
+            store.load(db)
+
+            assert store.arm_stats() == {a.id: (3, pytest.approx(2 / 3)), b.id: (3, pytest.approx(1 / 3))}
+
+    def test_new_entities_are_added(self, store, session_factory):
+        with session_factory() as db:
+            db.add(Entity(name="Late", description="", image_urls=[], rating=1600.0))
+            db.commit()
+        entities = _entities(session_factory)
+        late = max(entities)
+
+        store.record(entities[late], entities[min(entities)], late)
+        assert store.ratings()[late] > 1600.0
+        assert len(store.ratings()) == 4
+
+    def test_flusher_writes_after_flush_every_updates(self, store, session_factory):
+        store.flush_every = 2
+        entities = _entities(session_factory)
+        a, b, _ = entities
+        store.start()
+        try:
+            store.record_many(entities, [(a, b, a), (a, b, a)])
+            deadline = time.monotonic() + 10
+            while _entities(session_factory)[a].rating == 1500.0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert _entities(session_factory)[a].rating == pytest.approx(store.ratings()[a])
+
+            store.record(entities[a], entities[b], b)
+        finally:
+            store.stop()
+        # Stopping flushes the last update
+        assert _entities(session_factory)[a].rating == pytest.approx(store.ratings()[a])
+
+
+class TestRatingStoreEndpoints:
+    def test_votes_and_leaderboard_use_store(self):
+        ids = [
+            client.post("/entities/", json={"name": f"Store {i}", "description": "", "image_urls": []}).json()["id"]
+            for i in range(2)
+        ]
+        store = RatingStore(K_FACTOR, session_factory=SessionLocal)
+        with SessionLocal() as db:
+            store.load(db)
+
+        with (
+            patch("compere.modules.rating.get_rating_store", return_value=store),
+            patch("compere.modules.comparison.get_rating_store", return_value=store),
+        ):
+            vote = {"entity1_id": ids[0], "entity2_id": ids[1], "selected_entity_id": ids[0]}
+            assert client.post("/comparisons/", json=vote).status_code == 200
+            assert client.post("/comparisons/batch", json=[vote]).status_code == 200
+            leaderboard = {e["id"]: e["rating"] for e in client.get("/ratings").json()}
+
+        assert leaderboard[ids[0]] == pytest.approx(store.ratings()[ids[0]])
+        assert leaderboard[ids[0]] > 1500.0
+        assert client.get(f"/entities/{ids[0]}").json()["rating"] == 1500.0
+
+        store.flush()
+        assert client.get(f"/entities/{ids[0]}").json()["rating"] == pytest.approx(leaderboard[ids[0]])
+
+    def test_import_replay_drops_pending_changes(self):
+        """Ratings replayed by an import already count the store's unflushed votes"""
+        ids = [
+            client.post("/entities/", json={"name": f"Replayed {i}", "description": "", "image_urls": []}).json()["id"]
+            for i in range(2)
+        ]
+        store = RatingStore(K_FACTOR, session_factory=SessionLocal)
+        with SessionLocal() as db:
+            store.load(db)
+        vote = {"entity1_id": ids[0], "entity2_id": ids[1], "selected_entity_id": ids[0]}
+
+        with (
+            patch("compere.modules.rating.get_rating_store", return_value=store),
+            patch("compere.modules.comparison.get_rating_store", return_value=store),
+            patch("compere.modules.importer.get_rating_store", return_value=store),
+        ):
+            for _ in range(2):
+                assert client.post("/comparisons/", json=vote).status_code == 200
+            response = client.post("/comparisons/import", content=json.dumps(vote).encode())
+            assert response.json()["ratings_recomputed"]
+        store.flush()
+
+        with SessionLocal() as db:
+            imported = dict(db.query(Entity.id, Entity.rating))
+            replay_elo_ratings(db)
+            replayed = dict(db.query(Entity.id, Entity.rating))
+        for entity_id in ids:
+            assert imported[entity_id] == pytest.approx(replayed[entity_id])
+            assert store.ratings()[entity_id] == pytest.approx(replayed[entity_id])
@@ -0,0 +1,131 @@
+"""
+Tests for the offline Elo replay engine.
+"""
+
+import os
+import sys
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add the compere package to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compere.modules.database import Base
+from compere.modules.models import Comparison, Entity
+from compere.modules.rating import update_elo_ratings
+from compere.modules.replay import map_comparisons, replay_elo_ratings
+
+engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def db_session():
+    """Create a fresh database session for each test"""
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def entities(db_session):
+    """Create a handful of entities at the default rating"""
+    created = [Entity(name=f"Replay {i}", description="", image_urls=[], rating=1500.0) for i in range(4)]
+    db_session.add_all(created)
+    db_session.commit()
+    return created
+
+
+def _record_votes(db, votes):
+    """Insert comparisons with increasing timestamps"""
+    start = datetime(2024, 1, 1, tzinfo=UTC)
+    for i, (e1, e2, winner) in enumerate(votes):
+        db.add(
+            Comparison(
+                entity1_id=e1,
+                entity2_id=e2,
+                selected_entity_id=winner,
+                created_at=start + timedelta(minutes=i),
+            )
+        )
+    db.commit()
+
+
+class TestReplay:
+    """Test full-history rating rebuilds"""
+
+    def test_replay_matches_incremental_updates(self, db_session, entities):
+        """Replaying should reproduce the ratings of per-vote updates"""
+        a, b, c, d = (e.id for e in entities)
+        votes = [(a, b, a), (b, c, c), (a, c, a), (d, a, d), (b, d, b), (c, d, c)]
+        _record_votes(db_session, votes)
+
+        by_id = {e.id: e for e in entities}
+        for e1, e2, winner in votes:
+            update_elo_ratings(db_session, by_id[e1], by_id[e2], winner)
+        expected = {e.id: e.rating for e in entities}
+
+        # Scramble ratings, then rebuild from history
+        for e in entities:
+            e.rating = 0.0
+        db_session.commit()
+
+        summary = replay_elo_ratings(db_session, chunk_size=2)
+        assert summary == {"entities": 4, "comparisons": 6, "skipped": 0}
+
+        for e in entities:
+            db_session.refresh(e)
+            assert e.rating == pytest.approx(expected[e.id])
+
+    def test_replay_uses_custom_parameters(self, db_session, entities):
+        """K-factor and initial rating overrides should be honoured"""
+        a, b = entities[0].id, entities[1].id
+        _record_votes(db_session, [(a, b, a)])
+
+        replay_elo_ratings(db_session, k_factor=10.0, initial_rating=1000.0)
+
+        db_session.refresh(entities[0])
+        db_session.refresh(entities[1])
+        assert entities[0].rating == pytest.approx(1005.0)
+        assert entities[1].rating == pytest.approx(995.0)
+        # Entities without comparisons are reset to the initial rating
+        db_session.refresh(entities[2])
+        assert entities[2].rating == pytest.approx(1000.0)
+
+    def test_replay_skips_unknown_entities(self, db_session, entities):
+        """Comparisons referencing deleted entities should be skipped"""
+        a, b = entities[0].id, entities[1].id
+        _record_votes(db_session, [(a, 99999, a), (a, b, b)])
+
+        summary = replay_elo_ratings(db_session)
+        assert summary["comparisons"] == 1
+        assert summary["skipped"] == 1
+
+
+class TestMapComparisons:
+    """Test mapping of comparison rows to dense indices"""
+
+    def test_map_scores_and_ties(self):
+        """Wins, losses and ties map to 1, 0 and 0.5"""
+        ids = np.array([10, 20, 30], dtype=np.int64)
+        idx1, idx2, score1 = map_comparisons(ids, [(10, 20, 10), (20, 30, 30), (10, 30, None), (10, 10, 10)])
+        assert idx1.tolist() == [0, 1, 0]
+        assert idx2.tolist() == [1, 2, 2]
+        assert score1.tolist() == [1.0, 0.0, 0.5]
+
+    def test_map_empty(self):
+        """An empty chunk maps to empty arrays"""
+        idx1, idx2, score1 = map_comparisons(np.array([1], dtype=np.int64), [])
+        assert len(idx1) == len(idx2) == len(score1) == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
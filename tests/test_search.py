@@ -0,0 +1,134 @@
+"""
+Tests for full-text entity search.
+"""
+
+import os
+import sys
+import uuid
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add the compere package to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compere.main import app
+from compere.modules.database import Base, init_db
+from compere.modules.models import Entity
+from compere.modules.search import create_search_index, get_search_backend, search_by_relevance, search_condition
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'search.db'}")
+    init_db(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    with sessionmaker(bind=engine)() as session:
+        yield session
+
+
+def _add(db, name, description="", rating=1500.0):
+    entity = Entity(name=name, description=description, image_urls=[], rating=rating)
+    db.add(entity)
+    db.commit()
+    return entity.id
+
+
+def _search(db, term):
+    return {entity.name for entity in db.query(Entity).filter(search_condition(db, term))}
+
+
+class TestFullTextSearch:
+    @pytest.fixture(autouse=True)
+    def full_text_backend(self):
+        with patch("compere.modules.search.get_entity_search_backend", return_value="auto"):
+            yield
+
+    def test_uses_fts5(self, engine):
+        assert get_search_backend(engine) == "fts5"
+
+    def test_matches_word_prefixes_case_insensitively(self, db):
+        _add(db, "Blue Bottle Coffee", "Third-wave roaster")
+        _add(db, "Burger Barn", "Smash burgers and fries")
+
+        assert _search(db, "coffee") == {"Blue Bottle Coffee"}
+        assert _search(db, "BOT") == {"Blue Bottle Coffee"}
+        assert _search(db, "burg fries") == {"Burger Barn"}
+        assert _search(db, "roaster fries") == set()
+        # Words match by prefix, not anywhere inside a word
+        assert _search(db, "urger") == set()
+
+    def test_index_follows_updates_and_deletes(self, db):
+        entity_id = _add(db, "Old Name")
+        entity = db.get(Entity, entity_id)
+        entity.name = "New Name"
+        db.commit()
+        assert _search(db, "old") == set()
+        assert _search(db, "new") == {"New Name"}
+
+        entity.rating = 1600.0
+        db.commit()
+        assert _search(db, "new") == {"New Name"}
+
+        db.delete(entity)
+        db.commit()
+        assert _search(db, "new") == set()
+
+    def test_existing_entities_are_indexed(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'existing.db'}")
+        Base.metadata.create_all(engine)
+        with sessionmaker(bind=engine)() as session:
+            _add(session, "Preexisting Place")
+            create_search_index(engine)
+            assert _search(session, "preexisting") == {"Preexisting Place"}
+        engine.dispose()
+
+    def test_relevance_ranks_name_matches_first(self, db):
+        _add(db, "Noodle House", "Ramen", rating=1400.0)
+        _add(db, "Corner Cafe", "Serves noodle soup", rating=1600.0)
+
+        names = [entity.name for entity in search_by_relevance(db, "noodle")]
+        assert names == ["Noodle House", "Corner Cafe"]
+
+    def test_like_fallback(self, db):
+        _add(db, "Burger Barn")
+        with patch("compere.modules.search.get_entity_search_backend", return_value="like"):
+            assert _search(db, "urger") == {"Burger Barn"}
+            assert [e.name for e in search_by_relevance(db, "urger")] == ["Burger Barn"]
+        # Terms without any word characters also fall back to LIKE
+        assert _search(db, "%") == {"Burger Barn"}
+
+
+class TestSearchEndpoint:
+    def test_relevance_order(self):
+        # A term unique to this run, the database is shared with earlier runs
+        tag = uuid.uuid4().hex[:8]
+        term = f"zephyrine{tag}"
+        own = [(f"{term} Widget", "x"), (f"Other {tag}", f"mentions {term} once")]
+        for name, description in own:
+            client.post("/entities/", json={"name": name, "description": description, "image_urls": []})
+
+        results = client.get("/entities/", params={"search": term, "order": "relevance"}).json()
+        names = {name for name, _ in own}
+        assert [e["name"] for e in results if e["name"] in names] == [name for name, _ in own]
+
+    def test_default_search_matches_substrings(self):
+        """Without opting in to the full-text index, search keeps matching inside words"""
+        name = f"Blue Bottle Coffee {uuid.uuid4().hex[:8]}"
+        client.post("/entities/", json={"name": name, "description": "", "image_urls": []})
+        for term in ["offee", "tle Cof", "BLUE BOTTLE"]:
+            results = client.get("/entities/", params={"search": term, "limit": 1000}).json()
+            assert name in [e["name"] for e in results]
+
+    def test_relevance_requires_search(self):
+        assert client.get("/entities/", params={"order": "relevance"}).status_code == 400
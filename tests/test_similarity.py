@@ -0,0 +1,80 @@
+"""
+Tests for the most dissimilar pair search.
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+from scipy import sparse
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+
+# Add the compere package to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compere.modules.similarity import (
+    approximate_most_dissimilar_pair,
+    most_dissimilar_pair,
+    select_dissimilar_entities,
+)
+
+
+def _embeddings(n, dimensions=20, seed=0):
+    return normalize(np.random.default_rng(seed).normal(size=(n, dimensions))).astype(np.float32)
+
+
+class TestMostDissimilarPair:
+    def test_exact_matches_full_matrix(self):
+        embeddings = _embeddings(300)
+        similarities = cosine_similarity(embeddings)
+        np.fill_diagonal(similarities, np.inf)
+        expected = np.unravel_index(np.argmin(similarities), similarities.shape)
+
+        # Small blocks, so the running best spans several of them
+        with patch("compere.modules.similarity.EXACT_BLOCK_ELEMENTS", 7000):
+            first, second, similarity = most_dissimilar_pair(embeddings)
+        assert (first, second) == tuple(expected)
+        assert similarity == np.float32(similarities[expected])
+
+    def test_identical_embeddings_pair_distinct_rows(self):
+        first, second, _ = most_dissimilar_pair(np.ones((3, 4), dtype=np.float32) / 2)
+        assert first != second
+
+    def test_sparse_matches_dense(self):
+        embeddings = normalize(sparse.random(200, 50, density=0.05, format="csr", random_state=0)).astype(np.float32)
+        dense = embeddings.toarray()
+        with patch("compere.modules.similarity.EXACT_BLOCK_ELEMENTS", 3000):
+            assert most_dissimilar_pair(embeddings) == most_dissimilar_pair(dense)
+        assert approximate_most_dissimilar_pair(embeddings, anchors=4) == approximate_most_dissimilar_pair(
+            dense, anchors=4
+        )
+
+    def test_approximate_finds_opposite_clusters(self):
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(10, 20))
+        centers[1] = -centers[0]
+        labels = rng.integers(10, size=2000)
+        embeddings = normalize(centers[labels] + rng.normal(scale=0.3, size=(2000, 20))).astype(np.float32)
+
+        exact = most_dissimilar_pair(embeddings)
+        approximate = approximate_most_dissimilar_pair(embeddings, anchors=4)
+        assert {labels[approximate[0]], labels[approximate[1]]} == {0, 1}
+        assert exact[2] <= approximate[2] < exact[2] + 0.05
+        assert approximate_most_dissimilar_pair(embeddings, anchors=4) == approximate
+
+    def test_select_uses_approximate_search_above_exact_limit(self):
+        entities = [SimpleNamespace(id=i) for i in range(50)]
+        embeddings = _embeddings(50)
+        with (
+            patch("compere.modules.similarity.generate_embeddings", return_value=embeddings),
+            patch("compere.modules.similarity.get_dissimilar_search_config", return_value=(10, 50)),
+            patch(
+                "compere.modules.similarity.approximate_most_dissimilar_pair", return_value=(3, 7, -0.5)
+            ) as approximate,
+        ):
+            assert [e.id for e in select_dissimilar_entities(entities)] == [3, 7]
+        approximate.assert_called_once()
+        assert approximate.call_args.args[1] == 50
@@ -0,0 +1,204 @@
+"""
+Tests for the durable vote queue.
+"""
+
+import os
+import sys
+import time
+import uuid
+from datetime import UTC, datetime
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add the compere package to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compere.main import app
+from compere.modules.config import get_elo_k_factor
+from compere.modules.database import Base, SessionLocal
+from compere.modules.mab import UCB, apply_mab_results
+from compere.modules.models import Comparison, Entity, MABState, PendingVote
+from compere.modules.rating import apply_elo_results
+from compere.modules.vote_queue import VoteQueueWorker, drain_once
+
+client = TestClient(app)
+
+QUEUE_ENABLED = (True, 500, 0.01)
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'queue.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+def _create_entities(db, count):
+    entities = [Entity(name=f"Queued {i}", description="", image_urls=[], rating=1500.0) for i in range(count)]
+    db.add_all(entities)
+    db.commit()
+    return [e.id for e in entities]
+
+
+def _queue(db, votes):
+    db.add_all(
+        PendingVote(entity1_id=a, entity2_id=b, selected_entity_id=w, created_at=datetime.now(UTC)) for a, b, w in votes
+    )
+    db.commit()
+
+
+def _post_entity(name):
+    response = client.post("/entities/", json={"name": name, "description": "Queue test", "image_urls": []})
+    return response.json()["id"]
+
+
+class TestDrain:
+    def test_drain_applies_votes_in_order(self, session_factory):
+        db = session_factory()
+        a, b, c = _create_entities(db, 3)
+        votes = [(a, b, a), (b, c, c), (a, c, a), (a, b, b)]
+        _queue(db, votes)
+
+        assert drain_once(db, 500) == (4, 0)
+
+        expected = {a: 1500.0, b: 1500.0, c: 1500.0}
+        apply_elo_results(expected, votes, get_elo_k_factor())
+        for entity in db.query(Entity):
+            assert entity.rating == pytest.approx(expected[entity.id])
+        assert db.query(PendingVote).count() == 0
+        comparisons = db.query(Comparison).order_by(Comparison.id).all()
+        assert [(x.entity1_id, x.entity2_id, x.selected_entity_id) for x in comparisons] == votes
+        db.close()
+
+    def test_drain_respects_batch_size(self, session_factory):
+        db = session_factory()
+        a, b = _create_entities(db, 2)
+        _queue(db, [(a, b, a)] * 5)
+
+        assert drain_once(db, 2) == (2, 0)
+        assert db.query(PendingVote).count() == 3
+        assert drain_once(db, 10) == (3, 0)
+        assert drain_once(db, 10) == (0, 0)
+        db.close()
+
+    def test_invalid_votes_are_dropped(self, session_factory):
+        db = session_factory()
+        a, b = _create_entities(db, 2)
+        _queue(db, [(a, b, a), (a, 99999, a)])
+
+        assert drain_once(db, 500) == (1, 1)
+        assert db.query(PendingVote).count() == 0
+        assert db.query(Comparison).count() == 1
+        db.close()
+
+    def test_duplicate_idempotency_key_does_not_block_queue(self, session_factory):
+        db = session_factory()
+        a, b = _create_entities(db, 2)
+        db.add(Comparison(entity1_id=a, entity2_id=b, selected_entity_id=a, idempotency_key="taken"))
+        db.add(
+            PendingVote(
+                entity1_id=a, entity2_id=b, selected_entity_id=a, idempotency_key="taken", created_at=datetime.now(UTC)
+            )
+        )
+        db.commit()
+        _queue(db, [(a, b, b)])
+
+        assert drain_once(db, 500) == (1, 1)
+        assert db.query(PendingVote).count() == 0
+        assert db.query(Comparison).count() == 2
+        db.close()
+
+    def test_mab_batch_matches_sequential_updates(self, session_factory):
+        db = session_factory()
+        ids = _create_entities(db, 3)
+        results = [(ids[0], ids[1], ids[0]), (ids[1], ids[2], ids[2]), (ids[0], ids[2], ids[0])]
+
+        ucb = UCB(db)
+        for entity1_id, entity2_id, winner_id in results:
+            ucb.update(entity1_id, 1.0 if winner_id == entity1_id else 0.0)
+            ucb.update(entity2_id, 1.0 if winner_id == entity2_id else 0.0)
+        sequential = {s.entity_id: (s.count, s.value, s.total_count) for s in db.query(MABState)}
+
+        db.query(MABState).update({MABState.count: 0, MABState.value: 0.0, MABState.total_count: 0})
+        db.commit()
+        apply_mab_results(db, results)
+        db.commit()
+        batched = {s.entity_id: (s.count, s.value, s.total_count) for s in db.query(MABState)}
+
+        assert batched == pytest.approx(sequential)
+        db.close()
+
+    def test_worker_drains_queue(self, session_factory):
+        db = session_factory()
+        a, b = _create_entities(db, 2)
+        _queue(db, [(a, b, a)] * 3)
+
+        worker = VoteQueueWorker(batch_size=2, poll_interval=0.01, session_factory=session_factory)
+        worker.start()
+        try:
+            deadline = time.monotonic() + 10
+            while worker.applied < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            worker.stop()
+
+        assert worker.applied == 3
+        assert worker.batches == 2
+        assert db.query(PendingVote).count() == 0
+        db.close()
+
+
+class TestQueuedEndpoint:
+    def test_post_returns_202_and_defers_rating_update(self):
+        a, b = _post_entity("Queued A"), _post_entity("Queued B")
+        vote = {"entity1_id": a, "entity2_id": b, "selected_entity_id": a}
+
+        with patch("compere.modules.comparison.get_vote_queue_config", return_value=QUEUE_ENABLED):
+            response = client.post("/comparisons/", json=vote)
+        assert response.status_code == 202
+        assert response.json()["status"] == "queued"
+        assert client.get(f"/entities/{a}").json()["rating"] == 1500.0
+
+        stats = client.get("/comparisons/queue").json()
+        assert stats["depth"] >= 1
+        assert stats["lag_seconds"] >= 0
+
+        with SessionLocal() as db:
+            drain_once(db, 500)
+        assert client.get(f"/entities/{a}").json()["rating"] > 1500.0
+        assert client.get("/comparisons/queue").json()["depth"] == 0
+
+    def test_post_validates_before_queueing(self):
+        a = _post_entity("Queued C")
+        vote = {"entity1_id": a, "entity2_id": 99999, "selected_entity_id": a}
+
+        with patch("compere.modules.comparison.get_vote_queue_config", return_value=QUEUE_ENABLED):
+            response = client.post("/comparisons/", json=vote)
+        assert response.status_code == 404
+
+    def test_idempotent_retry_of_queued_vote(self):
+        a, b = _post_entity("Queued D"), _post_entity("Queued E")
+        vote = {"entity1_id": a, "entity2_id": b, "selected_entity_id": b}
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+
+        with patch("compere.modules.comparison.get_vote_queue_config", return_value=QUEUE_ENABLED):
+            first = client.post("/comparisons/", json=vote, headers=headers)
+            retry = client.post("/comparisons/", json=vote, headers=headers)
+            changed = client.post("/comparisons/", json={**vote, "selected_entity_id": a}, headers=headers)
+            assert retry.status_code == 202
+            assert retry.json()["queue_id"] == first.json()["queue_id"]
+            assert changed.status_code == 409
+
+            with SessionLocal() as db:
+                drain_once(db, 500)
+            applied = client.post("/comparisons/", json=vote, headers=headers)
+
+        assert applied.status_code == 200
+        assert applied.json()["selected_entity_id"] == b
+        comparisons = client.get("/comparisons/", params={"entity_id": a}).json()
+        assert len(comparisons) == 1